@@ -13,6 +13,8 @@ import docker
 import paramiko
 from scp import SCPClient
 
+from iyp.post.runner import PostProcessRunner
+
 NEO4J_VERSION = '5.26.28'
 NEO4J_ADMIN_VERSION = '2026-community-debian'
 
@@ -188,27 +190,11 @@ def main():
     # ######### Post processing scripts ##########
 
     logging.info('Post-processing...')
-    for module_name in conf['iyp']['post']:
-        post = None
-        try:
-            module = importlib.import_module(module_name)
-            name = module_name.replace('iyp.post.', '')
-            logging.info(f'start {module}')
-            post = module.PostProcess(name)
-            post.run()
-            status[module_name] = STATUS_OK
-        except Exception as e:
-            no_error = False
-            logging.error('Crawler crashed!')
-            logging.error(e)
-            status[module_name] = e
-        finally:
-            if post is not None:
-                try:
-                    post.close()
-                except Exception as cleanup_error:
-                    logging.error(f'Failed to close post-processor: {cleanup_error}')
-        logging.info(f'end {module}')
+    runner = PostProcessRunner(conf['iyp']['post'])
+    post_status = runner.run()
+    if any(e != STATUS_OK for e in post_status.values()):
+        no_error = False
+    status.update(post_status)
 
     # ######### Stop container and dump DB ##########
 
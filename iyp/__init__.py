@@ -1,19 +1,32 @@
+import asyncio
 import bz2
+import hashlib
 import ipaddress
 import itertools
 import json
 import logging
 import os
+import pathlib
 import pickle
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from shutil import rmtree
 from typing import Iterable, Optional
+from urllib.parse import urlparse
 
 import requests
 from github import Github
 from neo4j import GraphDatabase, NotificationMinimumSeverity
+from neo4j.exceptions import TransientError
 
 BATCH_SIZE = 50000
+DELETE_BATCH_SIZE = 100000
+DELETE_MAX_ATTEMPTS = 5
+PARALLEL_DELETES = 4
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 prop_formatters = {
     # asn is stored as an int
@@ -646,8 +659,173 @@ class IYP(object):
             res.consume()
             self.commit()
 
+    def batch_enrich_nodes(self, label, prop_name, key_props, batch_size=BATCH_SIZE):
+        """Add properties to existing nodes identified by a key property.
+
+        label: a str for a single label or a list of str for multiple labels.
+        prop_name: name of the property used to find nodes, e.g., 'country_code'.
+        key_props: a dict mapping values of the prop_name property to a dict of
+        properties that should be added to the corresponding node. Keys without a
+        corresponding node are ignored.
+
+        Return the number of updated nodes.
+        """
+        label_str = str(label)
+        if isinstance(label, list):
+            label_str = ':'.join(label)
+
+        formatter = prop_formatters.get(prop_name, lambda s: s)
+        items = [{'key': formatter(key), 'props': format_properties(props)} for key, props in key_props.items()]
+
+        query = f"""WITH $batch AS batch
+        UNWIND batch AS item
+        MATCH (n:{label_str} {{{prop_name}: item.key}})
+        SET n += item.props
+        RETURN count(n) AS count"""
+
+        nb_nodes = 0
+        for batch in itertools.batched(items, batch_size):
+            nb_nodes += self.tx.run(query, batch=batch).single()['count']
+            self.commit()
+
+        logging.info(f'Enriched {nb_nodes} {label_str} nodes.')
+        return nb_nodes
+
+    def get_reference_name_indexed_types(self):
+        """Return the list of relationship types that have a RANGE index on the
+        reference_name property (see __create_range_index)."""
+        # Schema commands can not be mixed with writes in the same transaction.
+        with self.db.session() as session:
+            result = session.run("""SHOW RANGE INDEXES
+                                 YIELD entityType, labelsOrTypes, properties
+                                 WHERE entityType = 'RELATIONSHIP' AND properties = ['reference_name']
+                                 RETURN labelsOrTypes[0] AS type""")
+            return sorted(row['type'] for row in result)
+
+    def __delete_relationships_of_type(self, type, reference_name, endpoints=None):
+        """Delete all relationships of the given type with the given reference_name
+        using a dedicated session.
+
+        If endpoints is a set, the element IDs of the nodes of deleted relationships
+        are streamed back and added to it. Otherwise, only the number of deleted
+        relationships is returned by the database.
+
+        Deletions for different types run concurrently and may deadlock on shared
+        nodes, so transient errors are retried. Deleting is idempotent. Batches
+        committed before a transient error stay deleted, so the returned count is
+        cumulative over all attempts.
+        """
+        match_clause = f"""MATCH (a)-[r:{type}]->(b)
+                           USING INDEX r:{type}(reference_name)
+                           WHERE r.reference_name = $reference_name"""
+        if endpoints is None:
+            query = f"""{match_clause}
+                        CALL (r) {{
+                            DELETE r
+                        }} IN TRANSACTIONS OF {DELETE_BATCH_SIZE} ROWS
+                        RETURN count(*) AS count"""
+        else:
+            query = f"""{match_clause}
+                        CALL (a, r, b) {{
+                            DELETE r
+                            RETURN elementId(a) AS src, elementId(b) AS dst
+                        }} IN TRANSACTIONS OF {DELETE_BATCH_SIZE} ROWS
+                        RETURN src, dst"""
+        count_query = f'{match_clause} RETURN count(r) AS count'
+
+        count = 0
+        # Number of relationships left before the current attempt. Used to count the
+        # batches committed by failed attempts, when deleted rows are not streamed.
+        remaining = None
+        attempt = 1
+        while True:
+            try:
+                with self.db.session() as session:
+                    if endpoints is None:
+                        nb_left = session.run(count_query, reference_name=reference_name).single()['count']
+                        if remaining is not None:
+                            count += remaining - nb_left
+                        remaining = nb_left
+                        count += session.run(query, reference_name=reference_name).single()['count']
+                    else:
+                        for record in session.run(query, reference_name=reference_name):
+                            count += 1
+                            endpoints.add(record['src'])
+                            endpoints.add(record['dst'])
+                return count
+            except TransientError as e:
+                if attempt >= DELETE_MAX_ATTEMPTS:
+                    raise
+                logging.warning(f'Attempt {attempt}: Transient error while deleting {type} relationships: {e}')
+                attempt += 1
+
+    def __delete_orphans(self, node_ids):
+        """Delete the nodes with the given element IDs that have no relationship.
+
+        Return the number of deleted nodes.
+        """
+        node_ids = list(node_ids)
+        query = f"""UNWIND $ids AS id
+                    MATCH (n)
+                    WHERE elementId(n) = id AND NOT (n)--()
+                    CALL (n) {{
+                        DELETE n
+                    }} IN TRANSACTIONS OF {DELETE_BATCH_SIZE} ROWS
+                    RETURN count(*) AS count"""
+        count = 0
+        with self.db.session() as session:
+            for i in range(0, len(node_ids), DELETE_BATCH_SIZE):
+                count += session.run(query, ids=node_ids[i: i + DELETE_BATCH_SIZE]).single()['count']
+        return count
+
+    def batch_delete_by_reference_name(self, reference_name, delete_orphans=False, max_workers=PARALLEL_DELETES):
+        """Delete all relationships with the given reference_name.
+
+        Only relationship types with a RANGE index on reference_name are considered,
+        which is the case for all types created with batch_add_links or add_links.
+        Types are processed concurrently, each in its own session.
+        If delete_orphans is True, nodes that were connected by a deleted relationship
+        and have no relationship left are deleted afterwards. Other nodes are never
+        deleted.
+
+        Notice: this method commits changes to the database.
+        Return the number of deleted relationships.
+        """
+        # Deletions run in separate sessions, so flush pending changes first.
+        self.commit()
+        types = self.get_reference_name_indexed_types()
+        logging.info(f'Deleting relationships with reference_name {reference_name} for {len(types)} types.')
+
+        # Element IDs of the nodes of deleted relationships, one set per type since the
+        # types are processed concurrently.
+        endpoints = {type: set() if delete_orphans else None for type in types}
+        nb_deleted = 0
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = {executor.submit(self.__delete_relationships_of_type, type, reference_name, endpoints[type]): type
+                       for type in types}
+            for idx, future in enumerate(as_completed(futures), start=1):
+                type = futures[future]
+                count = future.result()
+                nb_deleted += count
+                logging.info(f'[{idx}/{len(types)}] Deleted {count} {type} relationships.')
+
+        if delete_orphans:
+            count = self.__delete_orphans(set().union(*endpoints.values()))
+            logging.info(f'Deleted {count} orphaned nodes.')
+
+        logging.info(f'Deleted {nb_deleted} relationships with reference_name {reference_name}.')
+        return nb_deleted
+
 
 class BasePostProcess(object):
+    # Node labels and relationship types read and written by this post-processing
+    # step. iyp.post.runner uses them to decide which steps can run concurrently. None
+    # means unknown, in which case the step is never run concurrently with other steps.
+    # Creating or deleting relationships locks their endpoints, so writes must also
+    # include the labels of the nodes linked by the written relationship types.
+    reads = None
+    writes = None
+
     def __init__(self, name):
         """IYP and references initialization."""
 
@@ -676,11 +854,23 @@ class BasePostProcess(object):
     def run(self):
         raise NotImplementedError()
 
+    def enrich_nodes(self, label, prop_name, key_props):
+        """Add properties to existing nodes from a static lookup table.
+
+        key_props is a dict mapping values of the prop_name property to the properties
+        that should be added to the corresponding node, e.g.,
+            {'JP': {'name': 'Japan', 'alpha3': 'JPN'}}
+        See IYP.batch_enrich_nodes.
+        """
+        logging.info(f'Enriching {label} nodes with {len(key_props)} entries.')
+        return self.iyp.batch_enrich_nodes(label, prop_name, key_props)
+
     def unit_test(self):
         raise NotImplementedError()
 
     def delete(self):
-        raise NotImplementedError()
+        """Delete all relationships created by this post-processing step."""
+        self.iyp.batch_delete_by_reference_name(self.reference['reference_name'])
 
     def rerun(self):
         self.delete()
@@ -688,10 +878,11 @@ class BasePostProcess(object):
 
 
 class BaseCrawler(object):
-    def __init__(self, organization, url, name):
+    def __init__(self, organization, url, name, iyp=None):
         """IYP and references initialization.
 
-        The crawler name should be unique.
+        The crawler name should be unique. An existing IYP instance can be passed to
+        share its connection, e.g., between crawlers run by an orchestrator.
         """
 
         self.organization = organization
@@ -708,7 +899,7 @@ class BaseCrawler(object):
         }
 
         # connection to IYP database
-        self.iyp = IYP()
+        self.iyp = iyp if iyp is not None else IYP()
 
     def create_tmp_dir(self, root='./tmp/', remove=False):
         """Create a temporary directory for this crawler.
@@ -748,6 +939,15 @@ class BaseCrawler(object):
         may fetch data at the same time, hence it may cause API rate limiting issues.
         """
 
+    def delete(self):
+        """Delete all relationships created by this crawler."""
+        self.iyp.batch_delete_by_reference_name(self.reference['reference_name'])
+
+    def rerun(self):
+        """Delete existing data of this crawler and run it again."""
+        self.delete()
+        self.run()
+
     def count_relations(self):
         """Count the number of relations in the graph with the reference name of
         crawler."""
@@ -829,3 +1029,240 @@ class CacheHandler:
 
     def clear_cache(self) -> None:
         rmtree(self.cache_dir)
+
+
+class ObjectCache:
+    """Local cache for large objects downloaded from object stores (e.g., S3 buckets).
+
+    Objects are identified by bucket, key, ETag, and size, so a modified object is
+    never served from the cache. Entries not used within the retention window are
+    removed, and the least recently used entries are evicted if the total size exceeds
+    the size cap. Objects used by the current process are never evicted.
+
+    The cache is configured in the 'cache' section of config.json with the directory,
+    object_retention_in_days, and object_max_size_in_gb keys.
+    """
+
+    def __init__(self, dir: str = str(), retention_days: float = 7, max_size_gb: float = 50) -> None:
+        cache_dir = 'tmp/'
+        if os.path.exists('config.json'):
+            with open('config.json', 'r') as fp:
+                conf = json.load(fp)
+            cache_conf = conf.get('cache', dict())
+            cache_dir = cache_conf.get('directory', cache_dir)
+            retention_days = cache_conf.get('object_retention_in_days', retention_days)
+            max_size_gb = cache_conf.get('object_max_size_in_gb', max_size_gb)
+        self.cache_dir = dir if dir else os.path.join(cache_dir, 'objects')
+        self.retention = retention_days * 24 * 60 * 60
+        self.max_size = max_size_gb * 1024 ** 3
+        self.hits = 0
+        self.bytes_saved = 0
+        self.in_use = set()
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_path(self, bucket: str, key: str, etag: str, size: int) -> str:
+        """Return the cache file path of an object."""
+        object_id = hashlib.sha256(f'{bucket}/{key}/{etag}/{size}'.encode()).hexdigest()
+        suffix = ''.join(pathlib.PurePosixPath(key).suffixes)
+        return os.path.join(self.cache_dir, object_id + suffix)
+
+    def lookup(self, bucket: str, key: str, etag: str, size: int) -> str:
+        """Return the cache file path of an object and mark it as used.
+
+        Return an empty string if the object is not cached. The object can then be
+        written to the returned path of get_path(), followed by a call to evict().
+        Can be called concurrently.
+        """
+        path = self.get_path(bucket, key, etag, size)
+        with self.lock:
+            self.in_use.add(path)
+        if not os.path.exists(path):
+            return str()
+        # Update modification time, which is used for LRU eviction.
+        os.utime(path)
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += size
+        logging.info(f'Object cache hit for {bucket}/{key}, saved {size / 1024 ** 2:.2f}MiB.')
+        return path
+
+    def fetch(self, bucket: str, key: str, etag: str, size: int, download) -> str:
+        """Return the path to a local copy of the object.
+
+        download is only called on a cache miss. It receives a writable binary file
+        object into which the object should be written.
+        Can be called concurrently.
+        """
+        path = self.lookup(bucket, key, etag, size)
+        if path:
+            return path
+        path = self.get_path(bucket, key, etag, size)
+
+        # Download to a temporary file first so that interrupted downloads never end
+        # up in the cache.
+        with tempfile.NamedTemporaryFile(mode='w+b', dir=self.cache_dir, suffix='.part', delete=False) as f:
+            try:
+                download(f)
+            except Exception:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+        self.evict()
+        return path
+
+    def evict(self) -> None:
+        """Remove expired entries and evict least recently used entries until the
+        cache size is below the cap."""
+        with self.lock:
+            now = time.time()
+            entries = list()
+            for entry in os.scandir(self.cache_dir):
+                if not entry.is_file() or entry.name.endswith('.part'):
+                    continue
+                stat = entry.stat()
+                if entry.path in self.in_use:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif now - stat.st_mtime > self.retention:
+                    logging.info(f'Removing expired object {entry.path} from cache.')
+                    os.remove(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                if path in self.in_use:
+                    continue
+                logging.info(f'Evicting object {path} from cache.')
+                os.remove(path)
+                total_size -= size
+
+    def log_stats(self) -> None:
+        logging.info(f'Object cache: {self.hits} hits, saved {self.bytes_saved / 1024 ** 2:.2f}MiB of downloads.')
+
+
+class BulkDownloader:
+    """Download many files concurrently to disk.
+
+    Files are streamed to a <path>.part file that is renamed once the transfer is
+    complete. Interrupted transfers, also from previous runs, are resumed with HTTP
+    Range requests if the server supports them. Failed transfers are retried with
+    exponential backoff. At most max_per_host connections are opened to the same host,
+    and the progress (bytes, files remaining, ETA) is logged every progress_interval
+    seconds.
+
+    Transfers are scheduled with asyncio, and the blocking requests calls run in
+    threads.
+    """
+
+    def __init__(self, max_per_host: int = 4, max_attempts: int = 10, timeout: float = 60,
+                 progress_interval: float = 30, session: Optional[requests.Session] = None) -> None:
+        self.max_per_host = max_per_host
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.progress_interval = progress_interval
+        self.session = session if session is not None else requests.Session()
+        self.lock = threading.Lock()
+
+    def download(self, files: list) -> dict:
+        """Download files specified as a list of (url, path) tuples.
+
+        Return a dict mapping each URL to True if the file was downloaded, else False.
+        """
+        self.files_total = len(files)
+        self.files_done = 0
+        # Number of bytes on disk and expected sizes of files whose transfer started.
+        self.file_progress = dict()
+        self.file_sizes = dict()
+        self.start_time = time.monotonic()
+        results = asyncio.run(self.__download_all(files))
+        self.log_progress()
+        return dict(zip((url for url, _ in files), results))
+
+    async def __download_all(self, files: list) -> list:
+        semaphores = dict()
+        tasks = list()
+        for url, path in files:
+            host = urlparse(url).netloc
+            if host not in semaphores:
+                semaphores[host] = asyncio.Semaphore(self.max_per_host)
+            tasks.append(self.__download_file(url, path, semaphores[host]))
+        progress = asyncio.create_task(self.__log_progress_periodically())
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            progress.cancel()
+
+    async def __log_progress_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self.log_progress()
+
+    async def __download_file(self, url: str, path: str, semaphore: asyncio.Semaphore) -> bool:
+        for attempt in range(1, self.max_attempts + 1):
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(self.__transfer, url, path)
+                    with self.lock:
+                        self.files_done += 1
+                    return True
+                except (requests.RequestException, OSError) as e:
+                    logging.warning(f'Attempt {attempt}/{self.max_attempts} to download {url} failed: {e}')
+            if attempt < self.max_attempts:
+                await asyncio.sleep(min(2 ** attempt, 60))
+        logging.error(f'Failed to download {url}')
+        with self.lock:
+            self.files_done += 1
+        return False
+
+    def __transfer(self, url: str, path: str) -> None:
+        """Download or resume a single file."""
+        part_file = f'{path}.part'
+        offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else dict()
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+            if r.status_code == 416:
+                # Range not satisfiable, e.g., the file changed. Start from scratch.
+                os.remove(part_file)
+                raise requests.HTTPError(f'Invalid resume offset {offset}', response=r)
+            r.raise_for_status()
+            if offset and r.status_code != 206:
+                # Server does not support Range requests.
+                offset = 0
+            expected_size = None
+            if 'Content-Length' in r.headers:
+                expected_size = offset + int(r.headers['Content-Length'])
+                with self.lock:
+                    self.file_sizes[url] = expected_size
+            if offset:
+                logging.info(f'Resuming download of {url} at {offset / 1024 ** 2:.2f}MiB.')
+            with self.lock:
+                self.file_progress[url] = offset
+            with open(part_file, 'ab' if offset else 'wb') as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    with self.lock:
+                        self.file_progress[url] += len(chunk)
+        size = os.path.getsize(part_file)
+        if expected_size is not None and size != expected_size:
+            # Retrying will resume the transfer.
+            raise requests.ConnectionError(f'Incomplete download: got {size} of {expected_size} bytes')
+        os.replace(part_file, path)
+
+    def log_progress(self) -> None:
+        with self.lock:
+            files_done = self.files_done
+            bytes_done = sum(self.file_progress.values())
+            known_sizes = list(self.file_sizes.values())
+        files_remaining = self.files_total - files_done
+        elapsed = time.monotonic() - self.start_time
+        eta = str()
+        if bytes_done and known_sizes and files_remaining:
+            # Assume files whose size is not known yet have the average size.
+            average_size = sum(known_sizes) / len(known_sizes)
+            bytes_total = sum(known_sizes) + average_size * (self.files_total - len(known_sizes))
+            eta = f', ETA {max(bytes_total - bytes_done, 0) / (bytes_done / elapsed):.0f}s'
+        logging.info(f'Downloaded {bytes_done / 1024 ** 2:.2f}MiB in {elapsed:.0f}s, '
+                     f'{files_remaining}/{self.files_total} files remaining{eta}')
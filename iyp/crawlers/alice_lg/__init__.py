@@ -1,19 +1,33 @@
 import ipaddress
+import json
 import logging
 import os
-from collections import defaultdict
-from concurrent.futures import as_completed
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
 from datetime import datetime
 from json import JSONDecodeError
-from typing import Iterable, Tuple
+from typing import Iterable, Iterator, Tuple
+from urllib.parse import urlparse
 
 import flatdict
+import pyarrow as pa
 import radix
 from requests.adapters import HTTPAdapter, Response
 from requests_futures.sessions import FuturesSession
 from urllib3.util.retry import Retry
 
-from iyp import BaseCrawler, CacheHandler
+from iyp import IYP, BaseCrawler, CacheHandler
+
+# Rate limit applied to each looking glass host. Since all crawlers of the orchestrator
+# share one session, the limit holds across crawlers that query the same host.
+REQUESTS_PER_SECOND = 10
+REQUESTS_BURST = 10
+if os.path.exists('config.json'):
+    config = json.load(open('config.json', 'r'))
+    REQUESTS_PER_SECOND = config.get('alice_lg', dict()).get('requests_per_second', REQUESTS_PER_SECOND)
+    REQUESTS_BURST = config.get('alice_lg', dict()).get('requests_burst', REQUESTS_BURST)
 
 # Alice-LG Rest API
 #
@@ -62,6 +76,183 @@ from iyp import BaseCrawler, CacheHandler
 #       route['bgp']['as_path'][-1] -> originating ASN
 
 
+class TokenBucket:
+    """Thread-safe token bucket allowing rate requests per second on average and
+    bursts of up to capacity requests."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, blocking until one is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class RateLimitedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that limits the request rate per host with a token bucket.
+
+    Retries performed by urllib3 within a single send() are not rate limited.
+    """
+
+    def __init__(self, requests_per_second: float = REQUESTS_PER_SECOND, burst: float = REQUESTS_BURST,
+                 **kwargs) -> None:
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.buckets = dict()
+        self.buckets_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def get_bucket(self, host: str) -> TokenBucket:
+        with self.buckets_lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.requests_per_second, self.burst)
+            return self.buckets[host]
+
+    def send(self, request, **kwargs) -> Response:
+        self.get_bucket(urlparse(request.url).netloc).acquire()
+        return super().send(request, **kwargs)
+
+
+def create_session(max_workers: int) -> FuturesSession:
+    """Create a FuturesSession with max_workers threads that retries failed requests
+    and rate limits requests per host."""
+    session = FuturesSession(max_workers=max_workers)
+    retry = Retry(
+        backoff_factor=0.1,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True
+    )
+    adapter = RateLimitedHTTPAdapter(max_retries=retry, pool_maxsize=max(max_workers, 10))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_peering_lans(iyp: IYP) -> radix.Radix:
+    """Get IXP peering LANs from IYP and return a radix tree containing the QID of the
+    IXP node in the data['ixp_qid'] field of each tree node."""
+    query = """MATCH (p:PeeringLAN)-[:MANAGED_BY]->(i:IXP)
+               RETURN p.prefix AS peering_lan, elementId(i) AS ixp_qid"""
+    peering_lans = radix.Radix()
+    for res in iyp.tx.run(query):
+        n = peering_lans.add(res['peering_lan'])
+        n.data['ixp_qid'] = res['ixp_qid']
+    logging.info(f'Fetched {len(peering_lans.nodes())} peering LANs')
+    return peering_lans
+
+
+class RouteFlattener:
+    """Flatten routes into a single-level dict.
+
+    The result is the same as dict(flatdict.FlatterDict(route)) without the empty
+    dicts/lists, which neo4j does not accept as properties, but no intermediate objects
+    are created. Since all routes share (mostly) the same structure, the joined key
+    paths are computed once and reused.
+    """
+    DELIMITER = ':'
+    CONTAINER_TYPES = (dict, list, tuple, set)
+
+    def __init__(self) -> None:
+        # Dict mapping a parent key path to a dict mapping child keys to the key path.
+        self.key_paths = defaultdict(dict)
+
+    def flatten(self, route: dict) -> dict:
+        flattened = dict()
+        self.__flatten_into(flattened, None, route)
+        return flattened
+
+    def __flatten_into(self, flattened: dict, parent: str, value) -> None:
+        key_paths = self.key_paths[parent]
+        items = value.items() if isinstance(value, dict) else enumerate(value)
+        for key, child in items:
+            key_path = key_paths.get(key)
+            if key_path is None:
+                key_path = str(key) if parent is None else f'{parent}{self.DELIMITER}{key}'
+                key_paths[key] = key_path
+            if isinstance(child, self.CONTAINER_TYPES):
+                # Empty containers do not produce any key.
+                self.__flatten_into(flattened, key_path, child)
+            else:
+                flattened[key_path] = child
+
+
+class RouteStore:
+    """Compact on-disk store for received routes.
+
+    The routes of each (route server, neighbor) pair are stored in a separate Arrow IPC
+    file with one record batch per page. The prefix and origin AS are stored as separate
+    columns, so they can be read without decoding the routes. The full route is kept
+    as (compressed) JSON string.
+
+    Files are written to a temporary file first and only appear in the store once all
+    pages were written, so the store doubles as cache for interrupted runs.
+    """
+    SCHEMA = pa.schema([('network', pa.string()),
+                        ('origin_asn', pa.int64()),
+                        ('route', pa.string())])
+    WRITE_OPTIONS = pa.ipc.IpcWriteOptions(compression='zstd')
+
+    def __init__(self, file_prefix: str) -> None:
+        self.file_prefix = file_prefix
+        self.json_encoder = json.JSONEncoder()
+
+    def get_file(self, routeserver_id: str, neighbor_id: str) -> str:
+        return f'{self.file_prefix}routes.{routeserver_id}.{neighbor_id}.arrow'
+
+    def exists(self, routeserver_id: str, neighbor_id: str) -> bool:
+        return os.path.exists(self.get_file(routeserver_id, neighbor_id))
+
+    def open_writer(self, routeserver_id: str, neighbor_id: str) -> pa.ipc.RecordBatchFileWriter:
+        part_file = f'{self.get_file(routeserver_id, neighbor_id)}.part'
+        return pa.ipc.new_file(part_file, self.SCHEMA, options=self.WRITE_OPTIONS)
+
+    def close_writer(self, writer: pa.ipc.RecordBatchFileWriter, routeserver_id: str, neighbor_id: str) -> None:
+        writer.close()
+        route_file = self.get_file(routeserver_id, neighbor_id)
+        os.replace(f'{route_file}.part', route_file)
+
+    def discard_writer(self, writer: pa.ipc.RecordBatchFileWriter, routeserver_id: str, neighbor_id: str) -> None:
+        """Close the writer of an incomplete neighbor and remove its temporary file."""
+        writer.close()
+        os.remove(f'{self.get_file(routeserver_id, neighbor_id)}.part')
+
+    def write_page(self, writer: pa.ipc.RecordBatchFileWriter, routes: list) -> None:
+        """Write the 'imported' routes of a single page."""
+        networks = list()
+        origin_asns = list()
+        encoded_routes = list()
+        for route in routes:
+            networks.append(route['network'])
+            as_path = route['bgp'].get('as_path')
+            origin_asns.append(as_path[-1] if as_path else None)
+            encoded_routes.append(self.json_encoder.encode(route))
+        writer.write_batch(pa.record_batch([networks, origin_asns, encoded_routes], schema=self.SCHEMA))
+
+    def read(self, routeserver_id: str, neighbor_id: str, columns: list = None) -> Iterator[pa.RecordBatch]:
+        """Yield the record batches of a (route server, neighbor) pair, optionally
+        only with the specified columns."""
+        with pa.memory_map(self.get_file(routeserver_id, neighbor_id)) as source:
+            reader = pa.ipc.open_file(source)
+            for idx in range(reader.num_record_batches):
+                batch = reader.get_batch(idx)
+                if columns:
+                    batch = batch.select(columns)
+                yield batch
+
+
 class Crawler(BaseCrawler):
     """Import IXP members and optionally prefix announcements based on routes received
     via members from Alice-LG-based looking glasses."""
@@ -69,8 +260,8 @@ class Crawler(BaseCrawler):
     # However, some tests showed that many looking glasses perform poorly when queried
     # in parallel, which is why I leave the functionality in the code, but set the
     # default values to not query in parallel.
-    # Similarly, querying the received routes is infeasible for large IXPs since the
-    # queries just take too long, which is why the functionality is disabled by default.
+    # Similarly, querying the received routes takes long for large IXPs due to the small
+    # page size, which is why the functionality is disabled by default.
 
     def __init__(self,
                  organization: str,
@@ -78,8 +269,9 @@ class Crawler(BaseCrawler):
                  name: str,
                  parallel_downloads: int = 1,
                  fetch_routes: bool = False,
-                 fetch_routes_batch_size: int = 1) -> None:
-        super().__init__(organization, url, name)
+                 session: FuturesSession = None,
+                 iyp: IYP = None) -> None:
+        super().__init__(organization, url, name, iyp=iyp)
 
         # URLs to the API
         url = url.rstrip('/')
@@ -102,23 +294,18 @@ class Crawler(BaseCrawler):
         self.neighbors = list()
         # Dict mapping routeserver_id to the cache time of that server.
         self.routeserver_cached_at = dict()
-        # Dict mapping (routeserver_id, neighbor_id) tuple to a list of route dicts.
-        self.routes = dict()
+        # On-disk store of received routes per (routeserver_id, neighbor_id) tuple.
+        self.route_store = RouteStore(self.cache_handler.cache_file_prefix)
+        # List of (routeserver_id, neighbor_id) tuples available in the route store.
+        self.route_keys = list()
         # If routes should be fetched or not.
         self.fetch_routes = fetch_routes
-        self.fetch_routes_batch_size = fetch_routes_batch_size
-        self.__initialize_session()
-
-    def __initialize_session(self) -> None:
-        self.session = FuturesSession(max_workers=self.workers)
-        retry = Retry(
-            backoff_factor=0.1,
-            status_forcelist=(429, 500, 502, 503, 504),
-            respect_retry_after_header=True
-        )
-        adapter = HTTPAdapter(max_retries=retry)
-        self.session.mount('http://', adapter)
-        self.session.mount('https://', adapter)
+        # Radix tree of peering LANs, fetched from IYP if not set by the caller.
+        self.peering_lans = None
+        # Crawlers run by the orchestrator share a session.
+        if session is None:
+            session = create_session(self.workers)
+        self.session = session
 
     @staticmethod
     def decode_json(resp: Response, *args, **kwargs) -> None:
@@ -257,79 +444,106 @@ class Crawler(BaseCrawler):
                                 f'{failed_routeservers}')
 
     def __fetch_routes(self) -> None:
-        """Fetch received route information or load from cache."""
-        routes_object_name_prefix = 'routes.'
+        """Fetch received route information into the route store.
+
+        All pages of all neighbors are fetched, with at most self.workers pages per
+        route server in flight. Each page is written to the route store as soon as it
+        is received, so memory usage does not depend on the number of routes. Pages of
+        neighbors that are already in progress are prioritized to keep the number of
+        open files low.
+        """
         cached_route_objects = 0
         fetch_required = list()
         for neighbor in self.neighbors:
             if neighbor['routes_received'] == 0:
                 # No query required.
                 continue
-            neighbor_id = neighbor['id']
-            routeserver_id = neighbor['routeserver_id']
-            key = (routeserver_id, neighbor_id)
-            object_name = f'{routes_object_name_prefix}{routeserver_id}.{neighbor_id}'
-            if self.cache_handler.cached_object_exists(object_name):
+            key = (neighbor['routeserver_id'], neighbor['id'])
+            if self.route_store.exists(*key):
                 cached_route_objects += 1
-                self.routes[key] = self.cache_handler.load_cached_object(object_name)
+                self.route_keys.append(key)
             else:
                 fetch_required.append(key)
 
         total_route_objects = cached_route_objects + len(fetch_required)
         logging.info(f'{cached_route_objects}/{total_route_objects} route objects in cache. Fetching '
                      f'{len(fetch_required)}')
-
-        if fetch_required:
-            for i in range(0, len(fetch_required), self.fetch_routes_batch_size):
-                logging.debug(f'Batch {i}')
-                batch = fetch_required[i: i + self.fetch_routes_batch_size]
-                # Fetch in two rounds. First round gets the initial page for all
-                # neighbors and generates the remaining URLs based on that. Second round
-                # fetched the remaining pages.
-                urls = list()
-                additional_data = list()
-                for routeserver_id, neighbor_id in batch:
-                    url = self.urls['routes'].format(rs=routeserver_id, neighbor=neighbor_id)
-                    urls.append(url)
-                    additional_data.append((routeserver_id, neighbor_id))
-                next_urls = list()
-                next_additional_data = list()
-                failed_neighbors = list()
-                for ok, data, key in self.fetch_urls(urls, additional_data):
+        if not fetch_required:
+            return
+
+        # Queue of (key, page) tuples per route server.
+        pending = defaultdict(deque)
+        for key in fetch_required:
+            # Alice LG pagination is zero indexed, i.e., first page is 0.
+            pending[key[0]].append((key, 0))
+        in_flight = dict()
+        in_flight_per_routeserver = defaultdict(int)
+        writers = dict()
+        remaining_pages = dict()
+        failed_neighbors = list()
+        incomplete_neighbors = list()
+        failed_pages = defaultdict(int)
+        fetched_pages = 0
+
+        def submit_pages():
+            for routeserver_id, queue in pending.items():
+                while queue and in_flight_per_routeserver[routeserver_id] < self.workers:
+                    key, page = queue.popleft()
+                    url = self.urls['routes'].format(rs=key[0], neighbor=key[1])
+                    if page > 0:
+                        url += f'?page={page}'
+                    future = self.session.get(url, hooks={'response': self.decode_json}, timeout=60)
+                    in_flight[future] = (key, page)
+                    in_flight_per_routeserver[routeserver_id] += 1
+
+        submit_pages()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, page = in_flight.pop(future)
+                routeserver_id = key[0]
+                in_flight_per_routeserver[routeserver_id] -= 1
+                try:
+                    resp = future.result()
+                    ok = resp.ok and 'imported' in resp.data
+                except Exception as e:
+                    logging.error(f'Failed to retrieve page {page} of {key}: {e}')
+                    resp = None
+                    ok = False
+                if page == 0:
                     if not ok:
                         failed_neighbors.append(key)
                         continue
-                    self.routes[key] = data['imported']
-                    if data['pagination']['total_pages'] > 1:
-                        base_url = self.urls['routes'].format(rs=key[0], neighbor=key[1])
-                        # Alice LG pagination is zero indexed, i.e., first page is 0.
-                        for page in range(1, min(data['pagination']['total_pages'], 10)):
-                            next_urls.append(f'{base_url}?page={page}')
-                            next_additional_data.append(key)
-                logging.debug('First round done.')
-                logging.debug(f'Fetching {len(next_urls)} additional pages.')
-                failed_pages = defaultdict(int)
-                for ok, data, key in self.fetch_urls(next_urls, next_additional_data):
-                    if not ok:
-                        failed_pages[key] += 1
-                        continue
-                    self.routes[key] += data['imported']
-                logging.debug('Second round done.')
-                logging.debug('Caching.')
-                for routeserver_id, neighbor_id in batch:
-                    key = (routeserver_id, neighbor_id)
-                    if key not in self.routes:
-                        continue
-                    object_name = f'{routes_object_name_prefix}{routeserver_id}.{neighbor_id}'
-                    self.cache_handler.save_cached_object(object_name, self.routes[key])
-
-            if failed_neighbors:
-                logging.warning(f'Failed to fetch routes for {len(failed_neighbors)} neighbors: {failed_neighbors}')
-            if failed_pages:
-                logging.warning(f'Failed to fetch {sum(failed_pages.values())} pages for {len(failed_pages)} '
-                                f'neighbors:')
-                for key, count in failed_pages.items():
-                    logging.warning(f'  {key}: {count}')
+                    total_pages = resp.data['pagination']['total_pages']
+                    writers[key] = self.route_store.open_writer(*key)
+                    remaining_pages[key] = max(total_pages, 1)
+                    # Enqueue remaining pages at the front.
+                    pending[routeserver_id].extendleft((key, next_page)
+                                                       for next_page in range(total_pages - 1, 0, -1))
+                if ok:
+                    self.route_store.write_page(writers[key], resp.data['imported'])
+                    fetched_pages += 1
+                else:
+                    failed_pages[key] += 1
+                remaining_pages[key] -= 1
+                if remaining_pages[key] == 0:
+                    if failed_pages[key] > 0:
+                        # Do not import or cache a truncated route file.
+                        self.route_store.discard_writer(writers.pop(key), *key)
+                        incomplete_neighbors.append(key)
+                    else:
+                        self.route_store.close_writer(writers.pop(key), *key)
+                        self.route_keys.append(key)
+            submit_pages()
+        logging.info(f'Fetched {fetched_pages} pages.')
+
+        if failed_neighbors:
+            logging.warning(f'Failed to fetch routes for {len(failed_neighbors)} neighbors: {failed_neighbors}')
+        if incomplete_neighbors:
+            logging.warning(f'Ignoring {len(incomplete_neighbors)} incomplete neighbors, failed to fetch '
+                            f'{sum(failed_pages.values())} pages:')
+            for key in incomplete_neighbors:
+                logging.warning(f'  {key}: {failed_pages[key]}')
 
     def fetch(self) -> None:
         tmp_dir = self.get_tmp_dir()
@@ -341,22 +555,15 @@ class Crawler(BaseCrawler):
         if self.fetch_routes:
             self.__fetch_routes()
 
-    def __get_peering_lans(self) -> radix.Radix:
-        """Get IXP peering LANs from IYP and return a radix tree containing the QID of
-        the IXP node in the data['ixp_qid'] field of each tree node."""
-        query = """MATCH (p:PeeringLAN)-[:MANAGED_BY]->(i:IXP)
-                   RETURN p.prefix AS peering_lan, elementId(i) AS ixp_qid"""
-        peering_lans = radix.Radix()
-        for res in self.iyp.tx.run(query):
-            n = peering_lans.add(res['peering_lan'])
-            n.data['ixp_qid'] = res['ixp_qid']
-        logging.info(f'Fetched {len(peering_lans.nodes())} peering LANs')
-        return peering_lans
-
     def run(self) -> None:
         self.fetch()
+        self.import_data()
 
-        peering_lans = self.__get_peering_lans()
+    def import_data(self) -> None:
+        """Push the fetched data to IYP."""
+        if self.peering_lans is None:
+            self.peering_lans = get_peering_lans(self.iyp)
+        peering_lans = self.peering_lans
 
         # Compute MEMBER_OF relationships from neighbor data.
         asns = set()
@@ -398,34 +605,21 @@ class Crawler(BaseCrawler):
                                    'dst_id': n.data['ixp_qid'],
                                    'props': [flattened_neighbor, self.reference.copy()]})
 
-        # Compute ORIGINATE relationships from received routes.
-        prefixes = set()
-        originate_rels = list()
+        # Collect prefixes and origin ASes of received routes. Only the network and
+        # origin columns are read, routes are decoded later while pushing the
+        # relationships.
+        # Dict mapping the network as given by the route server to the canonical
+        # prefix. Only unique networks of each batch are canonicalized.
+        canonical_prefixes = dict()
         if self.fetch_routes:
-            logging.info('Iterating routes.')
-            for (routeserver_id, neighbor_id), routes in self.routes.items():
-                self.reference['reference_url_data'] = self.urls['routes'].format(rs=routeserver_id,
-                                                                                  neighbor=neighbor_id)
-                for route in routes:
-                    prefix = ipaddress.ip_network(route['network']).compressed
-                    origin_asn = route['bgp']['as_path'][-1]
-                    prefixes.add(prefix)
-                    asns.add(origin_asn)
-                    # route object contains lists of lists so FlatterDict is required.
-                    # Similar to above, there can be an empty dicts inside the object,
-                    # but for different keys, which is why we just iterate over all of
-                    # them.
-                    flattened_route = dict(flatdict.FlatterDict(route))
-                    to_delete = list()
-                    for k, v in flattened_route.items():
-                        if isinstance(v, flatdict.FlatterDict):
-                            to_delete.append(k)
-                    for k in to_delete:
-                        flattened_route.pop(k)
-                    flattened_route['routeserver_id'] = routeserver_id
-                    originate_rels.append({'src_id': origin_asn,  # Translate to QIDs later.
-                                           'dst_id': prefix,
-                                           'props': [flattened_route, self.reference.copy()]})
+            logging.info('Collecting prefixes and origin ASes of routes.')
+            for key in self.route_keys:
+                for batch in self.route_store.read(*key, columns=['network', 'origin_asn']):
+                    for network in batch.column('network').unique().to_pylist():
+                        if network not in canonical_prefixes:
+                            canonical_prefixes[network] = ipaddress.ip_network(network).compressed
+                    asns.update(batch.column('origin_asn').drop_null().to_pylist())
+        prefixes = set(canonical_prefixes.values())
 
         # Get/create nodes.
         asn_id = self.iyp.batch_get_nodes_by_single_prop('AS', 'asn', asns, all=False)
@@ -439,16 +633,38 @@ class Crawler(BaseCrawler):
         for relationship in member_of_rels:
             asn = relationship['src_id']
             relationship['src_id'] = asn_id[asn]
-        for relationship in originate_rels:
-            asn = relationship['src_id']
-            prefix = relationship['dst_id']
-            relationship['src_id'] = asn_id[asn]
-            relationship['dst_id'] = prefix_id[prefix]
 
         # Push relationships.
         self.iyp.batch_add_links('MEMBER_OF', member_of_rels)
-        if originate_rels:
-            self.iyp.batch_add_links('ORIGINATE', originate_rels)
+        if self.route_keys:
+            network_id = {network: prefix_id[prefix] for network, prefix in canonical_prefixes.items()}
+            self.iyp.batch_add_links('ORIGINATE', self.__originate_links(asn_id, network_id))
+
+    def __originate_links(self, asn_id: dict, network_id: dict) -> Iterator[dict]:
+        """Generate ORIGINATE relationships from the route store.
+
+        network_id maps the network as given by the route server to the QID of the
+        prefix node.
+        """
+        logging.info('Iterating routes.')
+        flattener = RouteFlattener()
+        for routeserver_id, neighbor_id in self.route_keys:
+            # The reference is shared by all routes of this neighbor. This is safe since
+            # batch_add_links does not modify the property dicts.
+            reference = self.reference.copy()
+            reference['reference_url_data'] = self.urls['routes'].format(rs=routeserver_id, neighbor=neighbor_id)
+            for batch in self.route_store.read(routeserver_id, neighbor_id):
+                for network, origin_asn, encoded_route in zip(batch.column('network').to_pylist(),
+                                                              batch.column('origin_asn').to_pylist(),
+                                                              batch.column('route').to_pylist()):
+                    if origin_asn is None:
+                        logging.warning(f'Ignoring route without AS path: {encoded_route}')
+                        continue
+                    flattened_route = flattener.flatten(json.loads(encoded_route))
+                    flattened_route['routeserver_id'] = routeserver_id
+                    yield {'src_id': asn_id[origin_asn],
+                           'dst_id': network_id[network],
+                           'props': [flattened_route, reference]}
 
     def unit_test(self):
         return super().unit_test(['MEMBER_OF'])
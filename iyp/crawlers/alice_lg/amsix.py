@@ -12,6 +12,7 @@ NAME = 'alice_lg.amsix'
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -27,6 +28,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
@@ -0,0 +1,149 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from iyp import BaseCrawler, DataNotAvailableError
+from iyp.crawlers.alice_lg import create_session, get_peering_lans
+
+ORG = 'Alice-LG'
+URL = 'https://github.com/alice-lg/alice-lg'
+NAME = 'alice_lg.orchestrator'
+
+# Looking glasses crawled by the orchestrator.
+CRAWLERS = [
+    'iyp.crawlers.alice_lg.amsix',
+    'iyp.crawlers.alice_lg.bcix',
+    'iyp.crawlers.alice_lg.ddix',
+    'iyp.crawlers.alice_lg.decix',
+    'iyp.crawlers.alice_lg.ixaustralia',
+    'iyp.crawlers.alice_lg.ixbr',
+    'iyp.crawlers.alice_lg.linx',
+    'iyp.crawlers.alice_lg.megaport',
+    'iyp.crawlers.alice_lg.netnod',
+    'iyp.crawlers.alice_lg.nzix',
+    'iyp.crawlers.alice_lg.pix',
+    'iyp.crawlers.alice_lg.sfmix',
+    'iyp.crawlers.alice_lg.six',
+    'iyp.crawlers.alice_lg.topix',
+]
+# Size of the HTTP thread pool shared by all looking glasses.
+PARALLEL_DOWNLOADS = 16
+if os.path.exists('config.json'):
+    config = json.load(open('config.json', 'r'))
+    CRAWLERS = config.get('alice_lg', dict()).get('crawlers', CRAWLERS)
+    PARALLEL_DOWNLOADS = config.get('alice_lg', dict()).get('parallel_downloads', PARALLEL_DOWNLOADS)
+
+
+class Crawler(BaseCrawler):
+    """Crawl all Alice-LG looking glasses concurrently.
+
+    All looking glasses share one rate-limited HTTP session and the IYP connection of
+    the orchestrator, and the peering LANs are only fetched once from IYP. Data is
+    fetched concurrently, but pushed to IYP one looking glass at a time. Each looking
+    glass keeps its own reference name and a failing looking glass does not affect the
+    others, but run() raises an exception listing all failed looking glasses at the
+    end.
+    """
+
+    def __init__(self, organization, url, name, crawler_modules: list = CRAWLERS):
+        super().__init__(organization, url, name)
+        self.crawler_modules = crawler_modules
+        self.session = create_session(PARALLEL_DOWNLOADS)
+        # Dict mapping module names to crawler instances.
+        self.crawlers = dict()
+        # Dict mapping module names to the exception raised while crawling.
+        self.failed = dict()
+        for module_name in crawler_modules:
+            try:
+                module = importlib.import_module(module_name)
+                self.crawlers[module_name] = module.Crawler(module.ORG, module.URL, module.NAME,
+                                                            session=self.session, iyp=self.iyp)
+            except Exception as e:
+                logging.error(f'Failed to initialize {module_name}: {e}')
+                self.failed[module_name] = e
+
+    def run(self) -> None:
+        peering_lans = get_peering_lans(self.iyp)
+
+        # Data is pushed as soon as a looking glass is fetched, while the others are
+        # still fetching. Pushes run in this thread since IYP sessions are not
+        # thread-safe. Data of a looking glass that fails during import is rolled back.
+        # Failures during initialization are already in self.failed.
+        with ThreadPoolExecutor(max(len(self.crawlers), 1)) as executor:
+            futures = {executor.submit(crawler.fetch): module_name for module_name, crawler in self.crawlers.items()}
+            for future in as_completed(futures):
+                module_name = futures[future]
+                crawler = self.crawlers[module_name]
+                try:
+                    future.result()
+                    logging.info(f'Importing {module_name}')
+                    crawler.peering_lans = peering_lans
+                    crawler.import_data()
+                    self.iyp.commit()
+                except Exception as e:
+                    logging.error(f'Failed to crawl {module_name}: {e}')
+                    self.iyp.rollback()
+                    self.failed[module_name] = e
+
+        if self.failed:
+            summary = f'{len(self.failed)}/{len(self.crawler_modules)} looking glasses failed'
+            logging.error(f'{summary}:')
+            for module_name, e in sorted(self.failed.items()):
+                logging.error(f'  {module_name}: {e}')
+            raise DataNotAvailableError(f'{summary}: {sorted(self.failed)}')
+
+    def delete(self) -> None:
+        for crawler in self.crawlers.values():
+            crawler.delete()
+
+    def unit_test(self) -> bool:
+        passed = not self.failed
+        for module_name, crawler in self.crawlers.items():
+            if module_name in self.failed:
+                continue
+            if not crawler.unit_test():
+                logging.error(f'Missing data for {module_name}')
+                passed = False
+        return passed
+
+    def close(self) -> None:
+        # Looking glasses share the IYP connection, which is closed here.
+        self.session.close()
+        super().close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
+    args = parser.parse_args()
+
+    FORMAT = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=FORMAT,
+        filename='log/' + NAME + '.log',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    logging.info(f'Started: {sys.argv}')
+
+    crawler = Crawler(ORG, URL, NAME)
+    if args.unit_test:
+        crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
+    else:
+        crawler.run()
+        crawler.close()
+    logging.info(f'Finished: {sys.argv}')
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -1,13 +1,107 @@
+import hashlib
 import ipaddress
-import json
 import logging
 import os
+import pickle
+from collections import Counter, defaultdict
+from functools import lru_cache
+from multiprocessing import get_context
+from typing import Optional, Tuple
+from urllib.parse import urlparse
 
 import iso3166
+import orjson
+import tldextract
+from botocore.exceptions import BotoCoreError, ClientError
 
-from iyp import BaseCrawler
+from iyp import BaseCrawler, CacheHandler
 from iyp.crawlers.ooni.utils import grabber
 
+# Increase if the results computed by process_one_line change, to invalidate the cached
+# results of previous builds.
+RESULTS_CACHE_VERSION = 2
+# Maximum number of entries of each memoized parsing function. The same URLs and IPs
+# appear in many measurements.
+PARSE_CACHE_SIZE = 2 ** 18
+# Crawler used by the worker processes. Set before the workers are forked, so they
+# inherit it.
+worker_crawler = None
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_ip(ip: str) -> Optional[Tuple[str, bool]]:
+    """Return the compressed representation of an IP address and if it is global, or
+    None if the IP is invalid."""
+    try:
+        ip = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    return ip.compressed, ip.is_global
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_url(url: str) -> Optional[Tuple[str, bool]]:
+    """Return the hostname of a URL and if the hostname is an IP, or None if the URL
+    is malformed.
+
+    IP hostnames are compressed, other hostnames are reduced to the FQDN.
+    """
+    try:
+        hostname = urlparse(url).hostname
+    except ValueError as e:
+        logging.error(f'Failed to extract hostname from URL "{url}": {e}')
+        return None
+    parsed_ip = parse_ip(hostname)
+    if parsed_ip is not None:
+        return parsed_ip[0], True
+    return tldextract.extract(url).fqdn, False
+
+
+PARSE_FUNCTIONS = {'url': parse_url, 'ip': parse_ip}
+
+
+def get_parse_cache_stats() -> Counter:
+    """Return the number of hits and misses of each memoized parsing function."""
+    stats = Counter()
+    for name, function in PARSE_FUNCTIONS.items():
+        cache_info = function.cache_info()
+        stats[(name, 'hits')] = cache_info.hits
+        stats[(name, 'misses')] = cache_info.misses
+    return stats
+
+
+def process_object(key: str):
+    """Stream and parse a single S3 object in a worker process.
+
+    Return the key, the partial results (see OoniCrawler.get_partial_results), or None
+    instead of the results if the object could not be read, and the parse cache stats
+    of this object.
+    """
+    worker_crawler.reset_partial_results()
+    parse_cache_stats = get_parse_cache_stats()
+    try:
+        for line in grabber.iter_lines(worker_crawler.repo, key):
+            worker_crawler.process_one_line(orjson.loads(line))
+        partial_results = worker_crawler.get_partial_results()
+    except (BotoCoreError, ClientError, OSError, EOFError) as e:
+        logging.error(f'Error reading {key}: {e}')
+        partial_results = None
+    parse_cache_stats = get_parse_cache_stats() - parse_cache_stats
+    return key, partial_results, parse_cache_stats
+
+
+def merge_partial_results(target: dict, partial_results: dict) -> None:
+    """Merge partial results into target.
+
+    Sets are merged and the counts of results are added. Objects of partial_results
+    may be reused by target.
+    """
+    for name, value in partial_results.items():
+        if name in target:
+            target[name].update(value)
+        else:
+            target[name] = value
+
 
 # OONI Crawler base class
 class OoniCrawler(BaseCrawler):
@@ -18,10 +112,15 @@ class OoniCrawler(BaseCrawler):
         self.reference['reference_url_info'] = 'https://ooni.org/post/mining-ooni-data'
         self.repo = 'ooni-data-eu-fra'
         self.dataset = dataset
+        # Results of each final day are cached, see run().
+        self.results_cache = CacheHandler(os.path.join(grabber.CACHE_DIR, 'ooni_results', ''), f'{dataset}.')
         self.categories = list()
         self.all_asns = set()
         self.all_countries = set()
-        self.all_results = list()
+        # Number of results per (group, category) tuple, see add_result().
+        self.result_counts = Counter()
+        # (probe_asn, probe_cc) tuple of the line that is currently processed.
+        self.current_probe = None
         self.all_percentages = dict()
         self.all_dns_resolvers = set()
         self.unique_links = {
@@ -33,36 +132,143 @@ class OoniCrawler(BaseCrawler):
         }
 
     def run(self):
-        """Fetch data and push to IYP."""
-
-        # Create a temporary directory
-        tmpdir = self.create_tmp_dir()
-
-        # Fetch data
-        grabber.download_and_extract(self.repo, tmpdir, self.dataset)
-        logging.info('Successfully downloaded and extracted all files.')
-        # Now that we have downloaded the jsonl files for the test we want, we can
-        # extract the data we want
-        logging.info('Processing files...')
-        for entry in os.scandir(tmpdir):
-            if not entry.is_file() or not entry.name.endswith('.jsonl'):
-                continue
-            file_path = os.path.join(tmpdir, entry.name)
-            with open(file_path, 'r') as file:
-                for line in file:
-                    data = json.loads(line)
-                    self.process_one_line(data)
+        """Fetch data and push to IYP.
+
+        The partial results of each day are cached once the day is final, so usually
+        only the most recent day needs to be fetched.
+        """
+
+        os.makedirs(self.results_cache.cache_dir, exist_ok=True)
+        # Dict mapping dates to the partial results of the day.
+        day_results = dict()
+        # Dict mapping final dates to the name of their cached results.
+        cache_names = dict()
+        cached_dates = set()
+        # Dict mapping object keys to their date.
+        key_dates = dict()
+        for date, final, objects in grabber.list_days(self.repo, self.dataset):
+            if final:
+                cache_names[date] = self.get_results_cache_name(date, objects)
+                results = self.load_cached_results(cache_names[date])
+                if results is not None:
+                    day_results[date] = results
+                    cached_dates.add(date)
+                    continue
+            day_results[date] = dict()
+            for key, _, _ in objects:
+                key_dates[key] = date
+        logging.info(f'Using cached results for {len(cached_dates)} days.')
+
+        # Fetch and process data
+        failed_dates = self.process_objects(key_dates, day_results)
+
+        for date, cache_name in cache_names.items():
+            if date not in cached_dates and date not in failed_dates:
+                self.results_cache.save_cached_object(cache_name, day_results[date])
+        self.prune_results_cache(set(cache_names.values()))
+
+        results = dict()
+        for partial_results in day_results.values():
+            merge_partial_results(results, partial_results)
+        self.set_partial_results(results)
         logging.info('Calculating percentages...')
         self.aggregate_results()
         logging.info('Adding entries to IYP...')
         self.batch_add_to_iyp()
         logging.info('Done.')
 
+    def process_objects(self, key_dates: dict, day_results: dict) -> set:
+        """Fetch and process S3 objects in worker processes.
+
+        Partial results of each object are merged into the day_results entry of its
+        date. Return the set of dates for which at least one object failed.
+        """
+        logging.info(f'Processing {len(key_dates)} objects with {grabber.PARALLEL_DOWNLOADS} processes in '
+                     f'parallel...')
+        global worker_crawler
+        worker_crawler = self
+        failed_dates = set()
+        failed_objects = 0
+        parse_cache_stats = Counter()
+        # Workers need to be forked to inherit the crawler.
+        with get_context('fork').Pool(grabber.PARALLEL_DOWNLOADS, initializer=grabber.init_worker) as pool:
+            for key, partial_results, object_parse_cache_stats in pool.imap_unordered(process_object, key_dates):
+                parse_cache_stats.update(object_parse_cache_stats)
+                date = key_dates[key]
+                if partial_results is None:
+                    failed_objects += 1
+                    failed_dates.add(date)
+                    continue
+                merge_partial_results(day_results[date], partial_results)
+        worker_crawler = None
+        for name in PARSE_FUNCTIONS:
+            hits = parse_cache_stats[(name, 'hits')]
+            lookups = hits + parse_cache_stats[(name, 'misses')]
+            if lookups:
+                logging.info(f'Parse cache for {name}: {hits}/{lookups} hits ({hits / lookups:.1%})')
+        if failed_objects:
+            logging.warning(f'Failed to read {failed_objects}/{len(key_dates)} objects.')
+        return failed_dates
+
+    @staticmethod
+    def get_results_cache_name(date: str, objects: list) -> str:
+        """Return the cache name of the results of a day, which changes if any object
+        of the day changes."""
+        fingerprint = hashlib.sha256()
+        for key, size, etag in sorted(objects):
+            fingerprint.update(f'{key} {size} {etag}\n'.encode())
+        return f'v{RESULTS_CACHE_VERSION}.{date}.{fingerprint.hexdigest()[:16]}'
+
+    def load_cached_results(self, cache_name: str):
+        """Return cached results or None if they do not exist."""
+        if not self.results_cache.cached_object_exists(cache_name):
+            return None
+        try:
+            return self.results_cache.load_cached_object(cache_name)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logging.warning(f'Failed to load cached results {cache_name}: {e}')
+            return None
+
+    def prune_results_cache(self, keep: set):
+        """Remove all cached results of this dataset, except the ones in keep."""
+        prefix = self.results_cache.cache_file_prefix
+        suffix = self.results_cache.cache_file_suffix
+        for entry in os.scandir(self.results_cache.cache_dir):
+            if not entry.path.startswith(prefix) or not entry.path.endswith(suffix):
+                continue
+            if entry.path[len(prefix):-len(suffix)] not in keep:
+                os.remove(entry.path)
+
+    def get_partial_results(self) -> dict:
+        """Return the results of the lines processed since the last call of
+        reset_partial_results.
+
+        Results are all set attributes starting with "all_" and the result counts.
+        """
+        partial_results = {name: value for name, value in vars(self).items()
+                           if name.startswith('all_') and isinstance(value, set)}
+        partial_results['result_counts'] = self.result_counts
+        return partial_results
+
+    def reset_partial_results(self):
+        """Clear all results that are returned by get_partial_results."""
+        for name, value in list(vars(self).items()):
+            if name.startswith('all_') and isinstance(value, set):
+                setattr(self, name, set())
+        self.result_counts = Counter()
+
+    def set_partial_results(self, partial_results: dict):
+        """Add merged partial results to this crawler."""
+        self.result_counts = partial_results.pop('result_counts', Counter())
+        for name, value in partial_results.items():
+            getattr(self, name).update(value)
+
     def process_one_line(self, one_line):
         """Process a single line from the jsonl file and store the results locally.
 
-        Return True if an error occurred and no result was added, i.e., the extended
-        class should not continue to process this line.
+        Return True if an error occurred, i.e., the extended class should not continue
+        to process this line. Otherwise, self.current_probe is set and the extended
+        class can add results with add_result().
         """
 
         # No test result. Can happen sometimes.
@@ -77,12 +283,9 @@ class OoniCrawler(BaseCrawler):
             raise e
 
         # Add the DNS resolver to the set, unless its not a valid IP address
-        try:
-            resolver_ip = ipaddress.ip_address(one_line.get('resolver_ip'))
-            if resolver_ip.is_global:
-                self.all_dns_resolvers.add(resolver_ip.compressed)
-        except ValueError:
-            pass
+        resolver_ip = parse_ip(one_line.get('resolver_ip'))
+        if resolver_ip is not None and resolver_ip[1]:
+            self.all_dns_resolvers.add(resolver_ip[0])
 
         if probe_asn == 0:
             # Ignore result if probe ASN is hidden.
@@ -96,20 +299,21 @@ class OoniCrawler(BaseCrawler):
         if probe_cc:
             self.all_countries.add(probe_cc)
 
-        # Append the results to the list.
-        self.all_results.append((probe_asn, probe_cc))
-        """The base function adds a skeleton to the all_results list, which includes the
-        probe_asn and the probe_cc.
-
-        Each extended crawler then modifies this entry by calling self.all_results[-1]
-        to access the last result and add its specific variables.
-        Attention: if you are discarding a result in the extended class, you need to
-        make sure you specifically pop() the entry created here, in the base class, or
-        you WILL end up with misformed entries that only contain the probe_asn and
-        probe_cc, and mess up your data.
-        """
+        self.current_probe = (probe_asn, probe_cc)
         return False
 
+    def add_result(self, group: tuple, *categories: str):
+        """Count a result of the current line for each of the specified categories.
+
+        Results are aggregated per group, e.g., (probe_asn, probe_cc) or (probe_asn,
+        probe_cc, target), and the group becomes a key of self.all_percentages. The
+        first two items of the group must be the probe ASN and country. Memory usage
+        only depends on the number of distinct groups, not on the number of
+        measurements.
+        """
+        for category in categories:
+            self.result_counts[(group, category)] += 1
+
     def batch_add_to_iyp(self):
         """Add the results to the IYP."""
         country_links = list()
@@ -129,8 +333,8 @@ class OoniCrawler(BaseCrawler):
         # To avoid duplication of country links, we only add them from
         # the webconnectivity dataset
         if self.dataset == 'webconnectivity':
-            for entry in self.all_results:
-                asn, country = entry[:2]
+            for group, _ in self.result_counts:
+                asn, country = group[:2]
                 if country is None:
                     continue
                 asn_id = self.node_ids['asn'][asn]
@@ -156,7 +360,19 @@ class OoniCrawler(BaseCrawler):
     def aggregate_results(self):
         """Populate the self.all_percentages dict by aggregating results and calculating
         percentages."""
-        raise NotImplementedError()
+        group_counts = defaultdict(dict)
+        for (group, category), count in self.result_counts.items():
+            group_counts[group][category] = count
+        for group, counts in group_counts.items():
+            self.all_percentages[group] = self.make_result_dict(counts, self.get_total_count(counts))
+
+    def get_total_count(self, counts: dict):
+        """Return the total count of a group used to calculate percentages.
+
+        None (the default) uses the sum of all counts. Tests that count multiple
+        categories per result need to override this.
+        """
+        return None
 
     def make_result_dict(self, counts: dict, total_count: int = None):
         """Create a result dict containing the counts, total count, and percentages.
@@ -194,18 +410,18 @@ def process_dns_queries(queries_list: list):
             continue
         hostname = query['hostname']
         for answer in query['answers']:
-            try:
-                if answer['answer_type'] == 'A':
-                    ip = ipaddress.ip_address(answer['ipv4'])
-                elif answer['answer_type'] == 'AAAA':
-                    ip = ipaddress.ip_address(answer['ipv6'])
-                else:
-                    # CNAME etc.
-                    continue
-            except ValueError:
-                # In rare cases the answer IP is scrubbed and thus invalid.
+            if answer['answer_type'] == 'A':
+                parsed_ip = parse_ip(answer['ipv4'])
+            elif answer['answer_type'] == 'AAAA':
+                parsed_ip = parse_ip(answer['ipv6'])
+            else:
+                # CNAME etc.
+                continue
+            # In rare cases the answer IP is scrubbed and thus invalid.
+            if parsed_ip is None:
                 continue
-            if not ip.is_global:
+            ip, is_global = parsed_ip
+            if not is_global:
                 continue
-            host_ip_set.add((hostname, ip.compressed))
+            host_ip_set.add((hostname, ip))
     return host_ip_set
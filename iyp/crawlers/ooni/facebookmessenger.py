@@ -1,7 +1,6 @@
 import argparse
 import logging
 import sys
-from collections import defaultdict
 
 from iyp.crawlers.ooni import OoniCrawler
 
@@ -25,11 +24,17 @@ class Crawler(OoniCrawler):
         result_dns = one_line['test_keys'].get('facebook_dns_blocking', None)
         result_tcp = one_line['test_keys'].get('facebook_tcp_blocking', None)
         if result_dns is None or result_tcp is None:
-            self.all_results.pop()
             return
 
-        # Using the last result from the base class, add our unique variables
-        self.all_results[-1] = self.all_results[-1] + (result_dns, result_tcp)
+        if not result_dns and not result_tcp:
+            result = 'unblocked'
+        elif result_dns and not result_tcp:
+            result = 'dns_blocking'
+        elif not result_dns and result_tcp:
+            result = 'tcp_blocking'
+        else:
+            result = 'both_blocked'
+        self.add_result(self.current_probe, result)
 
     def batch_add_to_iyp(self):
         super().batch_add_to_iyp()
@@ -53,23 +58,6 @@ class Crawler(OoniCrawler):
 
         self.iyp.batch_add_links('CENSORED', censored_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-
-        for entry in self.all_results:
-            asn, country, result_dns, result_tcp = entry
-            if not result_dns and not result_tcp:
-                target_dict[(asn, country)]['unblocked'] += 1
-            elif result_dns and not result_tcp:
-                target_dict[(asn, country)]['dns_blocking'] += 1
-            elif not result_dns and result_tcp:
-                target_dict[(asn, country)]['tcp_blocking'] += 1
-            elif result_dns and result_tcp:
-                target_dict[(asn, country)]['both_blocked'] += 1
-
-        for (asn, country), counts in target_dict.items():
-            self.all_percentages[(asn, country)] = self.make_result_dict(counts)
-
     def unit_test(self):
         return super().unit_test(['CENSORED'])
 
@@ -77,6 +65,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -92,6 +81,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
@@ -1,7 +1,6 @@
 import argparse
 import logging
 import sys
-from collections import defaultdict
 
 from iyp.crawlers.ooni import OoniCrawler
 
@@ -61,8 +60,8 @@ class Crawler(OoniCrawler):
             else 'no_header_field_number'
         )
 
-        # Using the last result from the base class, add our unique variables
-        self.all_results[-1] = self.all_results[-1] + (
+        self.add_result(
+            self.current_probe,
             total,
             request_line_capitalization,
             header_name_capitalization,
@@ -92,31 +91,10 @@ class Crawler(OoniCrawler):
 
         self.iyp.batch_add_links('CENSORED', censored_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-
-        # Populate the target_dict with counts
-        for entry in self.all_results:
-            (
-                asn,
-                country,
-                total,
-                request_line_capitalization,
-                header_name_capitalization,
-                header_field_value,
-                header_field_number,
-            ) = entry
-            target_dict[(asn, country)][total] += 1
-            target_dict[(asn, country)][request_line_capitalization] += 1
-            target_dict[(asn, country)][header_name_capitalization] += 1
-            target_dict[(asn, country)][header_field_value] += 1
-            target_dict[(asn, country)][header_field_number] += 1
-
-        for (asn, country), counts in target_dict.items():
-            # This test tests multiple things with one result, i.e., the categories are
-            # not disjunct so we have to use our own total count.
-            total_count = counts['total'] + counts['no_total']
-            self.all_percentages[(asn, country)] = self.make_result_dict(counts, total_count)
+    def get_total_count(self, counts: dict):
+        # This test tests multiple things with one result, i.e., the categories are not
+        # disjunct so we have to use our own total count.
+        return counts.get('total', 0) + counts.get('no_total', 0)
 
     def unit_test(self):
         return super().unit_test(['CENSORED'])
@@ -125,6 +103,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -140,6 +119,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
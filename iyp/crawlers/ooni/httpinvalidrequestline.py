@@ -1,7 +1,6 @@
 import argparse
 import logging
 import sys
-from collections import defaultdict
 
 from iyp.crawlers.ooni import OoniCrawler
 
@@ -25,8 +24,7 @@ class Crawler(OoniCrawler):
 
         tampering = 'tampering' if one_line['test_keys']['tampering'] else 'no_tampering'
 
-        # Using the last result from the base class, add our unique variables
-        self.all_results[-1] = self.all_results[-1] + (tampering,)
+        self.add_result(self.current_probe, tampering)
 
     def batch_add_to_iyp(self):
         super().batch_add_to_iyp()
@@ -50,17 +48,6 @@ class Crawler(OoniCrawler):
 
         self.iyp.batch_add_links('CENSORED', censored_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-
-        # Populate the target_dict with counts
-        for entry in self.all_results:
-            asn, country, tampering = entry
-            target_dict[(asn, country)][tampering] += 1
-
-        for (asn, country), counts in target_dict.items():
-            self.all_percentages[(asn, country)] = self.make_result_dict(counts)
-
     def unit_test(self):
         return super().unit_test(['CENSORED'])
 
@@ -68,6 +55,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -83,6 +71,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
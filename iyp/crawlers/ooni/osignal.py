@@ -1,7 +1,6 @@
 import argparse
 import logging
 import sys
-from collections import defaultdict
 
 from iyp.crawlers.ooni import OoniCrawler
 
@@ -26,11 +25,9 @@ class Crawler(OoniCrawler):
             return
         signal_backend_status = one_line['test_keys']['signal_backend_status']
         if signal_backend_status is None:
-            self.all_results.pop()
             return
 
-        # Using the last result from the base class, add our unique variables
-        self.all_results[-1] = self.all_results[-1] + (signal_backend_status,)
+        self.add_result(self.current_probe, signal_backend_status)
 
     def batch_add_to_iyp(self):
         super().batch_add_to_iyp()
@@ -54,17 +51,6 @@ class Crawler(OoniCrawler):
 
         self.iyp.batch_add_links('CENSORED', censored_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-
-        # Populate the target_dict with counts
-        for entry in self.all_results:
-            asn, country, result = entry
-            target_dict[(asn, country)][result] += 1
-
-        for (asn, country), counts in target_dict.items():
-            self.all_percentages[(asn, country)] = self.make_result_dict(counts)
-
     def unit_test(self):
         return super().unit_test(['CENSORED'])
 
@@ -72,6 +58,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -87,6 +74,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
@@ -1,12 +1,10 @@
 import argparse
-import ipaddress
 import logging
 import sys
-from collections import defaultdict
 
 import tldextract
 
-from iyp.crawlers.ooni import OoniCrawler, process_dns_queries
+from iyp.crawlers.ooni import OoniCrawler, parse_ip, process_dns_queries
 
 ORG = 'OONI'
 URL = 's3://ooni-data-eu-fra/raw/'
@@ -27,7 +25,6 @@ class Crawler(OoniCrawler):
             return
         if not one_line['input']:
             # If no input is provided, the test fails.
-            self.all_results.pop()
             return
 
         stun_url = one_line['input']
@@ -40,9 +37,7 @@ class Crawler(OoniCrawler):
         stun_ip_port = stun_endpoint.split(':')
         stun_ip = stun_ip_port[0]
 
-        try:
-            stun_ip = ipaddress.ip_address(stun_ip)
-        except ValueError:
+        if parse_ip(stun_ip) is None:
             stun_hostname = tldextract.extract(stun_endpoint).fqdn
 
         # Handle "queries" section to get IP addresses and map them to the hostname
@@ -59,11 +54,7 @@ class Crawler(OoniCrawler):
 
         self.all_urls.add(stun_url)
 
-        # Using the last result from the base class, add our unique variables
-        self.all_results[-1] = self.all_results[-1] + (
-            stun_url,
-            result,
-        )
+        self.add_result(self.current_probe + (stun_url,), result)
 
     def batch_add_to_iyp(self):
         super().batch_add_to_iyp()
@@ -113,17 +104,6 @@ class Crawler(OoniCrawler):
         self.iyp.batch_add_links('CENSORED', censored_links)
         self.iyp.batch_add_links('RESOLVES_TO', resolves_to_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-
-        # Populate the target_dict with counts
-        for entry in self.all_results:
-            asn, country, stun_url, result = entry
-            target_dict[(asn, country, stun_url)][result] += 1
-
-        for (asn, country, stun_url), counts in target_dict.items():
-            self.all_percentages[(asn, country, stun_url)] = self.make_result_dict(counts)
-
     def unit_test(self):
         return super().unit_test(['CENSORED', 'RESOLVES_TO'])
 
@@ -131,6 +111,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -146,6 +127,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
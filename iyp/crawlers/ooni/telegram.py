@@ -1,7 +1,6 @@
 import argparse
 import logging
 import sys
-from collections import defaultdict
 
 from iyp.crawlers.ooni import OoniCrawler
 
@@ -54,8 +53,8 @@ class Crawler(OoniCrawler):
         if result_web == 'web_blocked' or result_http == 'http_blocked' or result_tcp == 'tcp_blocked':
             total = 'total_blocked'
 
-        # Using the last result from the base class, add our unique variables
-        self.all_results[-1] = self.all_results[-1] + (
+        self.add_result(
+            self.current_probe,
             total,
             result_web,
             result_http,
@@ -84,20 +83,8 @@ class Crawler(OoniCrawler):
 
         self.iyp.batch_add_links('CENSORED', censored_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-
-        # Populate the target_dict with counts
-        for entry in self.all_results:
-            asn, country, total, result_web, result_http, result_tcp = entry
-            target_dict[(asn, country)][total] += 1
-            target_dict[(asn, country)][result_web] += 1
-            target_dict[(asn, country)][result_http] += 1
-            target_dict[(asn, country)][result_tcp] += 1
-
-        for (asn, country), counts in target_dict.items():
-            total_count = counts['total_ok'] + counts['total_blocked']
-            self.all_percentages[(asn, country)] = self.make_result_dict(counts, total_count)
+    def get_total_count(self, counts: dict):
+        return counts.get('total_ok', 0) + counts.get('total_blocked', 0)
 
     def unit_test(self):
         return super().unit_test(['CENSORED'])
@@ -106,6 +93,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -121,6 +109,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
@@ -2,7 +2,6 @@ import argparse
 import ipaddress
 import logging
 import sys
-from collections import defaultdict
 
 from iyp.crawlers.ooni import OoniCrawler
 
@@ -28,8 +27,8 @@ class Crawler(OoniCrawler):
 
         test_keys = one_line['test_keys']
 
-        # Check each target in the test_keys
-        first_target = True
+        # Check each target in the test_keys. One test contains results for multiple
+        # targets, which are counted separately.
         for target_data in test_keys['targets'].values():
             # Technically the target_address can be domain:port, but apparently this is
             # never the case?
@@ -44,14 +43,7 @@ class Crawler(OoniCrawler):
                 continue
 
             self.all_ip_tags.add((ip, self.all_tags[target_protocol]))
-            if first_target:
-                self.all_results[-1] = self.all_results[-1] + (ip, result)
-                first_target = False
-            else:
-                # One test contains results for multiple targets, so copy the (asn,
-                # country) part and append new data.
-                new_entry = self.all_results[-1][:2] + (ip, result)
-                self.all_results.append(new_entry)
+            self.add_result(self.current_probe + (ip,), result)
 
     def batch_add_to_iyp(self):
         super().batch_add_to_iyp()
@@ -96,15 +88,6 @@ class Crawler(OoniCrawler):
         self.iyp.batch_add_links('CENSORED', censored_links)
         self.iyp.batch_add_links('CATEGORIZED', categorized_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-        for entry in self.all_results:
-            asn, country, ip, result = entry
-            target_dict[(asn, country, ip)][result] += 1
-
-        for (asn, country, ip), counts in target_dict.items():
-            self.all_percentages[(asn, country, ip)] = self.make_result_dict(counts)
-
     def unit_test(self):
         return super().unit_test(['CENSORED', 'CATEGORIZED'])
 
@@ -112,6 +95,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -127,6 +111,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
@@ -1,7 +1,6 @@
 import argparse
 import logging
 import sys
-from collections import defaultdict
 
 from iyp.crawlers.ooni import OoniCrawler
 
@@ -23,12 +22,10 @@ class Crawler(OoniCrawler):
         if super().process_one_line(one_line):
             return
         if 'success' not in one_line['test_keys']:
-            self.all_results.pop()
             return
         result = 'ok' if one_line['test_keys']['success'] else 'failure'
 
-        # Update the last entry in all_results with the new test-specific data
-        self.all_results[-1] = self.all_results[-1] + (result,)
+        self.add_result(self.current_probe, result)
 
     def batch_add_to_iyp(self):
         super().batch_add_to_iyp()
@@ -52,17 +49,6 @@ class Crawler(OoniCrawler):
 
         self.iyp.batch_add_links('CENSORED', censored_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-
-        # Populate the target_dict with counts
-        for entry in self.all_results:
-            asn, country, result = entry
-            target_dict[(asn, country)][result] += 1
-
-        for (asn, country), counts in target_dict.items():
-            self.all_percentages[(asn, country)] = self.make_result_dict(counts)
-
     def unit_test(self):
         return super().unit_test(['CENSORED'])
 
@@ -70,6 +56,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -85,6 +72,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
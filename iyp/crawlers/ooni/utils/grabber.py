@@ -3,94 +3,199 @@ import gzip
 import json
 import logging
 import os
-import shutil
-from multiprocessing import Pool
+import pickle
+import time
+from typing import Iterator
 
 import boto3
 import botocore
 
-# Global variable required for multiprocessing.
+from iyp import CacheHandler
+
+# Global variable required for multiprocessing. Each worker process uses its own
+# client.
 s3 = None
 
 PARALLEL_DOWNLOADS = 4
+# Number of days of data to fetch, including today.
+DAYS = 7
+# The listing of a day is reused for this long, e.g., by the other OONI crawlers of the
+# same build.
+INDEX_MAX_AGE_IN_HOURS = 12
+# The listing of a day is final if it was done this long after the end of the day.
+INDEX_SETTLE_TIME_IN_HOURS = 6
+CACHE_DIR = 'tmp/'
 if os.path.exists('config.json'):
     config = json.load(open('config.json', 'r'))
     PARALLEL_DOWNLOADS = config['ooni']['parallel_downloads']
+    INDEX_MAX_AGE_IN_HOURS = config['ooni'].get('index_max_age_in_hours', INDEX_MAX_AGE_IN_HOURS)
+    CACHE_DIR = config.get('cache', dict()).get('directory', CACHE_DIR)
+
+
+def get_s3_client():
+    """Return an anonymous S3 client."""
+    return boto3.client(
+        's3',
+        region_name='ap-northeast-1',
+        config=botocore.client.Config(
+            signature_version=botocore.UNSIGNED
+        )
+    )
 
 
-def process(params: tuple):
-    """Download and extract a single file.
+def init_worker():
+    """Initialize the S3 client of a worker process."""
+    global s3
+    s3 = get_s3_client()
 
-    Args:
-        params (tuple): Object key and output file path.
+
+class ListingIndex:
+    """Local index of the raw measurement objects in an S3 bucket, shared by all OONI
+    crawlers.
+
+    The index maps (date, test name) to a list of (key, size, ETag) tuples. Each day is
+    listed once and the listing is stored on disk, so the other crawlers do not need to
+    list the bucket again. The listing of a day is reused until it is older than
+    INDEX_MAX_AGE_IN_HOURS, or indefinitely if the day was already over for
+    INDEX_SETTLE_TIME_IN_HOURS at listing time.
     """
-    key, dest_file = params
-    # Download the file
-    try:
-        s3.download_file(key, dest_file)
-    except Exception as e:
-        logging.error(f'Error downloading {key}: {e}')
-        return
 
-    # Extract the .gz file
-    try:
-        extracted_file = dest_file.rstrip('.gz')
-        with gzip.open(dest_file, 'rb') as f_in, open(extracted_file, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-        # Delete the .gz file
-        os.remove(dest_file)
-    except Exception as e:
-        logging.error(f'Error extracting {key}: {e}')
+    def __init__(self, repo: str, dir: str = str()) -> None:
+        self.repo = repo
+        self.index_dir = dir if dir else os.path.join(CACHE_DIR, 'ooni_index', '')
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.cache_handler = CacheHandler(self.index_dir, f'{repo}.')
+        self.client = None
+        # Dict mapping date strings to the listing of the day.
+        self.days = dict()
+        self.reused_days = 0
+        self.listing_time_saved = 0
+
+    @staticmethod
+    def is_final(date: datetime.date, listed_at: datetime.datetime) -> bool:
+        end_of_day = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time(),
+                                               tzinfo=datetime.timezone.utc)
+        return listed_at >= end_of_day + datetime.timedelta(hours=INDEX_SETTLE_TIME_IN_HOURS)
+
+    def load_day(self, date: datetime.date):
+        """Return the stored listing of a day or None if there is no valid one."""
+        date_str = date.strftime('%Y%m%d')
+        if not self.cache_handler.cached_object_exists(date_str):
+            return None
+        try:
+            day = self.cache_handler.load_cached_object(date_str)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logging.warning(f'Failed to load listing index for {date_str}: {e}')
+            return None
+        age = datetime.datetime.now(datetime.timezone.utc) - day['listed_at']
+        if self.is_final(date, day['listed_at']) or age < datetime.timedelta(hours=INDEX_MAX_AGE_IN_HOURS):
+            return day
+        logging.info(f'Listing index for {date_str} is outdated.')
+        return None
+
+    def list_day(self, date: datetime.date) -> dict:
+        """List all JSONL objects of a day in the bucket."""
+        date_str = date.strftime('%Y%m%d')
+        if self.client is None:
+            self.client = get_s3_client()
+        paginator = self.client.get_paginator('list_objects_v2')
+        listed_at = datetime.datetime.now(datetime.timezone.utc)
+        start = time.monotonic()
+        tests = dict()
+        for page in paginator.paginate(Bucket=self.repo, Prefix=f'raw/{date_str}/'):
+            for obj in page.get('Contents', list()):
+                key = obj['Key']
+                key_split = key.split('/')
+                if len(key_split) != 6:
+                    logging.warning(f'Malformed key: {key}')
+                    continue
+                test = key_split[4]
+                object_name = key_split[5]
+                if not object_name.endswith('.jsonl.gz'):
+                    continue
+                tests.setdefault(test, list()).append((key, obj['Size'], obj['ETag']))
+        listing_time = time.monotonic() - start
+        logging.info(f'Listed {sum(len(objects) for objects in tests.values())} objects for {date_str} in '
+                     f'{listing_time:.1f}s.')
+        return {'listed_at': listed_at, 'listing_time': listing_time, 'tests': tests}
+
+    def get_day(self, date: datetime.date) -> dict:
+        date_str = date.strftime('%Y%m%d')
+        if date_str in self.days:
+            return self.days[date_str]
+        day = self.load_day(date)
+        if day is None:
+            day = self.list_day(date)
+            self.cache_handler.save_cached_object(date_str, day)
+        else:
+            self.reused_days += 1
+            self.listing_time_saved += day['listing_time']
+        self.days[date_str] = day
+        return day
+
+    def get_objects(self, date: datetime.date, test_name: str) -> list:
+        """Return the (key, size, ETag) tuples of a test for the specified day."""
+        return self.get_day(date)['tests'].get(test_name, list())
+
+    def prune(self, oldest_date: datetime.date) -> None:
+        """Remove the listings of days before oldest_date."""
+        prefix = self.cache_handler.cache_file_prefix
+        suffix = self.cache_handler.cache_file_suffix
+        for entry in os.scandir(self.index_dir):
+            if not entry.path.startswith(prefix) or not entry.path.endswith(suffix):
+                continue
+            date_str = entry.path[len(prefix):-len(suffix)]
+            if date_str < oldest_date.strftime('%Y%m%d'):
+                os.remove(entry.path)
+
+    def log_stats(self) -> None:
+        logging.info(f'Listing index: reused {self.reused_days} days, saved {self.listing_time_saved:.1f}s of '
+                     f'listing.')
 
 
-def download_and_extract(repo: str, tmpdir: str, test_name: str):
-    """Download the last 7 days of data for the specified test from an S3 bucket into a
-    temporary directory.
+def list_days(repo: str, test_name: str) -> list:
+    """List the objects of the last 7 days of data for the specified test in an S3
+    bucket.
+
+    Return a list of (date, final, objects) tuples, where date is a YYYYMMDD string,
+    final indicates that no objects will be added to that day anymore, and objects is a
+    list of (key, size, ETag) tuples.
 
     Args:
         repo (str): S3 bucket
-        tmpdir (str): Output directory
         test_name (str): Test name
     """
-    global s3
-    # Create an anonymous session
-    s3 = boto3.resource(
-        's3',
-        region_name='ap-northeast-1',
-        config=botocore.client.Config(
-            signature_version=botocore.UNSIGNED
-        )
-    ).Bucket(repo)
+    index = ListingIndex(repo)
 
     # Get the dates for the last 7 days.
-    dates = [
-        (
-            datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=i)
-        ).strftime('%Y%m%d')
-        for i in range(7)
-    ]
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    dates = [today - datetime.timedelta(days=i) for i in range(DAYS)]
 
-    files = list()
+    days = list()
 
     logging.info('Fetching object list...')
-    # For each day, grab the objects from the S3 bucket.
     for date in dates:
-        date_objects = s3.objects.filter(Prefix=f'raw/{date}/').all()
-        # Filter for objects from the requested test and only fetch JSONL files.
-        for object_summary in date_objects:
-            key = object_summary.key
-            key_split = key.split('/')
-            if len(key_split) != 6:
-                logging.warning(f'Malformed key: {key}')
-                continue
-            test = key_split[4]
-            object_name = key_split[5]
-            if test != test_name or not object_name.endswith('.jsonl.gz'):
-                continue
-            dest_file = os.path.join(tmpdir, object_name)
-            files.append((key, dest_file))
+        objects = index.get_objects(date, test_name)
+        final = index.is_final(date, index.get_day(date)['listed_at'])
+        days.append((date.strftime('%Y%m%d'), final, objects))
+    index.log_stats()
+    index.prune(dates[-1])
+    return days
+
+
+def iter_lines(repo: str, key: str) -> Iterator[bytes]:
+    """Stream a .jsonl.gz object and yield the decompressed lines without writing
+    anything to disk.
+
+    Must be called from a worker process initialized with init_worker.
 
-    logging.info(f'Fetching {len(files)} objects with {PARALLEL_DOWNLOADS} processes in parallel...')
-    # Download and extract the files.
-    with Pool(PARALLEL_DOWNLOADS) as p:
-        p.map(process, files)
+    Args:
+        repo (str): S3 bucket
+        key (str): Object key
+    """
+    body = s3.get_object(Bucket=repo, Key=key)['Body']
+    try:
+        with gzip.GzipFile(fileobj=body) as f:
+            yield from f
+    finally:
+        body.close()
@@ -1,13 +1,8 @@
 import argparse
-import ipaddress
 import logging
 import sys
-from collections import defaultdict
-from urllib.parse import urlparse
 
-import tldextract
-
-from iyp.crawlers.ooni import OoniCrawler, process_dns_queries
+from iyp.crawlers.ooni import OoniCrawler, parse_url, process_dns_queries
 
 ORG = 'OONI'
 URL = 's3://ooni-data-eu-fra/raw/'
@@ -35,7 +30,6 @@ class Crawler(OoniCrawler):
         if 'blocking' not in test_keys or 'accessible' not in test_keys:
             report_id = one_line.get('report_id')
             logging.warning(f'Skipping entry with missing keys {report_id=}')
-            self.all_results.pop()
             return
         blocking = test_keys['blocking']
         accessible = test_keys['accessible']
@@ -44,18 +38,10 @@ class Crawler(OoniCrawler):
             logging.warning(f'No HTTP URL: {input_url}')
 
         # Extract the hostname from the URL if it's not an IP address
-        try:
-            hostname = urlparse(input_url).hostname
-        except ValueError as e:
-            logging.error(f'Failed to extract hostname from URL "{input_url}": {e}')
-            self.all_results.pop()
+        parsed_url = parse_url(input_url)
+        if parsed_url is None:
             return
-        try:
-            hostname = ipaddress.ip_address(hostname).compressed
-            hostname_is_ip = True
-        except ValueError:
-            hostname = tldextract.extract(input_url).fqdn
-            hostname_is_ip = False
+        hostname, hostname_is_ip = parsed_url
 
         host_ip_set = set()
         if not hostname_is_ip:
@@ -65,7 +51,6 @@ class Crawler(OoniCrawler):
                 host_ip_set = process_dns_queries(test_keys['queries'])
             except KeyError:
                 logging.warning(f'No DNS resolution for URL: {input_url}')
-                self.all_results.pop()
                 return
 
         # Determine the result based on the table
@@ -87,16 +72,12 @@ class Crawler(OoniCrawler):
         else:
             result = 'anomaly'  # Default case if no other case matches
 
-        # Using the last result from the base class, add our unique variables
         self.all_urls.add(input_url)
         if hostname_is_ip:
             self.all_ip_urls.add((hostname, input_url))
         else:
             self.all_hostname_ips.update(host_ip_set)
-        self.all_results[-1] = self.all_results[-1] + (
-            input_url,
-            result,
-        )
+        self.add_result(self.current_probe + (input_url,), result)
 
     def batch_add_to_iyp(self):
         super().batch_add_to_iyp()
@@ -155,17 +136,6 @@ class Crawler(OoniCrawler):
         self.iyp.batch_add_links('RESOLVES_TO', resolves_to_links)
         self.iyp.batch_add_links('PART_OF', part_of_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-
-        # Populate the target_dict with counts
-        for entry in self.all_results:
-            asn, country, target, result = entry
-            target_dict[(asn, country, target)][result] += 1
-
-        for (asn, country, target), counts in target_dict.items():
-            self.all_percentages[(asn, country, target)] = self.make_result_dict(counts)
-
     def unit_test(self):
         return super().unit_test(['CENSORED', 'RESOLVES_TO', 'PART_OF', 'COUNTRY'])
 
@@ -173,6 +143,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -188,6 +159,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
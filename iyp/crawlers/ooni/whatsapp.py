@@ -1,7 +1,6 @@
 import argparse
 import logging
 import sys
-from collections import defaultdict
 
 from iyp.crawlers.ooni import OoniCrawler
 
@@ -49,8 +48,8 @@ class Crawler(OoniCrawler):
             or web_result == 'web_blocked'
         ):
             total = 'total_blocked'
-        # Update the last entry in all_results with the new test-specific data
-        self.all_results[-1] = self.all_results[-1] + (
+        self.add_result(
+            self.current_probe,
             total,
             server_result,
             endpoint_result,
@@ -79,19 +78,8 @@ class Crawler(OoniCrawler):
 
         self.iyp.batch_add_links('CENSORED', censored_links)
 
-    def aggregate_results(self):
-        target_dict = defaultdict(lambda: defaultdict(int))
-
-        for entry in self.all_results:
-            asn, country, total, server_result, endpoint_result, web_result = entry
-            target_dict[(asn, country)][total] += 1
-            target_dict[(asn, country)][server_result] += 1
-            target_dict[(asn, country)][endpoint_result] += 1
-            target_dict[(asn, country)][web_result] += 1
-
-        for (asn, country), counts in target_dict.items():
-            total_count = counts['total_ok'] + counts['total_blocked']
-            self.all_percentages[(asn, country)] = self.make_result_dict(counts, total_count)
+    def get_total_count(self, counts: dict):
+        return counts.get('total_ok', 0) + counts.get('total_blocked', 0)
 
     def unit_test(self):
         return super().unit_test(['CENSORED'])
@@ -100,6 +88,7 @@ class Crawler(OoniCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -115,6 +104,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
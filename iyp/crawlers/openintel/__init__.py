@@ -6,31 +6,79 @@ import logging
 import os
 import tempfile
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from ipaddress import IPv6Address
+from typing import Iterable
 from urllib.parse import quote
 
 import arrow
 import boto3
 import botocore
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import requests
 from bs4 import BeautifulSoup
 
-from iyp import BaseCrawler, DataNotAvailableError
+from iyp import BaseCrawler, DataNotAvailableError, ObjectCache
 
 # credentials
 OPENINTEL_ACCESS_KEY = ''
 OPENINTEL_SECRET_KEY = ''
+PARALLEL_DOWNLOADS = 4
+PARALLEL_DATASETS = 4
 
 if os.path.exists('config.json'):
     config = json.load(open('config.json', 'r'))
     OPENINTEL_ACCESS_KEY = config['openintel']['access_key']
     OPENINTEL_SECRET_KEY = config['openintel']['secret_key']
+    PARALLEL_DOWNLOADS = config['openintel'].get('parallel_downloads', PARALLEL_DOWNLOADS)
+    PARALLEL_DATASETS = config['openintel'].get('parallel_datasets', PARALLEL_DATASETS)
 
 REF_URL_DATA = 'https://openintel.nl/download/forward-dns/basis=toplist/source={dataset}/year=%Y/month=%m/day=%d'
 
 S3A_OPENINTEL_ENDPOINT = 'https://object.openintel.nl'
+# OpenINTEL measurement data objects base prefixes
+PUBLIC_WAREHOUSE_PREFIX = 'fdns/basis=toplist'
+CLOSED_WAREHOUSE_PREFIX = 'catalog/warehouse/fdns/data'
+# Number of days to look back for the latest available data.
+MAX_LOOKBACK_IN_DAYS = 6
+
+# Number of rows read at once from dnsgraph connection files.
+DNSGRAPH_CHUNK_SIZE = 1000000
+CONNECTION_KEY_COLUMNS = ['from_nodeType', 'from_nodeKey', 'to_nodeType', 'to_nodeKey', 'relation_name']
+
+PARQUET_COLUMNS = [
+    'query_type',
+    'query_name',
+    'response_type',
+    'response_name',
+    'ip4_address',
+    'ip6_address',
+    'ns_address',
+    'cname_name',
+]
+# Select A, AAAA, and NS mappings from the measurement data
+PARQUET_FILTER = (
+    pc.field('query_type').isin(['A', 'AAAA', 'NS']) &
+    pc.field('response_type').isin(['A', 'AAAA', 'NS', 'CNAME']) &
+    # Filter missing addresses (there is at least one...)
+    (
+        pc.field('ip4_address').is_valid() |
+        pc.field('ip6_address').is_valid() |
+        pc.field('ns_address').is_valid() |
+        pc.field('cname_name').is_valid()
+    )
+)
+# Names repeat a lot, so keep them dictionary encoded in memory.
+PARQUET_FORMAT = ds.ParquetFileFormat(
+    read_options=ds.ParquetReadOptions(
+        dictionary_columns={'query_type', 'query_name', 'response_type', 'response_name', 'ns_address', 'cname_name'}
+    )
+)
 
 
 class OpenIntelCrawler(BaseCrawler):
@@ -41,9 +89,7 @@ class OpenIntelCrawler(BaseCrawler):
         self.datasets = datasets
         super().__init__(organization, url, name)
         self.reference['reference_url_info'] = 'https://openintel.nl/data/forward-dns/top-lists/'
-        self.warehouse_bucket = None
-        self.fdns_warehouse_s3 = str()
-        self.create_tmp_dir()
+        self.object_cache = ObjectCache()
 
     @staticmethod
     def fetch_crux_country_codes():
@@ -62,120 +108,138 @@ class OpenIntelCrawler(BaseCrawler):
             raise DataNotAvailableError('Failed to scrape country codes from website.')
         return country_codes
 
-    def init_public_s3_bucket(self):
-        """Initialize the S3 bucket for the public endpoint."""
-        # Get a boto3 resource
-        S3R_OPENINTEL = boto3.resource(
-            's3',
-            'nl-utwente',
-            endpoint_url=S3A_OPENINTEL_ENDPOINT,
-            config=botocore.config.Config(
-                signature_version=botocore.UNSIGNED
-            )
-        )
-
-        # Prevent some request going to AWS instead of the OpenINTEL server
-        S3R_OPENINTEL.meta.client.meta.events.unregister('before-sign.s3', botocore.utils.fix_s3_host)
+    @staticmethod
+    def get_s3_bucket(public: bool = True):
+        """Return the public or closed OpenINTEL S3 bucket.
 
-        # The OpenINTEL bucket
-        self.warehouse_bucket = S3R_OPENINTEL.Bucket('openintel-public')
-
-    def get_parquet_public(self, dataset: str):
-        """Fetch and read dataframes for the specified toplist dataset from the public
-        S3 bucket."""
-
-        self.init_public_s3_bucket()
-        # OpenINTEL measurement data objects base prefix
-        self.fdns_warehouse_s3 = 'fdns/basis=toplist'
-
-        self.fetch_warehouse_data(dataset)
-
-    def get_parquet_closed(self, dataset):
-        """Fetch and read dataframes for the specified dataset from the closed S3
-        bucket."""
-
-        # Get a boto3 resource
-        S3R_OPENINTEL = boto3.resource(
-            's3',
-            'nl-utwente',
-            aws_access_key_id=OPENINTEL_ACCESS_KEY,
-            aws_secret_access_key=OPENINTEL_SECRET_KEY,
-            endpoint_url=S3A_OPENINTEL_ENDPOINT,
-            config=botocore.config.Config(
-                signature_version='v4'
+        Only the client (bucket.meta.client) of the returned bucket is thread safe.
+        """
+        if public:
+            # Get a boto3 resource
+            S3R_OPENINTEL = boto3.resource(
+                's3',
+                'nl-utwente',
+                endpoint_url=S3A_OPENINTEL_ENDPOINT,
+                config=botocore.config.Config(
+                    signature_version=botocore.UNSIGNED
+                )
+            )
+            bucket_name = 'openintel-public'
+        else:
+            S3R_OPENINTEL = boto3.resource(
+                's3',
+                'nl-utwente',
+                aws_access_key_id=OPENINTEL_ACCESS_KEY,
+                aws_secret_access_key=OPENINTEL_SECRET_KEY,
+                endpoint_url=S3A_OPENINTEL_ENDPOINT,
+                config=botocore.config.Config(
+                    signature_version='v4'
+                )
             )
-        )
+            bucket_name = 'openintel'
 
         # Prevent some request going to AWS instead of the OpenINTEL server
         S3R_OPENINTEL.meta.client.meta.events.unregister('before-sign.s3', botocore.utils.fix_s3_host)
 
         # The OpenINTEL bucket
-        self.warehouse_bucket = S3R_OPENINTEL.Bucket('openintel')
-
-        # OpenINTEL measurement data objects base prefix
-        self.fdns_warehouse_s3 = 'catalog/warehouse/fdns/data'
-
-        self.fetch_warehouse_data(dataset, public=False)
+        return S3R_OPENINTEL.Bucket(bucket_name)
 
-    def get_parquet_crux(self):
-        """Fetch and read dataframes for CRuX toplist.
+    def get_fetch_jobs(self, dataset: str) -> list:
+        """Return the list of (dataset, bucket, prefix, public) fetch jobs required to
+        get the specified dataset.
 
-        Only get data for countries available in IYP.
+        CRuX is split into one job per country, but only for countries available in
+        IYP.
         """
-        crux_country_codes = OpenIntelCrawler.fetch_crux_country_codes()
-        logging.info(f'{len(crux_country_codes)} countries available.')
-
-        country_id = self.iyp.batch_get_nodes_by_single_prop('Country', 'country_code')
+        if dataset in ['tranco', 'umbrella']:
+            prefix = os.path.join(PUBLIC_WAREHOUSE_PREFIX, f'source={dataset}')
+            return [(dataset, self.get_s3_bucket(), prefix, True)]
+        if dataset == 'infra:ns':
+            # Closed bucket requires %-escaped dataset name
+            prefix = os.path.join(CLOSED_WAREHOUSE_PREFIX, f'source={quote(dataset)}')
+            return [(dataset, self.get_s3_bucket(public=False), prefix, False)]
+        if dataset == 'crux':
+            crux_country_codes = OpenIntelCrawler.fetch_crux_country_codes()
+            logging.info(f'{len(crux_country_codes)} countries available.')
+            country_id = self.iyp.batch_get_nodes_by_single_prop('Country', 'country_code')
+            bucket = self.get_s3_bucket()
+            prefix = os.path.join(PUBLIC_WAREHOUSE_PREFIX, 'source=crux')
+            return [(dataset, bucket, os.path.join(prefix, f'country-code={country_code}'), True)
+                    for country_code in crux_country_codes
+                    if country_code.upper() in country_id]
+        logging.error(f'Unknown dataset: {dataset}')
+        return list()
 
-        self.init_public_s3_bucket()
+    @staticmethod
+    def list_objects(bucket, prefix: str) -> list:
+        """List all objects below the prefix.
 
-        prefix = 'fdns/basis=toplist/source=crux'
-        for country_code in crux_country_codes:
-            if country_code.upper() not in country_id:
-                continue
-            logging.info(f'Fetching {country_code.upper()}')
-            self.fetch_warehouse_data('crux', os.path.join(prefix, f'country-code={country_code}'))
+        Can be called concurrently.
+        """
+        objects = list()
+        paginator = bucket.meta.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket.name, Prefix=prefix):
+            objects.extend(page.get('Contents', list()))
+        return objects
 
-    def fetch_warehouse_data(self, dataset: str, prefix: str = str(), public: bool = True):
-        """Fetch and read dataframes.
+    def find_latest_partition(self, bucket, prefix: str, public: bool = True):
+        """Find the latest (source, date)-partition below the prefix within the lookback
+        interval.
 
-        Requires initialization of the S3 bucket.
+        Objects are listed once per month and the listing is reused for all days of
+        the lookback interval.
 
-        Args:
-            prefix (str, optional): Custom filter prefix.
+        Return the date of the partition and the list of its objects, or (None, [])
+        if there is no data within the lookback interval.
         """
-        if not prefix:
-            prefix = os.path.join(self.fdns_warehouse_s3, f'source={dataset}')
-        # Get latest available data.
+        listings = dict()
         date = arrow.utcnow()
-        for lookback_days in range(6):
+        for lookback_days in range(MAX_LOOKBACK_IN_DAYS):
             # Build a partition path for the given source and date.
             # Public and closed buckets use different date formats.
             if public:
-                tmp_prefix = os.path.join(
+                month_prefix = os.path.join(
                     prefix,
                     'year={}'.format(date.year),
-                    'month={:02d}'.format(date.month),
-                    'day={:02d}'.format(date.day)
+                    'month={:02d}'.format(date.month)
                 )
+                day_prefix = os.path.join(month_prefix, 'day={:02d}'.format(date.day))
             else:
-                tmp_prefix = os.path.join(
-                    prefix,
-                    f'date={date.date().isoformat()}'
-                )
-            objects = list(self.warehouse_bucket.objects.filter(Prefix=tmp_prefix).all())
-            if len(objects) > 0:
-                break
+                month_prefix = os.path.join(prefix, f'date={date.format("YYYY-MM")}')
+                day_prefix = os.path.join(prefix, f'date={date.date().isoformat()}')
+            if month_prefix not in listings:
+                listings[month_prefix] = self.list_objects(bucket, month_prefix)
+            objects = [obj for obj in listings[month_prefix] if obj['Key'].startswith(day_prefix)]
+            if objects:
+                return date, objects
             date = date.shift(days=-1)
+        return None, list()
+
+    def fetch_warehouse_data(self, dataset: str, bucket, prefix: str, public: bool = True):
+        """Fetch and read the latest data below the prefix.
+
+        Return the date of the data and the list of Arrow tables, or (None, []) if no
+        data was found within the lookback interval.
+        Can be called concurrently.
+        """
+        date, objects = self.find_latest_partition(bucket, prefix, public)
+        if not objects:
+            return None, list()
+
+        logging.info(f'Fetching {len(objects)} object(s) of {prefix} for {date.strftime("%Y-%m-%d")}')
+
+        # Download and read objects with given (source, date)-partition prefix in
+        # parallel. map() keeps the order of objects.
+        with ThreadPoolExecutor(PARALLEL_DOWNLOADS) as executor:
+            return date, list(executor.map(lambda obj: self.fetch_parquet_object(bucket, obj), objects))
+
+    def update_reference(self, dataset: str, date: arrow.Arrow):
+        """Update the reference with the date of fetched data."""
+        mod_date = date.datetime.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+        if self.reference['reference_time_modification'] is None:
+            self.reference['reference_time_modification'] = mod_date
         else:
-            if dataset == 'crux':
-                # For CRuX not all countries have lists all the time...
-                logging.warning('Failed to find data within the specified lookback interval.')
-                return
-            logging.error('Failed to find data within the specified lookback interval.')
-            raise DataNotAvailableError('Failed to find data within the specified lookback interval.')
-        self.reference['reference_time_modification'] = \
-            date.datetime.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+            self.reference['reference_time_modification'] = max(mod_date, self.reference['reference_time_modification'])
 
         if dataset in ['tranco', 'umbrella']:
             # Set data URL for public datasets.
@@ -186,94 +250,178 @@ class OpenIntelCrawler(BaseCrawler):
             self.reference['reference_url_data'] = \
                 'https://openintel.nl/download/forward-dns/basis=toplist/source=crux/'
 
-        logging.info(f'Fetching data for {date.strftime("%Y-%m-%d")}')
-
-        # Iterate objects in bucket with given (source, date)-partition prefix
-        for i_obj in objects:
-
-            # Open a temporary file to download the Parquet object into
-            with tempfile.NamedTemporaryFile(mode='w+b',
-                                             dir=self.get_tmp_dir(),
-                                             prefix='{}.'.format(date.date().isoformat()),
-                                             suffix='.parquet',
-                                             delete=False) as tempFile:
-                logging.info("Opened temporary file for object download: '{}'.".format(tempFile.name))
-                self.warehouse_bucket.download_fileobj(
-                    Key=i_obj.key, Fileobj=tempFile,
-                    Config=boto3.s3.transfer.TransferConfig(multipart_chunksize=128 * 1024 * 1024)
-                )
-                logging.info("Downloaded '{}' [{:.2f}MiB] into '{}'.".format(
-                    os.path.join(S3A_OPENINTEL_ENDPOINT, self.warehouse_bucket.name, i_obj.key),
-                    os.path.getsize(tempFile.name) / (1024 * 1024),
-                    tempFile.name
-                ))
-                # For some files read_parquet() fails without this...
-                tempFile.flush()
-                # Use Pandas to read file into a DF and append to list
-                self.pandas_df_list.append(
-                    pd.read_parquet(tempFile.name,
-                                    columns=[
-                                        'query_type',
-                                        'query_name',
-                                        'response_type',
-                                        'response_name',
-                                        'ip4_address',
-                                        'ip6_address',
-                                        'ns_address',
-                                        'cname_name',
-                                    ])
-                )
+    def fetch_datasets(self):
+        """Fetch and read all datasets into self.parquet_tables.
+
+        Datasets (and CRuX countries) are fetched concurrently. Results are consumed in
+        order as soon as they are available, while later datasets are still being
+        fetched.
+        """
+        jobs = [job for dataset in self.datasets for job in self.get_fetch_jobs(dataset)]
+        with ThreadPoolExecutor(PARALLEL_DATASETS) as executor:
+            results = executor.map(lambda job: self.fetch_warehouse_data(*job), jobs)
+            for (dataset, bucket, prefix, public), (date, tables) in zip(jobs, results):
+                if not tables:
+                    if dataset == 'crux':
+                        # For CRuX not all countries have lists all the time...
+                        logging.warning(f'Failed to find data for {prefix} within the specified lookback interval.')
+                        continue
+                    logging.error(f'Failed to find data for {prefix} within the specified lookback interval.')
+                    executor.shutdown(cancel_futures=True)
+                    raise DataNotAvailableError('Failed to find data within the specified lookback interval.')
+                self.update_reference(dataset, date)
+                self.parquet_tables.extend(tables)
+        self.object_cache.log_stats()
+
+        if not self.parquet_tables:
+            logging.error('Failed to get any valid data.')
+            raise DataNotAvailableError('Failed to get any valid data.')
+
+    def fetch_parquet_object(self, bucket, obj: dict) -> pa.Table:
+        """Download a Parquet object from the warehouse bucket, or get it from the
+        local object cache, and read the relevant rows and columns.
+
+        Can be called concurrently.
+        """
+        def download(fileobj):
+            # Resources are not thread safe, but clients are.
+            bucket.meta.client.download_fileobj(
+                Bucket=bucket.name, Key=obj['Key'], Fileobj=fileobj,
+                Config=boto3.s3.transfer.TransferConfig(multipart_chunksize=128 * 1024 * 1024)
+            )
+            logging.info("Downloaded '{}' [{:.2f}MiB].".format(
+                os.path.join(S3A_OPENINTEL_ENDPOINT, bucket.name, obj['Key']),
+                obj['Size'] / (1024 * 1024)
+            ))
+
+        path = self.object_cache.fetch(bucket.name, obj['Key'], obj['ETag'], obj['Size'], download)
+        return self.read_parquet_file(path)
+
+    @staticmethod
+    def read_parquet_file(path: str) -> pa.Table:
+        """Read A, AAAA, and NS mappings from a Parquet file.
+
+        The row filter is pushed down to the Parquet reader and name columns are
+        dictionary encoded, so irrelevant rows are never materialized.
+        """
+        return ds.dataset(path, format=PARQUET_FORMAT).to_table(columns=PARQUET_COLUMNS, filter=PARQUET_FILTER)
+
+    @staticmethod
+    def normalize_ipv6_addresses(addresses: Iterable) -> dict:
+        """Return a map from IPv6 addresses to their normalized form.
+
+        Invalid addresses are logged and not included in the map.
+        """
+        ipv6_map = dict()
+        for ip in addresses:
+            try:
+                ipv6_map[ip] = IPv6Address(ip).compressed
+            except ValueError as e:
+                logging.error(f'Ignoring invalid IPv6 address "{ip}": {e}')
+        return ipv6_map
+
+    @staticmethod
+    def compute_resolves_to(df: pd.DataFrame, cname_df: pd.DataFrame, host_id: dict, ip4_id: dict, ip6_id: dict,
+                            ipv6_map: dict) -> dict:
+        """Compute RESOLVES_TO links for A/AAAA records, including the transitive links
+        caused by CNAME chains.
+
+        Chains are expanded for all records at once by iteratively joining the records
+        with the CNAME responses of the same query. Each iteration goes one step back in
+        the chain, until the beginning of the chain is reached (see run() for details).
+
+        Return a dict mapping (host_qid, ip_qid) tuples to a dict containing the list of
+        record types ('A', 'AAAA', 'CNAME') that resulted in the link, in the order in
+        which they appear in the data.
+        """
+        records = df.loc[df.response_type.isin(['A', 'AAAA']),
+                         ['query_name', 'query_type', 'response_type', 'response_name', 'ip4_address', 'ip6_address']]
+        records = records.reset_index(drop=True)
+        is_ipv4 = records.response_type == 'A'
+        records['ip'] = records['ip4_address'].where(is_ipv4, records['ip6_address'])
+        records = records[records.ip.notnull()]
+        is_ipv4 = records.response_type == 'A'
+        records['ip_qid'] = pd.concat([
+            records.loc[is_ipv4, 'ip'].map(ip4_id),
+            # Invalid IPv6 addresses are not in the map and are dropped below.
+            records.loc[~is_ipv4, 'ip'].map(ipv6_map).map(ip6_id)
+        ])
+        records = records[records.ip_qid.notnull()]
+        # The position of the record is used to keep the order of sources consistent.
+        records['pos'] = records.index
+
+        events = [pd.DataFrame({'pos': records['pos'],
+                                'step': 0,
+                                'host': records['response_name'],
+                                'ip_qid': records['ip_qid'],
+                                'source': records['response_type']})]
+
+        # Map (query_name, query_type, cname_name) to response_name, i.e., how to go
+        # back one step in the chain. For a single query name / query type combination
+        # the chain should not branch, so keep only the last entry like a dict would.
+        back_links = cname_df.loc[cname_df.cname_name.notnull(),
+                                  ['query_name', 'query_type', 'cname_name', 'response_name']]
+        back_links = back_links.drop_duplicates(['query_name', 'query_type', 'cname_name'], keep='last')
+        back_links = back_links.rename(columns={'cname_name': 'name', 'response_name': 'up'})
+        # An acyclic chain can not be longer than the number of CNAMEs of its query.
+        max_chain_length = 0
+        if not back_links.empty:
+            max_chain_length = back_links.groupby(['query_name', 'query_type']).size().max()
+
+        frontier = records[['pos', 'query_name', 'query_type', 'response_type', 'response_name', 'ip', 'ip_qid']]
+        frontier = frontier.assign(name=frontier['response_name'])
+        broken = list()
+        step = 0
+        while not frontier.empty:
+            step += 1
+            merged = frontier.merge(back_links, on=['query_name', 'query_type', 'name'], how='left')
+            chain_end = merged[merged.up.isnull()]
+            broken.append(chain_end[chain_end['name'] != chain_end['query_name']])
+            frontier = merged[merged.up.notnull()].drop(columns='name').rename(columns={'up': 'name'})
+            if step > max_chain_length:
+                for row in frontier.itertuples():
+                    logging.warning(f'CNAME loop for {row.response_type} record {row.query_name} -> {row.ip}.')
+                break
+            events.append(pd.DataFrame({'pos': frontier['pos'],
+                                        'step': step,
+                                        'host': frontier['name'],
+                                        'ip_qid': frontier['ip_qid'],
+                                        'source': 'CNAME'}))
+
+        if broken:
+            for row in pd.concat(broken).sort_values('pos').itertuples():
+                logging.warning(f'Broken CNAME chain for {row.response_type} record {row.query_name} -> {row.ip}. '
+                                f'Last CNAME: {row.name}')
+
+        # The would like a set for 'source', but neo4j does not support set properties
+        # and converting it afterwards would require a copy of all links, so use a list
+        # instead. Will be max 2 entries.
+        events = pd.concat(events, ignore_index=True).sort_values(['pos', 'step'], kind='stable')
+        events = events.drop_duplicates(['host', 'ip_qid', 'source'])
+        host_qids = events['host'].map(host_id).tolist()
+        unique_res = dict()
+        for link, source in zip(zip(host_qids, events['ip_qid'].tolist()), events['source'].tolist()):
+            if link in unique_res:
+                unique_res[link]['source'].append(source)
+            else:
+                unique_res[link] = {'source': [source]}
+        return unique_res
 
     def run(self):
         """Fetch the forward DNS data, populate a data frame, and process lines one by
         one."""
-        self.pandas_df_list = list()  # List of Parquet file-specific Pandas DataFrames
-
-        for dataset in self.datasets:
-            attempt = 5
-            list_past_len = len(self.pandas_df_list)
-
-            while len(self.pandas_df_list) == list_past_len and attempt > 0:
-                if dataset == 'tranco':
-                    self.get_parquet_public(dataset)
-                elif dataset == 'umbrella':
-                    self.get_parquet_public(dataset)
-                elif dataset == 'infra:ns':
-                    # Closed bucket requires %-escaped dataset name
-                    self.get_parquet_closed(quote(dataset))
-                elif dataset == 'crux':
-                    self.get_parquet_crux()
-                attempt -= 1
+        self.parquet_tables = list()  # List of Parquet file-specific Arrow tables
+        self.fetch_datasets()
 
         if self.name == 'openintel.toplist':
             # This crawler combines multiple toplists, so no single data URL.
             self.reference['reference_url_data'] = 'https://openintel.nl/download/forward-dns/basis=toplist/'
 
-        # Concatenate Parquet file-specific DFs
-        pandas_df = pd.concat(self.pandas_df_list)
-
-        # Select A, AAAA, and NS mappings from the measurement data
-        df = pandas_df[
-            (
-                (pandas_df.query_type == 'A') |
-                (pandas_df.query_type == 'AAAA') |
-                (pandas_df.query_type == 'NS')
-
-            ) &
-            (
-                (pandas_df.response_type == 'A') |
-                (pandas_df.response_type == 'AAAA') |
-                (pandas_df.response_type == 'NS') |
-                (pandas_df.response_type == 'CNAME')
-            ) &
-            # Filter missing addresses (there is at least one...)
-            (
-                (pandas_df.ip4_address.notnull()) |
-                (pandas_df.ip6_address.notnull()) |
-                (pandas_df.ns_address.notnull()) |
-                (pandas_df.cname_name.notnull())
-            )
-        ].drop_duplicates()
+        # Concatenate Parquet file-specific tables. A, AAAA, and NS mappings were
+        # already selected while reading the files.
+        nb_files = len(self.parquet_tables)
+        df = pa.concat_tables(self.parquet_tables, promote_options='default').to_pandas().drop_duplicates()
+        del self.parquet_tables
 
         # Remove root '.' from fields.
         df.query_name = df.query_name.str[:-1]
@@ -281,7 +429,7 @@ class OpenIntelCrawler(BaseCrawler):
         df.ns_address = df.ns_address.astype('string').map(lambda x: x[:-1] if not pd.isna(x) else None)
         df.cname_name = df.cname_name.astype('string').map(lambda x: x[:-1] if not pd.isna(x) else None)
 
-        logging.info(f'Read {len(df)} unique records from {len(self.pandas_df_list)} Parquet file(s).')
+        logging.info(f'Read {len(df)} unique records from {nb_files} Parquet file(s).')
 
         # response_names for NS records are domain names
         domain_names = set(df[df.response_type == 'NS']['response_name'])
@@ -292,15 +440,9 @@ class OpenIntelCrawler(BaseCrawler):
         # response_name for A and AAAA records are host names
         host_names = set(df[(df.response_type == 'A') | (df.response_type == 'AAAA')]['response_name'])
 
-        ipv6_addresses = set()
         # Normalize IPv6 addresses.
-        for ip in df[df.ip6_address.notnull()]['ip6_address']:
-            try:
-                ip_normalized = IPv6Address(ip).compressed
-            except ValueError as e:
-                logging.error(f'Ignoring invalid IPv6 address "{ip}": {e}')
-                continue
-            ipv6_addresses.add(ip_normalized)
+        ipv6_map = self.normalize_ipv6_addresses(df[df.ip6_address.notnull()]['ip6_address'].unique())
+        ipv6_addresses = set(ipv6_map.values())
 
         # Handle CNAME entries.
         # A query where the result is obtained via a CNAME is indicated by a
@@ -323,22 +465,15 @@ class OpenIntelCrawler(BaseCrawler):
         # The dataset also contains CNAME chains that do not resolve to an IP (i.e., no
         # response with type A/AAAA exists), so we need to filter these out.
 
-        # Get the components of CNAME chains for queries that successfully resolved.
-        cnames = defaultdict(dict)
         # There are cases where NS queries receive a CNAME response, which we want to
         # ignore.
-        for row in df[(df.query_type.isin(['A', 'AAAA'])) & (df.response_type == 'CNAME')].itertuples():
-            # Keep track of how to go back from a CNAME to the response / query name.
-            # We use this to rebuild a CNAME chain from an A/AAAA record to its initial
-            # query name.
-            # Using a dict here works since for a single query name / query type
-            # combination there are no branches.
-            cnames[(row.query_name, row.query_type)][row.cname_name] = row.response_name
-
-            # Also need to create HostName nodes for all CNAME entries
-            # Warning: these hostnames could be not resolving to an IP!
-            host_names.add(row.query_name)
-            host_names.add(row.cname_name)
+        cname_df = df[(df.query_type.isin(['A', 'AAAA'])) & (df.response_type == 'CNAME')]
+
+        # Also need to create HostName nodes for all CNAME entries
+        # Warning: these hostnames could be not resolving to an IP!
+        host_names.update(cname_df['query_name'].unique())
+        host_names.update(cname_df['response_name'].unique())
+        host_names.update(cname_df[cname_df.cname_name.notnull()]['cname_name'].unique())
 
         # Get/create all nodes:
         domain_id = self.iyp.batch_get_nodes_by_single_prop('DomainName',
@@ -358,80 +493,20 @@ class OpenIntelCrawler(BaseCrawler):
                      f'{len(ip4_id)} IPv4, {len(ip6_id)} IPv6')
 
         # Compute links
-        mng_links = list()
-        partof_links = list()
-        unique_alias = set()
-        # The would like a set for 'source', but neo4j does not support set properties
-        # and converting it afterwards would require a copy of all links, so use a list
-        # instead. Will be max 2 entries, so lookup should not be terrible.
-        unique_res = defaultdict(lambda: {'source': list()})
-
-        # RESOLVES_TO and MANAGED_BY links
-        for row in df[(df.response_type.isin(['NS', 'A', 'AAAA', 'CNAME']))].itertuples():
-
-            # NS Record
-            if row.response_type == 'NS' and row.ns_address:
-                domain_qid = domain_id[row.response_name]
-                ns_qid = ns_id[row.ns_address]
-                mng_links.append({'src_id': domain_qid, 'dst_id': ns_qid, 'props': [self.reference]})
-
-            # We first add the actual A/AAAA records, for which the host name is
-            # indicated by the response name. This can be different from the query name
-            # in case of CNAME entries.
-            # The transitive RESOLVES_TO entries caused by CNAMES are added
-            # based on the cnames dictionary.
-            # A Record
-            elif row.response_type == 'A' and row.ip4_address:
-                host_qid = host_id[row.response_name]
-                ip_qid = ip4_id[row.ip4_address]
-                if row.response_type not in unique_res[(host_qid, ip_qid)]['source']:
-                    unique_res[(host_qid, ip_qid)]['source'].append(row.response_type)
-
-                # CNAME: Add the RESOLVES_TO link for the corresponding cnames
-                cname = row.response_name
-
-                while cname in cnames[(row.query_name, row.query_type)]:
-                    up = cnames[(row.query_name, row.query_type)][cname]
-                    host_qid = host_id[up]
-                    if 'CNAME' not in unique_res[(host_qid, ip_qid)]['source']:
-                        unique_res[(host_qid, ip_qid)]['source'].append('CNAME')
-                    cname = up
-
-                if cname != row.query_name:
-                    logging.warning(f'Broken CNAME chain for A record {row.query_name} -> {row.ip4_address}. '
-                                    f'Last CNAME: {cname}')
-
-            # AAAA Record
-            elif row.response_type == 'AAAA' and row.ip6_address:
-                try:
-                    ip_normalized = IPv6Address(row.ip6_address).compressed
-                except ValueError:
-                    # Error message was already logged above.
-                    continue
-                host_qid = host_id[row.response_name]
-                ip_qid = ip6_id[ip_normalized]
-                if row.response_type not in unique_res[(host_qid, ip_qid)]['source']:
-                    unique_res[(host_qid, ip_qid)]['source'].append(row.response_type)
-
-                # CNAME: Add the RESOLVES_TO link for the corresponding cnames
-                cname = row.response_name
-                while cname in cnames[(row.query_name, row.query_type)]:
-                    up = cnames[(row.query_name, row.query_type)][cname]
-                    host_qid = host_id[up]
-                    if 'CNAME' not in unique_res[(host_qid, ip_qid)]['source']:
-                        unique_res[(host_qid, ip_qid)]['source'].append('CNAME')
-                    cname = up
-
-                if cname != row.query_name:
-                    logging.warning(f'Broken CNAME chain for AAAA record {row.query_name} -> {row.ip6_address}. '
-                                    f'Last CNAME: {cname}')
-
-            # CNAME Record
-            elif row.response_type == 'CNAME' and row.query_type in ['A', 'AAAA']:
-                host_qid = host_id[row.response_name]
-                cname_qid = host_id[row.cname_name]
-                unique_alias.add((host_qid, cname_qid))
+        # MANAGED_BY links
+        ns_df = df[(df.response_type == 'NS') & (df.ns_address.notnull()) & (df.ns_address != '')]
+        mng_links = [{'src_id': domain_qid, 'dst_id': ns_qid, 'props': [self.reference]}
+                     for domain_qid, ns_qid in zip(ns_df['response_name'].map(domain_id),
+                                                   ns_df['ns_address'].map(ns_id))]
 
+        # ALIAS_OF links
+        alias_df = cname_df[cname_df.cname_name.notnull()]
+        unique_alias = set(zip(alias_df['response_name'].map(host_id), alias_df['cname_name'].map(host_id)))
+
+        # RESOLVES_TO links
+        unique_res = self.compute_resolves_to(df, cname_df, host_id, ip4_id, ip6_id, ipv6_map)
+
+        partof_links = list()
         # PART_OF links between HostNames and DomainNames
         for hd in host_names.intersection(domain_names):
             partof_links.append({'src_id': host_id[hd], 'dst_id': domain_id[hd], 'props': [self.reference]})
@@ -455,13 +530,14 @@ class DnsgraphCrawler(BaseCrawler):
         super().__init__(organization, url, name)
         self.reference['reference_url_info'] = 'https://dnsgraph.dacs.utwente.nl'
         self.datasets = datasets
-        self.pandas_df_list = list()
-
-    @staticmethod
-    def remove_root(name):
-        if name == '.':
-            return name
-        return name.rstrip('.')
+        self.object_cache = ObjectCache()
+        # Data frame of the unique connections read so far (see read_connections).
+        self.connections = None
+        # Downloaded files that are not in the object cache and are removed after use.
+        self.uncached_files = set()
+        self.unique_domain_names = set()
+        self.unique_host_names = set()
+        self.unique_ips = set()
 
     @staticmethod
     def normalize_ipv6(address):
@@ -481,8 +557,9 @@ class DnsgraphCrawler(BaseCrawler):
             state[target].update(ips)
             DnsgraphCrawler.recurse_cnames(target, cnames, ips, state, processed_cnames)
 
-    def get_connections(self, dataset: str):
-        logging.info(f'Fetching dataset "{dataset}"')
+    def get_lookback_candidates(self, dataset: str):
+        """Yield (base_url, modification date) candidates for the dataset, from the
+        most recent to the oldest one within the lookback interval."""
         if dataset == 'crux':
             # CRuX data is available monthly.
             max_lookback_in_months = 2
@@ -491,20 +568,11 @@ class DnsgraphCrawler(BaseCrawler):
             month = current_date.month
             for lookback in range(0, max_lookback_in_months + 1):
                 base_url = f'{self.reference["reference_url_data"]}/{dataset.upper()}/year={year}/month={month:02d}'
-                probe_url = f'{base_url}/connections.json.gz'
-                logging.info(probe_url)
-                if requests.head(probe_url).ok:
-                    logging.info(base_url)
-                    logging.info(f'Using year={year}/month={month:02d}')
-                    break
+                yield base_url, datetime(year, month, 1, tzinfo=timezone.utc)
                 month -= 1
                 if month == 0:
                     month = 12
                     year -= 1
-            else:
-                logging.error('Failed to find data within the specified lookback interval.')
-                return
-            mod_date = datetime(year, month, 1, tzinfo=timezone.utc)
         else:
             max_lookback_in_weeks = 1
             for lookback in range(0, max_lookback_in_weeks + 1):
@@ -512,69 +580,168 @@ class DnsgraphCrawler(BaseCrawler):
                 year = current_date.strftime('%Y')
                 week = current_date.strftime('%U')
                 base_url = f'{self.reference["reference_url_data"]}/{dataset.upper()}/year={year}/week={week}'
-                probe_url = f'{base_url}/connections.json.gz'
-                if requests.head(probe_url).ok:
-                    logging.info(base_url)
-                    logging.info(f'Using year={year}/week={week} ({current_date.strftime("%Y-%m-%d")})')
-                    break
-            else:
-                logging.error('Failed to find data within the specified lookback interval.')
-                return
-
-            # Shift to Monday and set to midnight.
-            mod_date = (current_date - timedelta(days=current_date.weekday())).replace(hour=0,
-                                                                                       minute=0,
-                                                                                       second=0,
-                                                                                       microsecond=0)
-        if self.reference['reference_time_modification'] is None:
-            self.reference['reference_time_modification'] = mod_date
-        else:
-            self.reference['reference_time_modification'] = max(mod_date, self.reference['reference_time_modification'])
-        logging.info('Reading connections')
-        self.pandas_df_list.append(pd.read_json(f'{base_url}/connections.json.gz', lines=True))
-        logging.info(f'Read {len(self.pandas_df_list[-1])} rows')
-
-    @staticmethod
-    def row_generator(data: dict):
-        for k, v in data.items():
-            for r in v:
-                yield (*k, r)
+                # Shift to Monday and set to midnight.
+                mod_date = (current_date - timedelta(days=current_date.weekday())).replace(hour=0,
+                                                                                           minute=0,
+                                                                                           second=0,
+                                                                                           microsecond=0)
+                yield base_url, mod_date
+
+    def fetch_connections(self, dataset: str):
+        """Find the latest connections file of the dataset and download it to the
+        local object cache.
+
+        Return the path of the file and its modification date, or (None, None) if no
+        data was found within the lookback interval.
+        Can be called concurrently.
+        """
+        logging.info(f'Fetching dataset "{dataset}"')
+        for base_url, mod_date in self.get_lookback_candidates(dataset):
+            probe_url = f'{base_url}/connections.json.gz'
+            probe = requests.head(probe_url)
+            if probe.ok:
+                logging.info(f'Using {base_url}')
+                return self.fetch_connections_file(probe_url, probe), mod_date
+        logging.error(f'Failed to find data for dataset "{dataset}" within the specified lookback interval.')
+        return None, None
+
+    def get_connections(self):
+        """Fetch all datasets and read their connections.
+
+        Datasets are downloaded concurrently, and each dataset is read as soon as it
+        is available while later datasets are still being downloaded.
+        """
+        try:
+            with ThreadPoolExecutor(PARALLEL_DATASETS) as executor:
+                for dataset, (path, mod_date) in zip(self.datasets,
+                                                     executor.map(self.fetch_connections, self.datasets)):
+                    if path is None:
+                        continue
+                    if self.reference['reference_time_modification'] is None:
+                        self.reference['reference_time_modification'] = mod_date
+                    else:
+                        self.reference['reference_time_modification'] = \
+                            max(mod_date, self.reference['reference_time_modification'])
+                    logging.info(f'Reading connections of dataset "{dataset}"')
+                    self.read_connections(path)
+                    if path in self.uncached_files:
+                        os.remove(path)
+                        self.uncached_files.remove(path)
+        finally:
+            # Remove uncached downloads that were not read because of an error.
+            for path in self.uncached_files:
+                os.remove(path)
+            self.uncached_files.clear()
+        self.object_cache.log_stats()
+
+    def fetch_connections_file(self, url: str, head_response: requests.Response) -> str:
+        """Download the connections file to the local object cache and return its
+        path.
+
+        The cache identifies versions of the file by the ETag and Content-Length
+        headers. If one of them is missing, the cache is bypassed and the file is
+        downloaded to a temporary file, which is added to self.uncached_files.
+        """
+        etag = head_response.headers.get('ETag')
+        size = head_response.headers.get('Content-Length')
+
+        def download(fileobj):
+            with requests.get(url, stream=True) as r:
+                r.raise_for_status()
+                for data in r.iter_content(chunk_size=1024 * 1024):
+                    fileobj.write(data)
+            logging.info(f'Downloaded {url} [{fileobj.tell() / (1024 * 1024):.2f}MiB].')
+
+        if etag is None or size is None:
+            logging.warning(f'Missing ETag or Content-Length header for {url}, not using the object cache.')
+            with tempfile.NamedTemporaryFile(mode='w+b', suffix='.json.gz', delete=False) as f:
+                try:
+                    download(f)
+                except Exception:
+                    f.close()
+                    os.remove(f.name)
+                    raise
+            self.uncached_files.add(f.name)
+            return f.name
+        return self.object_cache.fetch('dnsgraph', url, etag, int(size), download)
+
+    def normalize_chunk(self, chunk: pd.DataFrame) -> None:
+        """Remove root "." from names and normalize IPv6 addresses in place."""
+        for node_type, node_key in [('from_nodeType', 'from_nodeKey'), ('to_nodeType', 'to_nodeKey')]:
+            # Remove root "." from names that are not the root.
+            # Currently there are only DOMAIN and HOSTNAME entries in from_nodeType, but
+            # maybe that changes in the future.
+            is_name = chunk[node_type].isin(('DOMAIN', 'HOSTNAME'))
+            names = chunk.loc[is_name, node_key]
+            chunk.loc[is_name, node_key] = names.where(names == '.', names.str.rstrip('.'))
+            # Normalize IPv6 addresses.
+            is_ip = chunk[node_type] == 'IP'
+            chunk.loc[is_ip, node_key] = chunk.loc[is_ip, node_key].map(self.normalize_ipv6)
+
+    def read_connections(self, path: str) -> None:
+        """Read a connections file in chunks and append the connections that were not
+        seen before to self.connections.
+
+        Properties are only kept as canonical (sorted keys) JSON strings, and node keys
+        are accumulated per node type, so memory usage scales with the number of
+        unique connections instead of the number of rows.
+        """
+        key_columns = CONNECTION_KEY_COLUMNS + ['properties_key']
+        encode_properties = json.JSONEncoder(sort_keys=True).encode
+        total_rows = 0
+        unique_rows = 0
+        with pd.read_json(path, lines=True, chunksize=DNSGRAPH_CHUNK_SIZE) as reader:
+            for chunk in reader:
+                total_rows += len(chunk)
+                chunk['properties_key'] = chunk['properties'].map(encode_properties)
+                chunk = chunk[key_columns]
+                self.normalize_chunk(chunk)
+
+                # Drop connections seen in this chunk, in previous chunks, or in
+                # previous datasets with an anti-join on the key columns. Since the
+                # connections read so far are unique, the new connections are the
+                # non-duplicated rows of the chunk. Missing values compare equal.
+                nb_seen = 0
+                if self.connections is not None:
+                    nb_seen = len(self.connections)
+                    chunk = pd.concat([self.connections, chunk], ignore_index=True)
+                is_new = ~chunk.duplicated(key_columns)
+                self.connections = chunk[is_new]
+                chunk = chunk.iloc[nb_seen:][is_new.iloc[nb_seen:]]
+
+                for node_type, node_key in [('from_nodeType', 'from_nodeKey'), ('to_nodeType', 'to_nodeKey')]:
+                    self.unique_domain_names.update(chunk.loc[chunk[node_type] == 'DOMAIN', node_key].unique())
+                    self.unique_host_names.update(chunk.loc[chunk[node_type] == 'HOSTNAME', node_key].unique())
+                    self.unique_ips.update(chunk.loc[chunk[node_type] == 'IP', node_key].unique())
+
+                unique_rows += len(chunk)
+        logging.info(f'Read {total_rows} rows, {unique_rows} new unique connections')
 
     def get_unique_dataframe(self):
-        # The data frames contain a dict in the 'properties' row, which prevents us from
-        # using drop_duplicates(), so we need to do our own deduplication instead.
-        # There can be identical relationships with different properties, so we need to
-        # keep a list.
-        unique = defaultdict(list)
-        total_rows = 0
-        for r in pd.concat(self.pandas_df_list).itertuples(index=False):
-            total_rows += 1
-            k = (r.from_nodeType, r.from_nodeKey, r.to_nodeType, r.to_nodeKey, r.relation_name)
-            v = r.properties
-            # Add source property here to save work later.
-            if r.relation_name == 'RESOLVES_TO':
-                source = 'AAAA' if ':' in r.to_nodeKey else 'A'
-                v['source'] = source
-            if k in unique:
-                for existing_v in unique[k]:
-                    # Equality works on dictionaries.
-                    if existing_v == v:
-                        break
-                else:
-                    unique[k].append(v)
-            else:
-                unique[k].append(v)
-        reconstructed_df = pd.DataFrame(
-            self.row_generator(unique),
-            columns=[
-                'from_nodeType',
-                'from_nodeKey',
-                'to_nodeType',
-                'to_nodeKey',
-                'relation_name',
-                'properties'])
-        duplicate_rows = total_rows - len(reconstructed_df)
-        logging.info(f'Removed {duplicate_rows} redundant rows.')
+        # The data frames contain the properties as canonical JSON strings, since dicts
+        # prevent us from using drop_duplicates(). Connections are already deduplicated
+        # while reading, so this only groups them and restores the properties.
+        # There can be identical relationships with different properties, so there can
+        # be multiple rows per relationship.
+        connections = self.connections.reset_index(drop=True)
+        # Keep rows of the same relationship together, in order of first appearance.
+        relationship_id = connections.groupby(CONNECTION_KEY_COLUMNS, sort=False, dropna=False).ngroup()
+        connections = connections.iloc[relationship_id.argsort(kind='stable')]
+
+        # Add source property here to save work later.
+        is_resolves_to = (connections['relation_name'] == 'RESOLVES_TO').to_numpy()
+        is_ipv6 = connections['to_nodeKey'].astype('string').str.contains(':', regex=False).fillna(False).to_numpy()
+        sources = np.where(is_resolves_to, np.where(is_ipv6, 'AAAA', 'A'), None)
+        properties = list()
+        for properties_key, source in zip(connections['properties_key'], sources):
+            props = json.loads(properties_key)
+            if source:
+                props['source'] = source
+            properties.append(props)
+
+        reconstructed_df = connections[CONNECTION_KEY_COLUMNS].reset_index(drop=True)
+        reconstructed_df['properties'] = properties
+        logging.info(f'Got {len(reconstructed_df)} unique connections.')
         return reconstructed_df
 
     def link_generator(self, elems: pd.DataFrame, relationship_type: str, src_id_map: dict, dst_id_map: dict):
@@ -586,39 +753,18 @@ class DnsgraphCrawler(BaseCrawler):
             }
 
     def run(self):
-        for dataset in self.datasets:
-            self.get_connections(dataset)
-        if not self.pandas_df_list:
+        self.get_connections()
+        if self.connections is None:
             logging.error('Failed to get any valid data.')
             raise DataNotAvailableError('Failed to get any valid data.')
 
         connections = self.get_unique_dataframe()
         # Free some memory.
-        del self.pandas_df_list
-
-        logging.info('Stripping root "." and normalizing IPs')
-        # Remove root "." from names that are not the root.
-        # Currently there are only DOMAIN and HOSTNAME entries in from_nodeType, but
-        # maybe that changes in the future.
-        connections.loc[connections['from_nodeType'].isin(('DOMAIN', 'HOSTNAME')), 'from_nodeKey'] = \
-            connections.loc[connections['from_nodeType'].isin(('DOMAIN', 'HOSTNAME')), 'from_nodeKey'].map(self.remove_root)  # noqa: E501
-        connections.loc[connections['to_nodeType'].isin(('DOMAIN', 'HOSTNAME')), 'to_nodeKey'] = \
-            connections.loc[connections['to_nodeType'].isin(('DOMAIN', 'HOSTNAME')), 'to_nodeKey'].map(self.remove_root)
-        # Normalize IPv6 addresses.
-        connections.loc[connections['from_nodeType'] == 'IP', 'from_nodeKey'] = \
-            connections.loc[connections['from_nodeType'] == 'IP', 'from_nodeKey'].map(self.normalize_ipv6)
-        connections.loc[connections['to_nodeType'] == 'IP', 'to_nodeKey'] = \
-            connections.loc[connections['to_nodeType'] == 'IP', 'to_nodeKey'].map(self.normalize_ipv6)
-
-        # Pandas' unique is faster than plain set.
-        unique_domain_names = set()
-        unique_host_names = set()
-        unique_ips = set()
-        logging.info('Getting unique nodes')
-        for node_type, node_key in [('from_nodeType', 'from_nodeKey'), ('to_nodeType', 'to_nodeKey')]:
-            unique_domain_names.update(connections[connections[node_type] == 'DOMAIN'][node_key].unique())
-            unique_host_names.update(connections[connections[node_type] == 'HOSTNAME'][node_key].unique())
-            unique_ips.update(connections[connections[node_type] == 'IP'][node_key].unique())
+        del self.connections
+
+        unique_domain_names = self.unique_domain_names
+        unique_host_names = self.unique_host_names
+        unique_ips = self.unique_ips
 
         domains_id = self.iyp.batch_get_nodes_by_single_prop('DomainName',
                                                              'name',
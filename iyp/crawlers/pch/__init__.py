@@ -1,20 +1,21 @@
-import gzip
 import json
 import logging
 import os
+import pickle
+from array import array
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from ipaddress import ip_network
 from multiprocessing import Pool
-from typing import Iterable, Tuple
+from typing import Tuple
 
+import requests
 from requests.adapters import HTTPAdapter
-from requests_futures.sessions import FuturesSession
 from urllib3.util.retry import Retry
 
-from iyp import (AddressValueError, BaseCrawler, CacheHandler,
-                 DataNotAvailableError)
-from iyp.crawlers.pch.show_bgp_parser import ShowBGPParser
+from iyp import (AddressValueError, BaseCrawler, BulkDownloader, CacheHandler,
+                 DataNotAvailableError, ObjectCache)
+from iyp.crawlers.pch.show_bgp_parser import BytesShowBGPParser
 
 PARALLEL_DOWNLOADS = 1
 PARALLEL_PARSERS = 8
@@ -27,6 +28,57 @@ COLLECTOR_LIST_URL_FMT = 'http://downloads.pch.net/api/files/Routing_Data/IPv{af
 FILE_FMT = os.path.join(COLLECTOR_LIST_URL_FMT, '{collector}/{collector}-ipv{af}_bgp_routes.%Y.%m.%d.gz')
 
 
+def load_parsed_file(parsed_file: str) -> Tuple[list, array]:
+    """Load the prefixes and origins written by save_parsed_file()."""
+    with open(parsed_file, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_parsed_file(parsed_file: str, prefixes: list, origins: array) -> None:
+    """Save prefixes and origins atomically to the specified file."""
+    with open(f'{parsed_file}.part', 'wb') as f:
+        pickle.dump((prefixes, origins), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{parsed_file}.part', parsed_file)
+
+
+def parse_collector_file(fixture: tuple) -> Tuple[str, list, array]:
+    """Parse a gzip-compressed collector file.
+
+    Intended to run in a worker process, so the file is read and decompressed there and
+    only the compact result is sent back. Prefixes are normalized. The result is also
+    saved to parsed_file, so that it does not need to be parsed again.
+
+    fixture: Tuple of (af, collector_name, collector_file, parsed_file)
+
+    Return the collector name, a list of prefixes, and an array of the same length
+    containing the corresponding origin ASes. A prefix with multiple origins is
+    repeated.
+    """
+    af, collector_name, collector_file, parsed_file = fixture
+    parser = BytesShowBGPParser(af)
+    parser.collector = collector_name
+    prefixes = list()
+    origins = array('I')
+    try:
+        prefix_map = parser.parse_file(collector_file)
+    except (OSError, EOFError) as e:
+        # Remove broken files so that they are fetched again on the next run.
+        logging.error(f'{collector_name}: Failed to read {collector_file}: {e}')
+        os.remove(collector_file)
+        return collector_name, prefixes, origins
+    for prefix, asn_set in prefix_map.items():
+        try:
+            prefix = ip_network(prefix).compressed
+        except ValueError as e:
+            logging.warning(f'Ignoring malformed prefix: "{prefix}": {e}')
+            continue
+        for asn in asn_set:
+            prefixes.append(prefix)
+            origins.append(asn)
+    save_parsed_file(parsed_file, prefixes, origins)
+    return collector_name, prefixes, origins
+
+
 class RoutingSnapshotCrawler(BaseCrawler):
     """Crawler for PCH route collector data[0].
 
@@ -38,7 +90,9 @@ class RoutingSnapshotCrawler(BaseCrawler):
     to fetch older results, up to a maximum of 7 days (configured by self.MAX_LOOKBACK).
 
     Caches individual route collector entries to prevent restarting from the beginning
-    when interrupted.
+    when interrupted. In addition, the parsed prefix-AS map of each collector is kept in
+    the object cache (keyed by collector, date, and parser version), so restarts and
+    reruns do not need to download and parse collectors again.
 
     [0]
     https://www.pch.net/resources/Routing_Data/
@@ -55,10 +109,11 @@ class RoutingSnapshotCrawler(BaseCrawler):
         self.max_lookback_dt = self.curr_date - self.MAX_LOOKBACK
         self.latest_available_date = None
         self.af = af
-        self.parser = ShowBGPParser(self.af)
         cache_file_prefix = f'CACHED.{self.curr_date.strftime("%Y%m%d")}.v{self.af}.'
         self.cache_handler = CacheHandler(self.get_tmp_dir(), cache_file_prefix)
         self.collector_files = dict()
+        self.parsed_files = dict()
+        self.object_cache = ObjectCache()
         self.collector_urls = dict()
         self.__initialize_session()
         super().__init__(organization, url, name)
@@ -66,7 +121,7 @@ class RoutingSnapshotCrawler(BaseCrawler):
         self.reference['reference_url_info'] = 'https://www.pch.net/resources/Routing_Data/'
 
     def __initialize_session(self) -> None:
-        self.session = FuturesSession(max_workers=PARALLEL_DOWNLOADS)
+        self.session = requests.Session()
         self.session.headers['User-Agent'] = 'Internet Yellow Pages - admin@ihr.live'
         retry = Retry(
             backoff_factor=0.1,
@@ -76,33 +131,22 @@ class RoutingSnapshotCrawler(BaseCrawler):
         adapter = HTTPAdapter(max_retries=retry)
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
+        # Collector files are large, so be polite and only use a few connections.
+        self.downloader = BulkDownloader(max_per_host=PARALLEL_DOWNLOADS, session=self.session)
 
-    def fetch_urls(self, urls: list) -> Iterable:
-        """Fetch the specified URLs in parallel and generate results.
-
-        Per URL, returns the status, binary content, and collector
-        name that was passed together with the URL.
+    def fetch_url(self, url: str, name: str = str()) -> Tuple[bool, str, str]:
+        """Fetch a single URL.
 
-        urls: List of (name, url) tuples where the name is returned
-              together with the result to keep association.
+        Return the status, binary content, and the name that was passed together with
+        the URL.
         """
-        queries = list()
-        for name, url in urls:
-            queries.append((name, self.session.get(url, timeout=60)))
-        for name, query in queries:
-            try:
-                resp = query.result()
-                yield resp.ok, resp.content, name
-            except Exception as e:
-                logging.error(f'Failed to retrieve data for {query}')
-                logging.error(e)
-                yield False, str(), name
-
-    def fetch_url(self, url: str, name: str = str()) -> Tuple[bool, str, str]:
-        """Helper function for single URL."""
-        for status, resp, resp_name in self.fetch_urls([(name, url)]):
-            return status, resp, resp_name
-        return False, str(), str()
+        try:
+            resp = self.session.get(url, timeout=60)
+            return resp.ok, resp.content, name
+        except Exception as e:
+            logging.error(f'Failed to retrieve data for {url}')
+            logging.error(e)
+            return False, str(), name
 
     def fetch_and_parse_collector_urls(self, date: datetime) -> None:
         """Fetch the list of collectors available on the specified date.
@@ -151,14 +195,25 @@ class RoutingSnapshotCrawler(BaseCrawler):
         if self.curr_date.month != self.max_lookback_dt.month:
             self.fetch_and_parse_collector_urls(self.max_lookback_dt)
 
+    def get_collector_file(self, collector_name: str) -> str:
+        """Return the local path of the (gzip-compressed) file of a collector."""
+        return f'{self.cache_handler.cache_file_prefix}{collector_name}.gz'
+
+    def get_parsed_file_key(self, collector_name: str) -> tuple:
+        """Return the object cache key of the parsed file of a collector.
+
+        The URL contains the collector name, the date, and the address family.
+        """
+        return 'pch', f'{self.collector_urls[collector_name]}.pickle', f'parser-v{BytesShowBGPParser.VERSION}', 0
+
     def fetch(self) -> None:
         """Fetch and cache all data.
 
         First get a list of collector names and their associated files. Then fetch the
         files in parallel.
 
-        All downloaded files are cached, so if this process is restarted, only files
-        that are not in the cache are fetched, the rest is loaded from cache.
+        All downloaded files are kept compressed on disk, so if this process is
+        restarted, only files that are not on disk yet are fetched.
 
         Return True if there was an error during the fetching process, else False.
         """
@@ -173,32 +228,32 @@ class RoutingSnapshotCrawler(BaseCrawler):
 
         self.reference['reference_time_modification'] = self.latest_available_date
 
-        # Build list of URLs for files that are not yet cached, and
-        # load existing files from cache.
+        # Build list of URLs for files that are not yet cached or parsed.
         to_fetch = list()
         for collector_name in self.collector_urls:
-            if self.cache_handler.cached_object_exists(collector_name):
-                collector_file = self.cache_handler.load_cached_object(collector_name)
+            parsed_file = self.object_cache.lookup(*self.get_parsed_file_key(collector_name))
+            if parsed_file:
+                self.parsed_files[collector_name] = parsed_file
+                continue
+            collector_file = self.get_collector_file(collector_name)
+            if os.path.exists(collector_file):
                 self.collector_files[collector_name] = collector_file
             else:
                 to_fetch.append((collector_name, self.collector_urls[collector_name]))
 
-        # Fetch remaining files from PCH.
-        attempt = 1
-        while to_fetch and attempt <= 10:
-            logging.info(f' Attempt {attempt}: {len(self.collector_files)}/{len(self.collector_urls)} collector files '
-                         f'in cache, fetching {len(to_fetch)}')
-            for ok, content, name in self.fetch_urls(to_fetch):
-                if not ok:
-                    continue
-                # Files are compressed with gzip.
-                content = gzip.decompress(content).decode('utf-8')
-                self.collector_files[name] = content
-                self.cache_handler.save_cached_object(name, content)
-
-            missing_collectors = set(self.collector_urls.keys()) - self.collector_files.keys()
-            to_fetch = [(collector, self.collector_urls[collector]) for collector in missing_collectors]
-            attempt += 1
+        # Fetch remaining files from PCH. Files are compressed with gzip. Keep them
+        # compressed, they are decompressed by the parsers. Interrupted downloads,
+        # also from previous runs, are resumed.
+        if to_fetch:
+            logging.info(f'{len(self.collector_files) + len(self.parsed_files)}/{len(self.collector_urls)} '
+                         f'collector files in cache, fetching {len(to_fetch)}')
+            results = self.downloader.download([(url, self.get_collector_file(collector_name))
+                                                for collector_name, url in to_fetch])
+            for collector_name, url in to_fetch:
+                if results[url]:
+                    self.collector_files[collector_name] = self.get_collector_file(collector_name)
+                else:
+                    logging.warning(f'Ignoring collector {collector_name}: download failed.')
 
     def run(self) -> None:
         """Fetch data from PCH, parse the files, and push nodes and relationships to the
@@ -206,33 +261,35 @@ class RoutingSnapshotCrawler(BaseCrawler):
         # Pre-fetch all data.
         self.fetch()
 
-        # Parse files in parallel.
-        logging.info(f'Parsing {len(self.collector_files)} collector files.')
-        fixtures = list()
-        for collector_name, collector_file in self.collector_files.items():
-            fixtures.append((collector_name, collector_file))
-        with Pool(processes=PARALLEL_PARSERS) as p:
-            results = p.map(self.parser.parse_parallel, fixtures)
-        prefix_maps = dict()
-        for collector_name, prefix_map in results:
-            prefix_maps[collector_name] = prefix_map
-
-        # Create sets containing all nodes and prefixes and create
-        # links.
         ases = set()
         prefixes = set()
         raw_links = defaultdict(set)
-        for collector_name, prefix_map in prefix_maps.items():
-            for prefix, asn_set in prefix_map.items():
-                try:
-                    prefix = ip_network(prefix).compressed
-                except ValueError as e:
-                    logging.warning(f'Ignoring malformed prefix: "{prefix}": {e}')
-                    continue
-                ases.update(asn_set)
-                prefixes.add(prefix)
-                for asn in asn_set:
-                    raw_links[(asn, prefix)].add(collector_name)
+
+        def merge_result(collector_name: str, collector_prefixes: list, collector_origins: array):
+            logging.info(f'{collector_name}: {len(collector_prefixes)} prefix-origin pairs.')
+            prefixes.update(collector_prefixes)
+            ases.update(collector_origins)
+            for prefix, asn in zip(collector_prefixes, collector_origins):
+                raw_links[(asn, prefix)].add(collector_name)
+
+        # Load collectors that were already parsed.
+        logging.info(f'Loading {len(self.parsed_files)} parsed collector files from cache.')
+        for collector_name, parsed_file in self.parsed_files.items():
+            merge_result(collector_name, *load_parsed_file(parsed_file))
+
+        # Parse remaining files in parallel. Workers read the files from disk and only
+        # return compact results, which are merged as soon as they are available.
+        logging.info(f'Parsing {len(self.collector_files)} collector files.')
+        fixtures = [(self.af,
+                     collector_name,
+                     collector_file,
+                     self.object_cache.get_path(*self.get_parsed_file_key(collector_name)))
+                    for collector_name, collector_file in self.collector_files.items()]
+        with Pool(processes=PARALLEL_PARSERS) as p:
+            for result in p.imap_unordered(parse_collector_file, fixtures):
+                merge_result(*result)
+        self.object_cache.evict()
+        self.object_cache.log_stats()
 
         # Get/push nodes.
         as_ids = self.iyp.batch_get_nodes_by_single_prop('AS', 'asn', ases, all=False)
@@ -1,5 +1,7 @@
+import gzip
 import logging
 import re
+import socket
 from collections import defaultdict, namedtuple
 from ipaddress import (AddressValueError, IPv4Address, IPv4Network,
                        IPv6Address, IPv6Network)
@@ -242,3 +244,242 @@ class ShowBGPParser:
             if self.__valid_route(route):
                 routes.append(route)
         return self.__build_prefix_map(routes)
+
+
+class BytesShowBGPParser:
+    """A faster drop-in replacement for ShowBGPParser that works directly on the raw
+    (decompressed) bytes and produces the same prefix-AS map.
+
+    Instead of building a Route object per line, lines are tokenized with bytes.split()
+    and only the fields that influence the prefix-AS map are inspected. Routes that can
+    not end up in the map (e.g., not 'valid') are not validated at all, and validation
+    results of networks and next hops, which repeat a lot, are memoized.
+    """
+    # Version of the parser output. Increase if the output for the same input changes.
+    VERSION = 1
+
+    STATUS_CODES = frozenset(b'sdhu*>=irSR')
+    ORIGIN_CODES = frozenset((b'i', b'e', b'?'))
+    # A valid AS hop starts with an integer or is an AS set (see ShowBGPParser).
+    AS_HOP_PATTERN = re.compile(rb'[0-9]|\{[0-9]+(,[0-9]+)*}')
+    # Networks in canonical notation (e.g., no leading zeros) that are validated with
+    # inet_pton instead of the ipaddress module.
+    NETWORK_PATTERN = {
+        4: re.compile(rb'(?:0|[1-9][0-9]{0,2})(?:\.(?:0|[1-9][0-9]{0,2})){3}/(?:[0-9]|[12][0-9]|3[0-2])'),
+        6: re.compile(rb'[0-9a-fA-F:]+/(?:[0-9]|[1-9][0-9]|1[01][0-9]|12[0-8])')
+    }
+
+    def __init__(self, af: int) -> None:
+        """af: Address family of the parser. Must be 4 or 6."""
+        if af not in (4, 6):
+            logging.error(f'Invalid address family specified: {af}')
+            raise AddressValueError('Invalid address family specified.')
+        self.af = af
+        if af == 4:
+            self.network_type = IPv4Network
+            self.address_type = IPv4Address
+            self.socket_af = socket.AF_INET
+            # IPv4 lines can be split in two.
+            self.min_fields = 2
+            self.max_continuation_lines = 1
+        else:
+            self.network_type = IPv6Network
+            self.address_type = IPv6Address
+            self.socket_af = socket.AF_INET6
+            # IPv6 lines can be split in two, sometimes even three.
+            self.min_fields = 3
+            self.max_continuation_lines = 2
+        self.collector = str()
+        # Memoized validation results. Map the raw network to its string
+        # representation and the next hop to its validity, or None if invalid.
+        self.networks = dict()
+        self.next_hops = dict()
+
+    def __fast_valid_network(self, raw_network: bytes) -> bool:
+        """Check the network with inet_pton, which is much faster than the ipaddress
+        module.
+
+        Only use this as a positive check, i.e., if it returns False the network might
+        still be valid.
+        """
+        if not self.NETWORK_PATTERN[self.af].fullmatch(raw_network):
+            return False
+        address, prefix_length = raw_network.split(b'/')
+        try:
+            packed = socket.inet_pton(self.socket_af, address.decode())
+        except OSError:
+            return False
+        host_bits = len(packed) * 8 - int(prefix_length)
+        return 0 <= host_bits and int.from_bytes(packed, 'big') & ((1 << host_bits) - 1) == 0
+
+    def __get_network(self, raw_network: bytes):
+        """Return the validated network as string or None if it is invalid."""
+        if raw_network in self.networks:
+            return self.networks[raw_network]
+        network = raw_network.decode()
+        try:
+            if not self.__fast_valid_network(raw_network):
+                self.network_type(network)
+        except ValueError as e:
+            logging.error(f'{self.collector}: Invalid network: {network}')
+            logging.error(f'{self.collector}: {e}')
+            network = None
+        self.networks[raw_network] = network
+        return network
+
+    def __valid_next_hop(self, raw_next_hop: bytes) -> bool:
+        if raw_next_hop in self.next_hops:
+            return self.next_hops[raw_next_hop]
+        try:
+            self.address_type(raw_next_hop.decode())
+            valid = True
+        except ValueError as e:
+            logging.error(f'{self.collector}: Invalid next hop: {raw_next_hop}')
+            logging.error(f'{self.collector}: {e}')
+            valid = False
+        self.next_hops[raw_next_hop] = valid
+        return valid
+
+    def __get_classful_network(self, raw_address: bytes):
+        """Infer the network from a classful address (see RFC 791).
+
+        Return the network as bytes or None if the address is invalid.
+        """
+        try:
+            address = IPv4Address(raw_address.decode())
+        except AddressValueError as e:
+            logging.error(f'{self.collector}: Invalid classful address: {raw_address}')
+            logging.error(f'{self.collector}: {e}')
+            return None
+        address_int = int(address)
+        if address_int >> 31 == 0b0:
+            return f'{address}/8'.encode()
+        elif address_int >> 30 == 0b10:
+            return f'{address}/16'.encode()
+        elif address_int >> 29 == 0b110:
+            return f'{address}/24'.encode()
+        logging.error(f'{self.collector}: Invalid classful address: {address}')
+        return None
+
+    def parse_file(self, input_file: str) -> dict:
+        """Read a file containing the input and return a prefix-AS map.
+
+        Files ending with .gz are decompressed on the fly.
+        """
+        open_file = gzip.open if input_file.endswith('.gz') else open
+        with open_file(input_file, 'rb') as f:
+            return self.parse(f.read())
+
+    def parse_parallel(self, fixture: tuple) -> Tuple[str, dict]:
+        """Helper function for use with parallel parsing.
+
+        fixture: Tuple of (collector_name, input_bytes)
+        """
+        collector_name, input_bytes = fixture
+        logging.debug(collector_name)
+        self.collector = collector_name
+        return collector_name, self.parse(input_bytes)
+
+    def parse(self, input_bytes: bytes) -> dict:
+        """Parse the input and return a prefix-AS map.
+
+        Return an empty dictionary in case of an error.
+        """
+        if isinstance(input_bytes, str):
+            input_bytes = input_bytes.encode()
+        lines = iter(input_bytes.splitlines())
+        try:
+            while not next(lines).lstrip().startswith(b'Network'):
+                pass
+        except StopIteration:
+            logging.warning(f'{self.collector}: Empty file.')
+            return dict()
+
+        status_codes = self.STATUS_CODES
+        origin_codes = self.ORIGIN_CODES
+        min_fields = self.min_fields
+        as_hop_pattern = self.AS_HOP_PATTERN
+        prefix_map = defaultdict(set)
+        not_valid_routes = 0
+        invalid_routes = 0
+        as_sets = 0
+        last_pfx = b''
+        for line in lines:
+            fields = line.split()
+            if not fields:
+                # End of file.
+                break
+            # Route output can be split over multiple lines, so we need to
+            # reassemble them before parsing.
+            for _ in range(self.max_continuation_lines):
+                if len(fields) > min_fields:
+                    break
+                fields += next(lines, b'').split()
+
+            idx = 0
+            status = fields[0]
+            if b':' not in status and not status_codes.isdisjoint(status):
+                # Not all lines have a status code. IPv6 addresses can contain
+                # a 'd', so we need to exclude them.
+                idx = 1
+                if not status_codes.issuperset(status):
+                    logging.critical(f'{self.collector}: Invalid status code in {status}')
+                    status = b''
+            else:
+                status = b''
+
+            network = fields[idx]
+            if b'/' in network:
+                idx += 1
+            elif not fields[idx + 1].isdigit():
+                # Edge case where prefix size needs to be inferred from classful
+                # address. This is recognized by a lookahead that checks if the next
+                # entry is the metric. Can only happen to IPv4 addresses.
+                network = self.__get_classful_network(network)
+                if network is None:
+                    continue
+                idx += 1
+            else:
+                # Prefix inherited from previous line.
+                network = last_pfx
+            # Keep track of the last seen prefix, since it can be inherited by
+            # subsequent lines.
+            last_pfx = network
+
+            # Only valid routes with a (non AS set) origin end up in the map, so
+            # skip everything else before doing any expensive validation.
+            if b'*' not in status:
+                not_valid_routes += 1
+                continue
+            if fields[-1] not in origin_codes:
+                logging.critical(f'{self.collector}: Invalid origin code {fields[-1]}')
+                continue
+            path = fields[idx + 3:-1]
+            if not path:
+                logging.debug(f'{self.collector}: Route without AS path: {line}')
+                continue
+            if not (fields[idx + 1].isdigit()
+                    and fields[idx + 2].isdigit()
+                    and (b''.join(path).isdigit() or all(as_hop_pattern.match(hop) for hop in path))
+                    and self.__valid_next_hop(fields[idx])):
+                logging.error(f'{self.collector}: Invalid route: {fields}')
+                invalid_routes += 1
+                continue
+            network_str = self.__get_network(network)
+            if network_str is None:
+                invalid_routes += 1
+                continue
+            origin = path[-1].strip(b'{}')
+            if b',' in origin:
+                # AS set. No correct mapping possible, so ignore.
+                as_sets += 1
+                continue
+            prefix_map[network_str].add(int(origin))
+
+        if not_valid_routes:
+            logging.info(f'{self.collector}: Ignored {not_valid_routes} not valid routes.')
+        if invalid_routes:
+            logging.info(f'{self.collector}: Ignored {invalid_routes} invalid routes.')
+        if as_sets:
+            logging.debug(f'{self.collector}: Ignored {as_sets} AS set origins.')
+        return prefix_map
@@ -1,18 +1,15 @@
 import argparse
-import json
 import logging
-import os
 import sys
-from datetime import timedelta
 
 import flatdict
 import iso3166
-import requests_cache
 from neo4j.spatial import WGS84Point
 
 from iyp import BaseCrawler
 from iyp.crawlers.peeringdb.ix import (handle_social_media,
                                        set_reference_time_from_metadata)
+from iyp.crawlers.peeringdb.snapshot import get_snapshot, release_snapshot
 
 # NOTES This script should be executed after peeringdb.org
 
@@ -26,25 +23,11 @@ NAME = 'peeringdb.fac'
 ORGID_LABEL = 'PeeringdbOrgID'
 FACID_LABEL = 'PeeringdbFacID'
 
-API_KEY = ''
-CACHE_DIR = ''
-CACHE_DURATION = requests_cache.DO_NOT_CACHE
-if os.path.exists('config.json'):
-    with open('config.json', 'r') as f:
-        config = json.load(f)
-    API_KEY = config['peeringdb']['apikey']
-    CACHE_DIR = config['cache']['directory']
-    CACHE_DURATION = timedelta(days=config['cache']['duration_in_days'])
-    del config  # Do not leave as a global variable.
-
 
 class Crawler(BaseCrawler):
     def __init__(self, organization, url, name):
         """Initialisation for pushing peeringDB facilities to IYP."""
 
-        self.headers = {'Authorization': 'Api-Key ' + API_KEY}
-        self.requests = requests_cache.CachedSession(os.path.join(CACHE_DIR, ORG), expire_after=CACHE_DURATION)
-
         super().__init__(organization, url, name)
         self.reference['reference_url_info'] = 'https://www.peeringdb.com/apidocs/#tag/api/operation/list%20fac'
 
@@ -52,10 +35,17 @@ class Crawler(BaseCrawler):
         """Fetch facilities information from PeeringDB and push to IYP."""
 
         logging.info('Fetching PeeringDB data...')
-        req = self.requests.get(URL, headers=self.headers)
-        req.raise_for_status()
+        self.snapshot = get_snapshot(['fac'])
+        try:
+            self.import_data()
+        finally:
+            self.snapshot = None
+            release_snapshot(self.name)
+
+    def import_data(self):
+        """Push the PeeringDB facilities to IYP."""
 
-        result = req.json()
+        result = self.snapshot.get('fac')
         set_reference_time_from_metadata(self.reference, result)
         facilities = result['data']
 
@@ -93,7 +83,9 @@ class Crawler(BaseCrawler):
         self.facid_id = self.iyp.batch_get_nodes_by_single_prop(FACID_LABEL, 'id', facids)
 
         # get organization nodes
-        self.org_id = self.iyp.batch_get_node_extid(ORGID_LABEL)
+        self.org_id = self.snapshot.get_node_ids('org')
+        if self.org_id is None:
+            self.org_id = self.iyp.batch_get_node_extid(ORGID_LABEL)
 
         # compute links
         name_links = []
@@ -142,6 +134,9 @@ class Crawler(BaseCrawler):
         self.iyp.batch_add_links('EXTERNAL_ID', facid_links)
         self.iyp.batch_add_links('MANAGED_BY', org_links)
 
+        # Share facility nodes with the ix crawler
+        self.snapshot.set_node_ids('fac', {fac['id']: self.fac_id[fac['name'].strip()] for fac in facilities})
+
     def unit_test(self):
         return super().unit_test(['NAME', 'WEBSITE', 'COUNTRY', 'EXTERNAL_ID', 'MANAGED_BY', 'LOCATED_IN'])
 
@@ -149,6 +144,7 @@ class Crawler(BaseCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -164,6 +160,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
@@ -1,15 +1,13 @@
 import argparse
-import json
 import logging
-import os
 import sys
-from datetime import datetime, time, timedelta, timezone
+from datetime import datetime, time, timezone
 from ipaddress import ip_network
 
 import flatdict
-import requests_cache
 
 from iyp import BaseCrawler
+from iyp.crawlers.peeringdb.snapshot import get_snapshot, release_snapshot
 
 # NOTES This script should be executed after peeringdb.org
 # TODO add the type PEERING_LAN? may break the unique constraint
@@ -17,6 +15,8 @@ from iyp import BaseCrawler
 ORG = 'PeeringDB'
 URL = ''
 NAME = 'peeringdb.ix'
+# PeeringDB object types used by this crawler.
+OBJECT_TYPES = ['fac', 'ix', 'ixfac', 'ixlan', 'ixpfx', 'net', 'netixlan', 'netfac']
 
 # URL to peeringdb API for exchange points
 URL_PDB_IXS = 'https://peeringdb.com/api/ix?depth=2'
@@ -34,17 +34,6 @@ NETID_LABEL = 'PeeringdbNetID'
 # Label used for the nodes representing the facility IDs
 FACID_LABEL = 'PeeringdbFacID'
 
-API_KEY = ''
-CACHE_DIR = ''
-CACHE_DURATION = requests_cache.DO_NOT_CACHE
-if os.path.exists('config.json'):
-    with open('config.json', 'r') as f:
-        config = json.load(f)
-    API_KEY = config['peeringdb']['apikey']
-    CACHE_DIR = config['cache']['directory']
-    CACHE_DURATION = timedelta(days=config['cache']['duration_in_days'])
-    del config  # Do not leave as a global variable.
-
 
 def handle_social_media(d: dict, website_set: set = None):
     """Flatten list of social media dictionaries in place and add the website to
@@ -72,8 +61,6 @@ class Crawler(BaseCrawler):
     def __init__(self, organization, url, name):
         """Initialisation for pushing peeringDB IXPs to IYP."""
 
-        self.headers = {'Authorization': 'Api-Key ' + API_KEY}
-
         self.reference_ix = {
             'reference_org': ORG,
             'reference_name': NAME,
@@ -104,9 +91,6 @@ class Crawler(BaseCrawler):
         # keep track of added networks
         self.nets = {}
 
-        # Using cached queries
-        self.requests = requests_cache.CachedSession(os.path.join(CACHE_DIR, ORG), expire_after=CACHE_DURATION)
-
         # connection to IYP database
         super().__init__(organization, url, name)
 
@@ -116,28 +100,39 @@ class Crawler(BaseCrawler):
         Using multiple threads for better performances.
         """
 
-        # get organization, country nodes
-        self.org_id = self.iyp.batch_get_node_extid(ORGID_LABEL)
-        self.fac_id = self.iyp.batch_get_node_extid(FACID_LABEL)
+        self.snapshot = get_snapshot(OBJECT_TYPES)
+        try:
+            self.import_data()
+        finally:
+            self.snapshot = None
+            release_snapshot(self.name)
+
+    def import_data(self):
+        """Push the PeeringDB snapshot to IYP."""
+
+        # get organization, facility, country nodes (from the org and fac crawlers
+        # if they ran in this process)
+        self.org_id = self.snapshot.get_node_ids('org')
+        if self.org_id is None:
+            self.org_id = self.iyp.batch_get_node_extid(ORGID_LABEL)
+        self.fac_id = self.snapshot.get_node_ids('fac')
+        if self.fac_id is None:
+            self.fac_id = self.iyp.batch_get_node_extid(FACID_LABEL)
         self.country_id = self.iyp.batch_get_nodes_by_single_prop('Country', 'country_code')
 
-        req = self.requests.get(URL_PDB_IXS, headers=self.headers)
-        req.raise_for_status()
-
-        result = req.json()
+        result = self.snapshot.get('ix')
         set_reference_time_from_metadata(self.reference_ix, result)
         self.ixs = result['data']
+        self.add_ix_sets()
 
         # Register IXPs
         self.register_ixs()
-        self.ix_id = self.iyp.batch_get_node_extid(IXID_LABEL)
+        self.ix_id = {ix['id']: self.ix_id[ix['name']] for ix in self.ixs}
 
-        req = self.requests.get(URL_PDB_LANS, headers=self.headers)
-        req.raise_for_status()
-
-        result = req.json()
+        result = self.snapshot.get('ixlan')
         set_reference_time_from_metadata(self.reference_lan, result)
         ixlans = result['data']
+        self.add_ixlan_sets(ixlans)
 
         # index ixlans by their id
         self.ixlans = {}
@@ -148,14 +143,35 @@ class Crawler(BaseCrawler):
         self.iyp.commit()
 
         # Link network to facilities
-        req = self.requests.get(URL_PDB_NETFAC, headers=self.headers)
-        req.raise_for_status()
-
-        result = req.json()
+        result = self.snapshot.get('netfac')
         set_reference_time_from_metadata(self.reference_netfac, result)
         self.netfacs = result['data']
         self.register_net_fac()
 
+    def add_ix_sets(self):
+        """Add the fac_set and ixlan_set of each IX, as returned by the API with
+        depth=2, from the mirrored objects."""
+
+        facs = self.snapshot.get_by_id('fac')
+        ixfacs = self.snapshot.group_by('ixfac', 'ix_id')
+        ixlans = self.snapshot.group_by('ixlan', 'ix_id')
+        for ix in self.ixs:
+            ix['fac_set'] = [facs[ixfac['fac_id']] for ixfac in ixfacs[ix['id']] if ixfac['fac_id'] in facs]
+            ix['ixlan_set'] = ixlans[ix['id']]
+
+    def add_ixlan_sets(self, ixlans):
+        """Add the ixpfx_set and net_set of each LAN, as returned by the API with
+        depth=2, from the mirrored objects."""
+
+        nets = self.snapshot.get_by_id('net')
+        ixpfxs = self.snapshot.group_by('ixpfx', 'ixlan_id')
+        netixlans = self.snapshot.group_by('netixlan', 'ixlan_id')
+        for ixlan in ixlans:
+            ixlan['ixpfx_set'] = ixpfxs[ixlan['id']]
+            net_ids = sorted({netixlan['net_id'] for netixlan in netixlans[ixlan['id']]})
+            # Networks are modified by handle_social_media, so copy them.
+            ixlan['net_set'] = [dict(nets[net_id]) for net_id in net_ids if net_id in nets]
+
     def register_net_fac(self):
         """Link ASes to facilities."""
 
@@ -392,6 +408,7 @@ class Crawler(BaseCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -407,6 +424,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
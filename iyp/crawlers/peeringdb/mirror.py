@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Base URL of the PeeringDB API
+API_URL = 'https://peeringdb.com/api/'
+
+API_KEY = ''
+CACHE_DIR = 'tmp/'
+# The mirror is rebuilt from a full fetch after this many days, to recover from
+# changes that the incremental queries could have missed.
+FULL_SYNC_INTERVAL_IN_DAYS = 30
+# Read the mirror without querying PeeringDB.
+OFFLINE = False
+if os.path.exists('config.json'):
+    with open('config.json', 'r') as f:
+        config = json.load(f)
+    API_KEY = config['peeringdb']['apikey']
+    FULL_SYNC_INTERVAL_IN_DAYS = config['peeringdb'].get('mirror_full_sync_days', FULL_SYNC_INTERVAL_IN_DAYS)
+    OFFLINE = config['peeringdb'].get('offline', OFFLINE)
+    CACHE_DIR = config.get('cache', dict()).get('directory', CACHE_DIR)
+    del config  # Do not leave as a global variable.
+
+# Incremental queries overlap with the previous sync by this many seconds to
+# tolerate clock skew. Applying an update twice is harmless.
+SINCE_OVERLAP_IN_SECONDS = 300
+
+
+class PeeringDBMirror:
+    """Local SQLite mirror of PeeringDB objects.
+
+    Each object type (e.g., org, fac, ix) is initially populated with a full fetch of
+    the API and then kept up to date with incremental queries (?since=<timestamp>),
+    which also return deleted objects. Objects are stored without nesting (depth=0).
+
+    With OFFLINE set, objects are read from the mirror without querying PeeringDB.
+    """
+
+    def __init__(self, path: str = str()) -> None:
+        self.path = path if path else os.path.join(CACHE_DIR, 'peeringdb.sqlite3')
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS object (
+                type TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (type, id)
+            );
+            CREATE TABLE IF NOT EXISTS sync (
+                type TEXT PRIMARY KEY,
+                last_sync REAL NOT NULL,
+                last_full_sync REAL NOT NULL
+            );
+            """)
+        self.session = None
+        # Object types already synced by this instance.
+        self.synced = set()
+
+    def get_session(self) -> requests.Session:
+        if self.session is None:
+            self.session = requests.Session()
+            self.session.headers['Authorization'] = 'Api-Key ' + API_KEY
+            retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+            self.session.mount('https://', HTTPAdapter(max_retries=retries))
+        return self.session
+
+    def get_sync_state(self, obj_type: str):
+        """Return the (last_sync, last_full_sync) timestamps of an object type or None
+        if it was never synced."""
+        return self.db.execute('SELECT last_sync, last_full_sync FROM sync WHERE type = ?', (obj_type,)).fetchone()
+
+    def fetch_updates(self, obj_type: str, state) -> dict:
+        """Query PeeringDB for the objects of the specified type that changed since
+        the last sync, or all objects if a full sync is due.
+
+        state is the result of get_sync_state. Only does network I/O, so it can run in
+        a separate thread. The result is applied to the mirror with apply_updates.
+        """
+        full = state is None or time.time() - state[1] > FULL_SYNC_INTERVAL_IN_DAYS * 24 * 60 * 60
+        params = {'depth': 0}
+        if not full:
+            params['since'] = int(state[0]) - SINCE_OVERLAP_IN_SECONDS
+        logging.info(f'Fetching {"all" if full else "updated"} PeeringDB {obj_type} objects.')
+        started_at = time.time()
+        req = self.get_session().get(API_URL + obj_type, params=params)
+        req.raise_for_status()
+        result = req.json()
+        # Full dumps may be served from a cache generated before the query.
+        synced_at = result.get('meta', dict()).get('generated', started_at) if full else started_at
+        return {'full': full, 'synced_at': synced_at, 'data': result['data']}
+
+    def apply_updates(self, obj_type: str, updates: dict) -> None:
+        """Write the result of fetch_updates to the mirror."""
+        upserts = list()
+        deletes = list()
+        for obj in updates['data']:
+            if obj.get('status', 'ok') == 'ok':
+                upserts.append((obj_type, obj['id'], json.dumps(obj)))
+            else:
+                deletes.append((obj_type, obj['id']))
+        with self.db:
+            if updates['full']:
+                self.db.execute('DELETE FROM object WHERE type = ?', (obj_type,))
+            self.db.executemany('INSERT OR REPLACE INTO object (type, id, data) VALUES (?, ?, ?)', upserts)
+            self.db.executemany('DELETE FROM object WHERE type = ? AND id = ?', deletes)
+            if updates['full']:
+                self.db.execute('INSERT OR REPLACE INTO sync (type, last_sync, last_full_sync) VALUES (?, ?, ?)',
+                                (obj_type, updates['synced_at'], updates['synced_at']))
+            else:
+                self.db.execute('UPDATE sync SET last_sync = ? WHERE type = ?', (updates['synced_at'], obj_type))
+        logging.info(f'PeeringDB {obj_type}: {len(upserts)} objects updated, {len(deletes)} deleted.')
+
+    def sync(self, obj_type: str) -> None:
+        """Bring the mirror of an object type up to date."""
+        if obj_type in self.synced:
+            return
+        if OFFLINE:
+            if self.get_sync_state(obj_type) is None:
+                raise RuntimeError(f'Offline mode but PeeringDB {obj_type} objects were never mirrored.')
+            logging.info(f'Offline mode: using mirrored PeeringDB {obj_type} objects.')
+        else:
+            self.apply_updates(obj_type, self.fetch_updates(obj_type, self.get_sync_state(obj_type)))
+        self.synced.add(obj_type)
+
+    def get(self, obj_type: str) -> dict:
+        """Sync and return all objects of a type, formatted like an API response.
+
+        The 'generated' metadata is the time of the last sync.
+        """
+        self.sync(obj_type)
+        last_sync, _ = self.get_sync_state(obj_type)
+        data = [json.loads(row[0]) for row in
+                self.db.execute('SELECT data FROM object WHERE type = ? ORDER BY id', (obj_type,))]
+        return {'meta': {'generated': last_sync}, 'data': data}
+
+    def close(self) -> None:
+        if self.session is not None:
+            self.session.close()
+        self.db.close()
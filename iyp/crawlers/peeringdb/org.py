@@ -1,18 +1,15 @@
 import argparse
-import json
 import logging
-import os
 import sys
-from datetime import timedelta
 
 import flatdict
 import iso3166
-import requests_cache
 from neo4j.spatial import WGS84Point
 
 from iyp import BaseCrawler
 from iyp.crawlers.peeringdb.ix import (handle_social_media,
                                        set_reference_time_from_metadata)
+from iyp.crawlers.peeringdb.snapshot import get_snapshot, release_snapshot
 
 ORG = 'PeeringDB'
 
@@ -23,35 +20,28 @@ NAME = 'peeringdb.org'
 # Label used for the class/item representing the organization IDs
 ORGID_LABEL = 'PeeringdbOrgID'
 
-API_KEY = ''
-CACHE_DIR = ''
-CACHE_DURATION = requests_cache.DO_NOT_CACHE
-if os.path.exists('config.json'):
-    with open('config.json', 'r') as f:
-        config = json.load(f)
-    API_KEY = config['peeringdb']['apikey']
-    CACHE_DIR = config['cache']['directory']
-    CACHE_DURATION = timedelta(days=config['cache']['duration_in_days'])
-    del config  # Do not leave as a global variable.
-
 
 class Crawler(BaseCrawler):
     def __init__(self, organization, url, name):
         """Initialisation for pushing peeringDB organizations to IYP."""
 
-        self.headers = {'Authorization': 'Api-Key ' + API_KEY}
-        self.requests = requests_cache.CachedSession(os.path.join(CACHE_DIR, ORG), expire_after=CACHE_DURATION)
-
         super().__init__(organization, url, name)
         self.reference['reference_url_info'] = 'https://www.peeringdb.com/apidocs/#tag/api/operation/list%20org'
 
     def run(self):
         """Fetch organizations information from PeeringDB and push to IYP."""
 
-        req = self.requests.get(URL, headers=self.headers)
-        req.raise_for_status()
+        self.snapshot = get_snapshot(['org'])
+        try:
+            self.import_data()
+        finally:
+            self.snapshot = None
+            release_snapshot(self.name)
+
+    def import_data(self):
+        """Push the PeeringDB organizations to IYP."""
 
-        result = req.json()
+        result = self.snapshot.get('org')
         set_reference_time_from_metadata(self.reference, result)
         organizations = result['data']
 
@@ -130,6 +120,9 @@ class Crawler(BaseCrawler):
         self.iyp.batch_add_links('LOCATED_IN', point_links)
         self.iyp.batch_add_links('EXTERNAL_ID', orgid_links)
 
+        # Share organization nodes with the fac and ix crawlers
+        self.snapshot.set_node_ids('org', {org['id']: self.org_id[org['name'].strip()] for org in organizations})
+
     def unit_test(self):
         return super().unit_test(['NAME', 'WEBSITE', 'COUNTRY', 'EXTERNAL_ID', 'LOCATED_IN'])
 
@@ -137,6 +130,7 @@ class Crawler(BaseCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -152,6 +146,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
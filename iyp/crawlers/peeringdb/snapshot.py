@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from iyp.crawlers.peeringdb import mirror
+from iyp.crawlers.peeringdb.mirror import PeeringDBMirror
+
+# PeeringDB crawlers run by create_db, in order. The snapshot is kept until the last
+# of them finishes (see release_snapshot).
+CRAWLERS = list()
+if os.path.exists('config.json'):
+    with open('config.json', 'r') as f:
+        config = json.load(f)
+    CRAWLERS = [module.replace('iyp.crawlers.', '')
+                for module in config.get('iyp', dict()).get('crawlers', list())
+                if module.startswith('iyp.crawlers.peeringdb.')]
+    del config  # Do not leave as a global variable.
+
+# Snapshot shared by all PeeringDB crawlers running in the same process.
+snapshot = None
+
+
+class PeeringDBSnapshot:
+    """In-memory snapshot of the PeeringDB objects used by the crawlers.
+
+    Object types are only loaded when a crawler needs them. The types requested at
+    once are fetched concurrently, and each type is fetched only once and indexed by
+    ID. Crawlers also publish the IYP node IDs of the entities they created (see
+    set_node_ids), so that the following crawlers do not need to look them up in the
+    database.
+    """
+
+    def __init__(self) -> None:
+        # Dict mapping object types to a dict mapping PeeringDB IDs to objects.
+        self.objects = dict()
+        # Dict mapping object types to the 'generated' metadata of the mirror.
+        self.meta = dict()
+        # Dict mapping (object type, key) to grouped objects, see group_by.
+        self.groups = dict()
+        # Dict mapping object types to a dict mapping PeeringDB IDs to IYP node IDs.
+        self.node_ids = dict()
+
+    def load(self, object_types: list) -> None:
+        """Load the object types that are not in the snapshot yet."""
+        object_types = [obj_type for obj_type in object_types if obj_type not in self.objects]
+        if not object_types:
+            return
+        pdb_mirror = PeeringDBMirror()
+        try:
+            if not mirror.OFFLINE:
+                # Only the queries run concurrently, the SQLite connection is used by
+                # this thread only. The HTTP session is created before starting the
+                # threads, so that they all share it.
+                pdb_mirror.get_session()
+                states = {obj_type: pdb_mirror.get_sync_state(obj_type) for obj_type in object_types}
+                with ThreadPoolExecutor(len(object_types)) as executor:
+                    futures = {executor.submit(pdb_mirror.fetch_updates, obj_type, states[obj_type]): obj_type
+                               for obj_type in object_types}
+                    for future in as_completed(futures):
+                        obj_type = futures[future]
+                        pdb_mirror.apply_updates(obj_type, future.result())
+                        pdb_mirror.synced.add(obj_type)
+            for obj_type in object_types:
+                result = pdb_mirror.get(obj_type)
+                self.meta[obj_type] = result['meta']
+                self.objects[obj_type] = {obj['id']: obj for obj in result['data']}
+        finally:
+            pdb_mirror.close()
+        logging.info('Loaded PeeringDB objects: '
+                     + ', '.join(f'{len(self.objects[obj_type])} {obj_type}' for obj_type in object_types))
+
+    def get(self, obj_type: str) -> dict:
+        """Return all objects of a type, formatted like an API response.
+
+        Objects are shallow copies, so crawlers can modify top-level keys.
+        """
+        self.load([obj_type])
+        return {'meta': dict(self.meta[obj_type]),
+                'data': [dict(obj) for obj in self.objects[obj_type].values()]}
+
+    def get_by_id(self, obj_type: str) -> dict:
+        """Return a dict mapping PeeringDB IDs to objects.
+
+        The objects are shared and must not be modified.
+        """
+        self.load([obj_type])
+        return self.objects[obj_type]
+
+    def group_by(self, obj_type: str, key: str) -> dict:
+        """Return a dict mapping values of key to the list of objects with that value.
+
+        The objects are shared and must not be modified.
+        """
+        if (obj_type, key) not in self.groups:
+            self.load([obj_type])
+            groups = defaultdict(list)
+            for obj in self.objects[obj_type].values():
+                groups[obj[key]].append(obj)
+            self.groups[(obj_type, key)] = groups
+        return self.groups[(obj_type, key)]
+
+    def set_node_ids(self, obj_type: str, node_ids: dict) -> None:
+        """Publish the IYP node IDs of the entities created for PeeringDB objects."""
+        self.node_ids[obj_type] = node_ids
+
+    def get_node_ids(self, obj_type: str):
+        """Return a dict mapping PeeringDB IDs to IYP node IDs or None if the crawler
+        of this object type did not run in this process."""
+        return self.node_ids.get(obj_type)
+
+
+def get_snapshot(object_types: list) -> PeeringDBSnapshot:
+    """Return the snapshot shared by the crawlers with at least the specified object
+    types loaded.
+
+    Other object types are loaded on first access.
+    """
+    global snapshot
+    if snapshot is None:
+        snapshot = PeeringDBSnapshot()
+    snapshot.load(object_types)
+    return snapshot
+
+
+def release_snapshot(crawler_name: str) -> None:
+    """Drop the shared snapshot to free its memory once the crawler is done, unless a
+    later PeeringDB crawler of create_db still uses it.
+
+    A later call to get_snapshot loads a new snapshot.
+    """
+    global snapshot
+    if crawler_name in CRAWLERS[:-1]:
+        return
+    snapshot = None
@@ -4,7 +4,6 @@ import json
 import logging
 import os
 import sys
-import tempfile
 from datetime import datetime, timedelta, timezone
 from ipaddress import ip_network
 
@@ -12,7 +11,7 @@ import boto3
 import botocore
 import pandas as pd
 
-from iyp import BaseCrawler, DataNotAvailableError
+from iyp import BaseCrawler, DataNotAvailableError, ObjectCache
 
 URL = 'https://rir-data.org/'
 ORG = 'SimulaMet'
@@ -25,6 +24,7 @@ class Crawler(BaseCrawler):
     def __init__(self, organization, url, name):
         super().__init__(organization, url, name)
         self.reference['reference_url_info'] = 'https://rir-data.org/#reverse-dns'
+        self.object_cache = ObjectCache()
 
     @staticmethod
     def __read_json(file_path):
@@ -95,8 +95,6 @@ class Crawler(BaseCrawler):
             raise DataNotAvailableError('Failed to find data within the specified lookback interval.')
         self.reference['reference_time_modification'] = current_date
 
-        tmp_dir = self.create_tmp_dir()
-
         if len(objects) > 1:
             # We always should have only one file, but the example code uses a loop.
             # Since we set the reference URL from this, warn if there are multiple
@@ -108,28 +106,21 @@ class Crawler(BaseCrawler):
             if not obj.key.endswith('.jsonl.bz2'):
                 logging.warning(f'Ignoring file with unexpected format: {obj.key}')
                 continue
-            # Open a temporary file to download the object into
-            with tempfile.NamedTemporaryFile(mode='w+b',
-                                             dir=tmp_dir,
-                                             prefix=current_date.strftime('%Y-%m-%d.'),
-                                             suffix='.jsonl.bz2',
-                                             delete=False) as tempFile:
-
-                logging.info(f'Opened temporary file for object download: {tempFile.name}')
+            data_url = os.path.join(S3A_RIR_DATA_ENDPOINT, RIR_DATA_BUCKET.name, obj.key)
+            self.reference['reference_url_data'] = data_url
+
+            def download(fileobj):
                 RIR_DATA_BUCKET.download_fileobj(
                     Key=obj.key,
-                    Fileobj=tempFile,
+                    Fileobj=fileobj,
                     Config=boto3.s3.transfer.TransferConfig(multipart_chunksize=16 * 1024 * 1024)
                 )
-                data_url = os.path.join(S3A_RIR_DATA_ENDPOINT, RIR_DATA_BUCKET.name, obj.key)
-                self.reference['reference_url_data'] = data_url
-                logging.info("Downloaded '{}' [{:.2f}MiB] into '{}'.".format(
-                    data_url,
-                    os.path.getsize(tempFile.name) / (1024 * 1024),
-                    tempFile.name
-                ))
-                # Use Pandas to read file into a DF and append to list
-                pandas_df_list.append(self.__read_json(tempFile.name))
+                logging.info("Downloaded '{}' [{:.2f}MiB].".format(data_url, obj.size / (1024 * 1024)))
+
+            file_path = self.object_cache.fetch(RIR_DATA_BUCKET.name, obj.key, obj.e_tag, obj.size, download)
+            # Use Pandas to read file into a DF and append to list
+            pandas_df_list.append(self.__read_json(file_path))
+        self.object_cache.log_stats()
 
         # Concatenate object-specific DFs
         pandas_df = pd.concat(pandas_df_list)
@@ -171,6 +162,7 @@ class Crawler(BaseCrawler):
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
     args = parser.parse_args()
 
     FORMAT = '%(asctime)s %(levelname)s %(message)s'
@@ -186,6 +178,9 @@ def main() -> None:
     crawler = Crawler(ORG, URL, NAME)
     if args.unit_test:
         crawler.unit_test()
+    elif args.rerun:
+        crawler.rerun()
+        crawler.close()
     else:
         crawler.run()
         crawler.close()
@@ -8,6 +8,9 @@ NAME = 'address_family'
 
 
 class PostProcess(BasePostProcess):
+    reads = {'Prefix', 'IP'}
+    writes = {'Prefix', 'IP'}
+
     def run(self):
         """Add address family (4 or 6 for IPv4 or IPv6) to all IP and Prefix nodes."""
 
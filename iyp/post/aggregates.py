@@ -0,0 +1,235 @@
+import argparse
+import logging
+import sys
+from collections import defaultdict
+from ipaddress import collapse_addresses, ip_network
+
+from iyp import DELETE_BATCH_SIZE, BasePostProcess
+
+NAME = 'aggregates'
+
+# Properties set by this step, per node label.
+AGGREGATE_PROPERTIES = {
+    'AS': ['originated_prefix_count', 'originated_ipv4_addresses', 'originated_ipv6_48s',
+           'roa_covered_prefix_count', 'roa_coverage', 'ixp_count', 'ranking_count'],
+    'BGPPrefix': ['origin_as_count'],
+    'Country': ['as_count'],
+}
+
+
+class PostProcess(BasePostProcess):
+    """Materialize frequently queried aggregates as node properties.
+
+    AS nodes get:
+      - originated_prefix_count: number of originated BGP prefixes
+      - originated_ipv4_addresses: number of IPv4 addresses covered by the originated
+        prefixes (overlapping prefixes are counted once)
+      - originated_ipv6_48s: same for IPv6, in number of /48
+      - roa_covered_prefix_count: number of originated prefixes covered by a ROA
+        authorizing this AS
+      - roa_coverage: roa_covered_prefix_count / originated_prefix_count
+      - ixp_count: number of IXPs the AS is a member of
+      - ranking_count: number of Rankings the AS appears in
+    BGPPrefix nodes get:
+      - origin_as_count: number of ASes originating the prefix
+    Country nodes get:
+      - as_count: number of ASes related to the country
+
+    The aggregates_reference_name property is set on all modified nodes.
+    """
+    reads = {'AS', 'BGPPrefix', 'Country', 'IXP', 'Ranking', 'RPKIPrefix',
+             'ORIGINATE', 'MEMBER_OF', 'RANK', 'ROUTE_ORIGIN_AUTHORIZATION', 'COUNTRY'}
+    writes = {'AS', 'Prefix', 'Country'}
+
+    def fetch_grouped(self, query: str) -> dict:
+        """Run a query returning (id, values) rows and return them as a dict."""
+        return {row['id']: row['values'] for row in self.iyp.tx.run(query)}
+
+    def fetch_counts(self, query: str) -> dict:
+        """Run a query returning (id, count) rows and return them as a dict."""
+        return {row['id']: row['count'] for row in self.iyp.tx.run(query)}
+
+    @staticmethod
+    def address_space(prefixes: list):
+        """Return the number of IPv4 addresses and IPv6 /48s covered by the given
+        prefixes.
+
+        Overlapping prefixes are only counted once.
+        """
+        networks = {4: list(), 6: list()}
+        for prefix in prefixes:
+            try:
+                network = ip_network(prefix)
+            except ValueError as e:
+                logging.warning(f'Ignoring malformed prefix: "{prefix}": {e}')
+                continue
+            networks[network.version].append(network)
+        ipv4_addresses = sum(n.num_addresses for n in collapse_addresses(networks[4]))
+        ipv6_48s = sum(n.num_addresses >> 80 if n.prefixlen <= 48 else 0
+                       for n in collapse_addresses(networks[6]))
+        return ipv4_addresses, ipv6_48s
+
+    @staticmethod
+    def roa_covered_count(prefixes: list, roas: list) -> int:
+        """Return the number of prefixes covered by at least one of the given (prefix,
+        maxLength) ROAs.
+
+        ROAs are indexed by network, so each prefix is only compared to the ROAs of
+        its covering networks instead of all ROAs of the AS.
+        """
+        # Dict mapping ROA networks to their largest maxLength.
+        roa_index = dict()
+        # Prefix lengths of the ROA networks, per IP version.
+        roa_lengths = {4: set(), 6: set()}
+        for roa_prefix, max_length in roas:
+            try:
+                roa_network = ip_network(roa_prefix)
+                max_length = int(max_length) if max_length else roa_network.prefixlen
+            except ValueError as e:
+                logging.warning(f'Ignoring malformed ROA: "{roa_prefix}" maxLength {max_length}: {e}')
+                continue
+            roa_index[roa_network] = max(roa_index.get(roa_network, max_length), max_length)
+            roa_lengths[roa_network.version].add(roa_network.prefixlen)
+        roa_lengths = {version: sorted(lengths) for version, lengths in roa_lengths.items()}
+
+        covered = 0
+        for prefix in prefixes:
+            try:
+                network = ip_network(prefix)
+            except ValueError:
+                continue
+            for prefixlen in roa_lengths[network.version]:
+                if prefixlen > network.prefixlen:
+                    break
+                supernet = network.supernet(new_prefix=prefixlen) if prefixlen < network.prefixlen else network
+                max_length = roa_index.get(supernet)
+                if max_length is not None and network.prefixlen <= max_length:
+                    covered += 1
+                    break
+        return covered
+
+    def compute_as_aggregates(self) -> dict:
+        """Return a dict mapping AS node ids to their aggregate properties."""
+        logging.info('Fetching originated prefixes.')
+        originated = self.fetch_grouped("""
+            MATCH (a:AS)-[:ORIGINATE]->(p:BGPPrefix)
+            RETURN elementId(a) AS id, collect(DISTINCT p.prefix) AS values
+            """)
+        logging.info('Fetching ROAs.')
+        roas = self.fetch_grouped("""
+            MATCH (a:AS)-[r:ROUTE_ORIGIN_AUTHORIZATION]->(p:RPKIPrefix)
+            RETURN elementId(a) AS id, collect(DISTINCT [p.prefix, r.maxLength]) AS values
+            """)
+        logging.info('Counting IXP memberships.')
+        ixp_counts = self.fetch_counts("""
+            MATCH (a:AS)-[:MEMBER_OF]->(i:IXP)
+            RETURN elementId(a) AS id, count(DISTINCT i) AS count
+            """)
+        logging.info('Counting rankings.')
+        ranking_counts = self.fetch_counts("""
+            MATCH (a:AS)-[:RANK]->(r:Ranking)
+            RETURN elementId(a) AS id, count(DISTINCT r) AS count
+            """)
+
+        aggregates = defaultdict(dict)
+        logging.info(f'Computing address space for {len(originated)} ASes.')
+        for as_qid, prefixes in originated.items():
+            ipv4_addresses, ipv6_48s = self.address_space(prefixes)
+            covered = self.roa_covered_count(prefixes, roas.get(as_qid, list()))
+            aggregates[as_qid].update({
+                'originated_prefix_count': len(prefixes),
+                'originated_ipv4_addresses': ipv4_addresses,
+                'originated_ipv6_48s': ipv6_48s,
+                'roa_covered_prefix_count': covered,
+                'roa_coverage': covered / len(prefixes)
+            })
+        for as_qid, count in ixp_counts.items():
+            aggregates[as_qid]['ixp_count'] = count
+        for as_qid, count in ranking_counts.items():
+            aggregates[as_qid]['ranking_count'] = count
+        return aggregates
+
+    def remove_aggregates(self):
+        """Remove the aggregate properties set by a previous run."""
+        with self.iyp.db.session() as session:
+            for label, properties in AGGREGATE_PROPERTIES.items():
+                remove = ', '.join(f'n.{prop}' for prop in properties + ['aggregates_reference_name'])
+                count = session.run(f"""MATCH (n:{label})
+                                        WHERE n.aggregates_reference_name IS NOT NULL
+                                        CALL (n) {{
+                                            REMOVE {remove}
+                                        }} IN TRANSACTIONS OF {DELETE_BATCH_SIZE} ROWS
+                                        RETURN count(*) AS count""").single()['count']
+                logging.info(f'Removed aggregate properties from {count} {label} nodes.')
+
+    def run(self):
+        """Compute aggregates and push them as node properties."""
+        properties = list()
+
+        for as_qid, props in self.compute_as_aggregates().items():
+            props['aggregates_reference_name'] = self.reference['reference_name']
+            properties.append((as_qid, props))
+
+        logging.info('Counting origin ASes per prefix.')
+        origin_counts = self.fetch_counts("""
+            MATCH (a:AS)-[:ORIGINATE]->(p:BGPPrefix)
+            RETURN elementId(p) AS id, count(DISTINCT a) AS count
+            """)
+        for prefix_qid, count in origin_counts.items():
+            properties.append((prefix_qid, {'origin_as_count': count,
+                                            'aggregates_reference_name': self.reference['reference_name']}))
+
+        logging.info('Counting ASes per country.')
+        as_counts = self.fetch_counts("""
+            MATCH (a:AS)-[:COUNTRY]->(c:Country)
+            RETURN elementId(c) AS id, count(DISTINCT a) AS count
+            """)
+        for country_qid, count in as_counts.items():
+            properties.append((country_qid, {'as_count': count,
+                                             'aggregates_reference_name': self.reference['reference_name']}))
+
+        logging.info(f'Adding aggregate properties to {len(properties)} nodes.')
+        self.iyp.batch_add_properties(properties)
+
+    def unit_test(self):
+        raise NotImplementedError()
+
+    def rerun(self):
+        # Remove all aggregates first, since nodes that no longer qualify for an
+        # aggregate would otherwise keep a stale value.
+        self.iyp.commit()
+        self.remove_aggregates()
+        self.run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--unit-test', action='store_true')
+    parser.add_argument('--rerun', action='store_true')
+    args = parser.parse_args()
+
+    FORMAT = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=FORMAT,
+        filename='log/post.' + NAME + '.log',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    logging.info(f'Started: {sys.argv}')
+
+    post = PostProcess(NAME)
+    if args.unit_test:
+        post.unit_test()
+    if args.rerun:
+        post.rerun()
+        post.close()
+    else:
+        post.run()
+        post.close()
+    logging.info(f'Finished: {sys.argv}')
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -8,6 +8,12 @@ NAME = 'clean_links'
 
 
 class PostProcess(BasePostProcess):
+    reads = {'COUNTRY', 'RESOLVES_TO', 'PART_OF', 'CATEGORIZED'}
+    # Deleting links locks their endpoints, i.e., the nodes linked by the OONI
+    # crawlers.
+    writes = {'COUNTRY', 'RESOLVES_TO', 'PART_OF', 'CATEGORIZED',
+              'AS', 'Country', 'HostName', 'IP', 'Tag', 'URL'}
+
     def get_links_of_type(self, link_type, prop_dict=None):
         """Returns a list of all links of a given type with optional properties,
         including the source and destination nodes.
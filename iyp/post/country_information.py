@@ -10,27 +10,25 @@ NAME = 'country_information'
 
 
 class PostProcess(BasePostProcess):
+    reads = {'Country'}
+    writes = {'Country'}
+
     def run(self):
         """Enrich Country nodes with additional information like alpha-3 codes and
         country names."""
 
         country_id = self.iyp.batch_get_nodes_by_single_prop('Country', 'country_code')
 
+        country_props = dict()
         for country_code in country_id:
             if country_code not in iso3166.countries_by_alpha2:
                 logging.error(f'Country code "{country_code}" is not ISO 3166-1 alpha-2 conform.')
                 continue
             country_info = iso3166.countries_by_alpha2[country_code]
-            new_props = {'name': country_info.apolitical_name,
-                         'alpha3': country_info.alpha3}
-            self.iyp.tx.run("""
-                            MATCH (n:Country)
-                            WHERE elementId(n) = $id
-                            SET n += $props
-                            """,
-                            id=country_id[country_code],
-                            props=new_props)
-        self.iyp.commit()
+            country_props[country_code] = {'name': country_info.apolitical_name,
+                                           'alpha3': country_info.alpha3}
+
+        self.enrich_nodes('Country', 'country_code', country_props)
 
     def unit_test(self):
         raise NotImplementedError()
@@ -10,6 +10,9 @@ NAME = 'ip2prefix'
 
 
 class PostProcess(BasePostProcess):
+    reads = {'Prefix', 'IP'}
+    writes = {'Prefix', 'IP', 'PART_OF'}
+
     @staticmethod
     def __get_network_and_prefixlen(prefix):
         """Split an IP prefix into its network and prefix length.
@@ -110,17 +113,6 @@ class PostProcess(BasePostProcess):
     def unit_test(self):
         raise NotImplementedError()
 
-    def delete(self):
-        logging.info('Deleting existing relationships.')
-        self.iyp.tx.commit()
-        self.iyp.session.run("""
-            MATCH ()-[r:PART_OF {reference_name: 'iyp.ip2prefix'}]->(:Prefix)
-            CALL (r) {
-                DELETE r
-            } IN TRANSACTIONS OF 100000 ROWS
-        """)
-        self.iyp.tx = self.iyp.session.begin_transaction()
-
 
 def main() -> None:
     parser = argparse.ArgumentParser()
@@ -0,0 +1,186 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+STATUS_OK = 'OK'
+MODULE_PREFIX = 'iyp.post.'
+PARALLEL_POST_PROCESSES = 4
+if os.path.exists('config.json'):
+    config = json.load(open('config.json', 'r'))
+    PARALLEL_POST_PROCESSES = config.get('post', dict()).get('parallel_processes', PARALLEL_POST_PROCESSES)
+
+
+def get_full_module_name(name: str) -> str:
+    """Accept both 'ip2prefix' and 'iyp.post.ip2prefix'."""
+    if name.startswith(MODULE_PREFIX):
+        return name
+    return MODULE_PREFIX + name
+
+
+def conflicts(step0, step1) -> bool:
+    """Check if two post-processing steps can not run concurrently.
+
+    Two steps conflict if one of them writes a label or relationship type that the
+    other one reads or writes. Labels and relationship types share one namespace, so
+    steps writing relationships also declare the labels of the linked nodes as
+    written (see BasePostProcess). Steps that do not declare what they read and write
+    conflict with all other steps.
+    """
+    if (step0.reads is None or step0.writes is None
+            or step1.reads is None or step1.writes is None):
+        return True
+    return bool(step0.writes & (step1.reads | step1.writes)
+                or step1.writes & (step0.reads | step0.writes))
+
+
+class PostProcessRunner:
+    """Run post-processing steps concurrently while respecting their dependencies.
+
+    Steps are given as a list of module names. The order of the list defines the
+    order of conflicting steps (see conflicts()), i.e., a step only starts once all
+    conflicting steps listed before it are finished. Each step uses its own IYP
+    instance and thus its own database session.
+    """
+
+    def __init__(self, module_names: list, max_workers: int = PARALLEL_POST_PROCESSES):
+        self.module_names = [get_full_module_name(name) for name in module_names]
+        self.max_workers = max_workers
+        self.timings = dict()
+
+    def select(self, only: list = list(), skip: list = list()) -> list:
+        """Return the list of module names filtered by the only and skip lists."""
+        only = {get_full_module_name(name) for name in only}
+        skip = {get_full_module_name(name) for name in skip}
+        unknown = (only | skip) - set(self.module_names)
+        if unknown:
+            logging.warning(f'Ignoring unknown post-processing steps: {sorted(unknown)}')
+        selected = list()
+        for module_name in self.module_names:
+            if only and module_name not in only:
+                continue
+            if module_name in skip:
+                continue
+            selected.append(module_name)
+        return selected
+
+    @staticmethod
+    def build_dependencies(modules: dict) -> dict:
+        """Return a dict mapping each module name to the set of module names that have
+        to finish before it can start."""
+        dependencies = dict()
+        module_names = list(modules.keys())
+        for idx, module_name in enumerate(module_names):
+            step = modules[module_name].PostProcess
+            dependencies[module_name] = {
+                previous for previous in module_names[:idx]
+                if conflicts(modules[previous].PostProcess, step)
+            }
+        return dependencies
+
+    def run_step(self, module_name: str, module, rerun: bool = False):
+        """Run a single post-processing step and return its status."""
+        post = None
+        name = module_name.replace(MODULE_PREFIX, '')
+        start = time.monotonic()
+        logging.info(f'start {module_name}')
+        try:
+            post = module.PostProcess(name)
+            if rerun:
+                post.rerun()
+            else:
+                post.run()
+            status = STATUS_OK
+        except Exception as e:
+            logging.error(f'Post-processing step {module_name} crashed!')
+            logging.error(e)
+            status = e
+        finally:
+            if post is not None:
+                try:
+                    post.close()
+                except Exception as cleanup_error:
+                    logging.error(f'Failed to close post-processor: {cleanup_error}')
+        self.timings[module_name] = time.monotonic() - start
+        logging.info(f'end {module_name} ({self.timings[module_name]:.1f}s)')
+        return status
+
+    def run(self, only: list = list(), skip: list = list(), rerun: bool = False) -> dict:
+        """Run the selected post-processing steps.
+
+        Return a dict mapping module names to STATUS_OK or the exception raised by the
+        step.
+        """
+        status = dict()
+        modules = dict()
+        for module_name in self.select(only, skip):
+            try:
+                modules[module_name] = importlib.import_module(module_name)
+            except Exception as e:
+                logging.error(f'Failed to import {module_name}: {e}')
+                status[module_name] = e
+
+        dependencies = self.build_dependencies(modules)
+        pending = set(modules.keys())
+        finished = set()
+        running = dict()
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            while pending or running:
+                # Submit steps in configuration order as soon as their dependencies
+                # are done.
+                for module_name in modules:
+                    if module_name in pending and dependencies[module_name] <= finished:
+                        pending.remove(module_name)
+                        future = executor.submit(self.run_step, module_name, modules[module_name], rerun)
+                        running[future] = module_name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    module_name = running.pop(future)
+                    status[module_name] = future.result()
+                    finished.add(module_name)
+
+        timings_str = ', '.join(f'{module_name}: {duration:.1f}s' for module_name, duration in self.timings.items())
+        logging.info(f'Post-processing timings: {timings_str}')
+        return status
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run the post-processing steps configured in config.json.')
+    parser.add_argument('--only', nargs='+', default=list(), help='only run these steps')
+    parser.add_argument('--skip', nargs='+', default=list(), help='do not run these steps')
+    parser.add_argument('--rerun', action='store_true', help='delete existing data of each step before running it')
+    parser.add_argument('-j', '--parallel', type=int, default=PARALLEL_POST_PROCESSES,
+                        help='maximum number of steps running concurrently')
+    args = parser.parse_args()
+
+    FORMAT = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=FORMAT,
+        filename='log/post.runner.log',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    logging.info(f'Started: {sys.argv}')
+
+    with open('config.json', 'r') as fp:
+        conf = json.load(fp)
+
+    runner = PostProcessRunner(conf['iyp']['post'], args.parallel)
+    status = runner.run(args.only, args.skip, args.rerun)
+    errors = {module_name: e for module_name, e in status.items() if e != STATUS_OK}
+    for module_name, e in errors.items():
+        logging.error(f'{module_name}: {e}')
+
+    logging.info(f'Finished: {sys.argv}')
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -1,57 +1,86 @@
 import argparse
 import logging
+import re
 import sys
+from functools import lru_cache
+from multiprocessing import get_context
 
 import tldextract
 
 from iyp import BasePostProcess
 
 NAME = 'url2hostname'
+PARALLEL_EXTRACTORS = 8
+# Number of URLs sent to a worker process at once.
+EXTRACT_CHUNK_SIZE = 10000
+# Leading scheme of a URL. Like tldextract, accept any scheme characters and
+# scheme-relative URLs.
+SCHEME_PATTERN = re.compile(r'^([A-Za-z0-9+.-]+:)?//')
 
 
-class PostProcess(BasePostProcess):
-    def run(self):
-        """Link URLs and their corresponding HostNames."""
+def get_netloc(url: str) -> str:
+    """Return the network location part of a URL, i.e., the URL stripped from
+    surrounding whitespace, its scheme, path, query, and fragment.
 
-        # Get all URL nodes.
-        url_id = self.iyp.batch_get_nodes_by_single_prop('URL', 'url')
+    This is a cheap approximation of the lenient parsing done by tldextract and is only
+    used as a cache key, since many URLs share the same host.
+    """
+    rest = SCHEME_PATTERN.sub('', url.strip(), count=1)
+    for delimiter in '/?#':
+        rest = rest.partition(delimiter)[0]
+    return rest
+
+
+@lru_cache(maxsize=1000000)
+def extract_fqdn(netloc: str) -> str:
+    """Memoized host name extraction."""
+    return tldextract.extract(netloc).fqdn
 
-        # Get all HostName Nodes
-        hostname_id = self.iyp.batch_get_nodes_by_single_prop('HostName', 'name')
 
-        # Compute links
-        links = []
-        for url, url_qid in url_id.items():
-            # Extract host name from URL
-            hostname = tldextract.extract(url).fqdn
+def url_to_fqdn(url: str) -> str:
+    return extract_fqdn(get_netloc(url))
 
-            # Get HostName node for the fqdn of the URL
-            hostname_qid = hostname_id.get(hostname)
 
-            if hostname_qid is not None:
-                links.append({
-                    'src_id': url_qid,
-                    'dst_id': hostname_qid,
-                    'props': [self.reference]
-                })
+class PostProcess(BasePostProcess):
+    reads = {'URL', 'HostName'}
+    writes = {'URL', 'HostName', 'PART_OF'}
+
+    def run(self):
+        """Link URLs and their corresponding HostNames."""
 
-        # push links to IYP
+        # Get all URL nodes.
+        url_id = self.iyp.batch_get_nodes_by_single_prop('URL', 'url')
+        urls = list(url_id.keys())
+
+        # Extract host names from URLs in parallel. Post-processing steps can run in
+        # threads (see iyp.post.runner), so do not fork the process while other threads
+        # may hold locks.
+        logging.info(f'Extracting host names from {len(urls)} URLs.')
+        with get_context('spawn').Pool(processes=PARALLEL_EXTRACTORS) as p:
+            fqdns = p.map(url_to_fqdn, urls, chunksize=EXTRACT_CHUNK_SIZE)
+        url_fqdn = dict(zip(urls, fqdns))
+        del urls, fqdns
+
+        # Only get the HostName nodes referenced by URLs.
+        hostnames = {fqdn for fqdn in url_fqdn.values() if fqdn}
+        hostname_id = self.iyp.batch_get_nodes_by_single_prop('HostName',
+                                                              'name',
+                                                              hostnames,
+                                                              all=False,
+                                                              create=False,
+                                                              batch_size=100000)
+
+        # Compute and push links to IYP.
+        links = ({'src_id': url_id[url],
+                  'dst_id': hostname_id[fqdn],
+                  'props': [self.reference]}
+                 for url, fqdn in url_fqdn.items()
+                 if fqdn in hostname_id)
         self.iyp.batch_add_links('PART_OF', links)
 
     def unit_test(self):
         raise NotImplementedError()
 
-    def delete(self):
-        logging.info('Deleting existing relationships.')
-        self.iyp.tx.commit()
-        self.iyp.session.run("""
-            MATCH (:URL)-[r:PART_OF {reference_name: 'iyp.url2hostname'}]->(:HostName)
-            CALL (r) {
-                DELETE r
-            } IN TRANSACTIONS OF 100000 ROWS
-        """)
-        self.iyp.tx = self.iyp.session.begin_transaction()
-
 
 def main() -> None:
     parser = argparse.ArgumentParser()
@@ -0,0 +1,53 @@
+"""Single-core benchmark of the Alice-LG route flattening.
+
+Usage: python -m tests.crawlers.alice_lg.bench_route_flattener [--repeat N] [FILE ...]
+
+Files are Alice-LG received routes API responses. Without files, the routes of the
+fixture are repeated to obtain a larger input. Routes are JSON-decoded and flattened
+like in the crawler, with flatdict.FlatterDict and with RouteFlattener.
+"""
+import argparse
+import json
+import time
+
+from iyp.crawlers.alice_lg import RouteFlattener
+from tests.crawlers.alice_lg.test_route_flattener import (FIXTURE_DIR,
+                                                          flatter_dict)
+
+
+def read_input(files: list, repeat: int) -> list:
+    if not files:
+        files = [f'{FIXTURE_DIR}/routes_received.json']
+    else:
+        repeat = 1
+    routes = list()
+    for input_file in files:
+        with open(input_file, 'r') as f:
+            routes.extend(json.dumps(route) for route in json.load(f)['imported'])
+    return routes * repeat
+
+
+def benchmark(flatten, routes: list) -> tuple:
+    start = time.process_time()
+    result = [flatten(json.loads(route)) for route in routes]
+    return result, time.process_time() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=500, help='fixture repetitions without files')
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    routes = read_input(args.files, args.repeat)
+    expected, flatter_dict_time = benchmark(flatter_dict, routes)
+    result, flattener_time = benchmark(RouteFlattener().flatten, routes)
+    print(f'Input: {len(routes)} routes')
+    print(f'FlatterDict:    {flatter_dict_time:6.2f} s ({len(routes) / flatter_dict_time / 1e3:6.1f} kroutes/s)')
+    print(f'RouteFlattener: {flattener_time:6.2f} s ({len(routes) / flattener_time / 1e3:6.1f} kroutes/s)')
+    identical = all(list(a.items()) == list(b.items()) for a, b in zip(result, expected))
+    print(f'Speedup: {flatter_dict_time / flattener_time:.1f}x, identical output: {identical}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import json
+import os
+import unittest
+
+import flatdict
+
+from iyp.crawlers.alice_lg import RouteFlattener
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_routes() -> list:
+    """Return the routes of the fixture, JSON-encoded like in the RouteStore."""
+    with open(os.path.join(FIXTURE_DIR, 'routes_received.json'), 'r') as f:
+        routes = json.load(f)['imported']
+    return [json.dumps(route) for route in routes]
+
+
+def flatter_dict(route: dict) -> dict:
+    """Flatten the route with FlatterDict and remove the empty containers, like the
+    crawler did before RouteFlattener."""
+    flattened_route = dict(flatdict.FlatterDict(route))
+    return {k: v for k, v in flattened_route.items() if not isinstance(v, flatdict.FlatterDict)}
+
+
+class TestRouteFlattener(unittest.TestCase):
+    """Golden-output tests comparing RouteFlattener to flatdict.FlatterDict."""
+
+    def test_same_output(self):
+        routes = read_routes()
+        self.assertTrue(routes)
+        # A single flattener is used for all routes, like in the crawler.
+        flattener = RouteFlattener()
+        for encoded_route in routes:
+            expected = flatter_dict(json.loads(encoded_route))
+            result = flattener.flatten(json.loads(encoded_route))
+            self.assertEqual(result, expected)
+            self.assertEqual(list(result), list(expected))
+
+    def test_nested_lists(self):
+        route = {'bgp': {'as_path': [64500, 64501], 'communities': [[64500, 1], [64500, 2]]}}
+        expected = {'bgp:as_path:0': 64500,
+                    'bgp:as_path:1': 64501,
+                    'bgp:communities:0:0': 64500,
+                    'bgp:communities:0:1': 1,
+                    'bgp:communities:1:0': 64500,
+                    'bgp:communities:1:1': 2}
+        self.assertEqual(RouteFlattener().flatten(route), expected)
+
+    def test_empty_containers(self):
+        route = {'type': [], 'details': {}, 'bgp': {'communities': [[]], 'med': None}}
+        self.assertEqual(RouteFlattener().flatten(route), {'bgp:med': None})
+        self.assertEqual(RouteFlattener().flatten(route), flatter_dict(route))
+
+
+if __name__ == '__main__':
+    unittest.main()
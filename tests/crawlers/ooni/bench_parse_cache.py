@@ -0,0 +1,57 @@
+"""Single-core benchmark of the memoized URL and IP parsing of the OONI crawlers.
+
+Usage: python -m tests.crawlers.ooni.bench_parse_cache [--repeat N] [FILE ...]
+
+Files are (gzip-compressed) OONI measurement files, e.g., a day of webconnectivity
+measurements. Without files, the sample fixture is repeated, which overestimates the
+hit rates. The URLs and IPs are parsed like in the crawlers, once with the memoized
+parse_url and parse_ip and once with the undecorated functions. The hit rates are
+reported from cache_info().
+"""
+import argparse
+import logging
+import time
+
+from iyp.crawlers.ooni import parse_ip, parse_url
+from tests.crawlers.ooni.test_parse_cache import (FIXTURE, parse_measurement,
+                                                  read_measurements)
+
+
+def benchmark(measurements: list, url_parser, ip_parser) -> tuple:
+    start = time.process_time()
+    result = [parse_measurement(measurement, url_parser, ip_parser) for measurement in measurements]
+    return result, time.process_time() - start
+
+
+def read_input(files: list, repeat: int) -> list:
+    if files:
+        return read_measurements(files)
+    return read_measurements([FIXTURE]) * repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=50, help='fixture repetitions without files')
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    measurements = read_input(args.files, args.repeat)
+    # The undecorated parse_url still calls the memoized parse_ip for the hostname.
+    expected, uncached_time = benchmark(measurements, parse_url.__wrapped__, parse_ip.__wrapped__)
+    parse_url.cache_clear()
+    parse_ip.cache_clear()
+    result, cached_time = benchmark(measurements, parse_url, parse_ip)
+    print(f'Input: {len(measurements)} measurements')
+    print(f'Uncached: {uncached_time:6.2f} s ({len(measurements) / uncached_time / 1e3:7.1f} kmeasurements/s)')
+    print(f'Memoized: {cached_time:6.2f} s ({len(measurements) / cached_time / 1e3:7.1f} kmeasurements/s)')
+    print(f'Speedup: {uncached_time / cached_time:.1f}x, identical output: {result == expected}')
+    for name, function in [('parse_url', parse_url), ('parse_ip', parse_ip)]:
+        cache_info = function.cache_info()
+        calls = cache_info.hits + cache_info.misses
+        print(f'{name}: {calls} calls, {cache_info.currsize} entries, '
+              f'hit rate {cache_info.hits / calls if calls else 0:.1%}')
+
+
+if __name__ == '__main__':
+    main()
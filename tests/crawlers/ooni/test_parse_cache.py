@@ -0,0 +1,83 @@
+import gzip
+import logging
+import os
+import unittest
+
+import orjson
+
+from iyp.crawlers.ooni import parse_ip, parse_url
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+FIXTURE = os.path.join(FIXTURE_DIR, 'webconnectivity_sample.jsonl.gz')
+
+
+def read_measurements(files: list) -> list:
+    measurements = list()
+    for input_file in files:
+        open_file = gzip.open if input_file.endswith('.gz') else open
+        with open_file(input_file, 'rb') as f:
+            measurements.extend(orjson.loads(line) for line in f)
+    return measurements
+
+
+def parse_measurement(measurement: dict, url_parser, ip_parser) -> list:
+    """Parse the resolver IP, input URL, and DNS answers of a measurement, like
+    OoniCrawler.process_one_line, webconnectivity, and process_dns_queries."""
+    results = [ip_parser(measurement.get('resolver_ip'))]
+    test_keys = measurement.get('test_keys')
+    if not test_keys:
+        return results
+    parsed_url = url_parser(measurement['input'])
+    results.append(parsed_url)
+    if parsed_url is None or parsed_url[1]:
+        return results
+    for query in test_keys.get('queries') or list():
+        if query['query_type'] not in {'A', 'AAAA'} or query['failure']:
+            continue
+        for answer in query['answers']:
+            if answer['answer_type'] == 'A':
+                results.append(ip_parser(answer['ipv4']))
+            elif answer['answer_type'] == 'AAAA':
+                results.append(ip_parser(answer['ipv6']))
+    return results
+
+
+class TestParseCache(unittest.TestCase):
+    """Tests comparing the memoized OONI parsers to the undecorated functions."""
+
+    @classmethod
+    def setUpClass(cls):
+        # The fixture contains a malformed URL on purpose.
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def test_same_output(self):
+        measurements = read_measurements([FIXTURE])
+        self.assertTrue(measurements)
+        parse_url.cache_clear()
+        parse_ip.cache_clear()
+        for measurement in measurements:
+            self.assertEqual(parse_measurement(measurement, parse_url, parse_ip),
+                             parse_measurement(measurement, parse_url.__wrapped__, parse_ip.__wrapped__))
+        self.assertGreater(parse_url.cache_info().hits, 0)
+        self.assertGreater(parse_ip.cache_info().hits, 0)
+
+    def test_parse_url(self):
+        self.assertEqual(parse_url('https://www.site1.co.uk/news/'), ('www.site1.co.uk', False))
+        self.assertEqual(parse_url('http://93.184.216.34/'), ('93.184.216.34', True))
+        self.assertEqual(parse_url('https://[2606:2800:220:1:248:1893:25c8:1946]/'),
+                         ('2606:2800:220:1:248:1893:25c8:1946', True))
+        self.assertIsNone(parse_url('http://[::1/broken'))
+
+    def test_parse_ip(self):
+        self.assertEqual(parse_ip('2001:DB8:0::1'), ('2001:db8::1', False))
+        self.assertEqual(parse_ip('8.8.8.8'), ('8.8.8.8', True))
+        self.assertIsNone(parse_ip('[scrubbed]'))
+        self.assertIsNone(parse_ip(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Single-core benchmark of the OpenINTEL RESOLVES_TO computation.
+
+Usage:
+    python -m tests.crawlers.openintel.bench_compute_resolves_to [--repeat N] [FILE ...]
+
+Files are OpenINTEL forward DNS Parquet files. Without files, the sample fixture is
+repeated with renamed hosts to obtain a larger input. The merge-based CNAME walk of
+compute_resolves_to is compared to the per-row walk it replaced.
+"""
+import argparse
+import logging
+import time
+
+import pandas as pd
+
+from iyp.crawlers.openintel import OpenIntelCrawler
+from tests.crawlers.openintel.test_compute_resolves_to import (FIXTURE,
+                                                               get_inputs,
+                                                               read_records,
+                                                               reference_resolves_to)
+
+NAME_COLUMNS = ['query_name', 'response_name', 'ns_address', 'cname_name']
+
+
+def read_input(files: list, repeat: int) -> pd.DataFrame:
+    if files:
+        return read_records(files)
+    df = read_records([FIXTURE])
+    copies = list()
+    for i in range(repeat):
+        copy = df.copy()
+        for column in NAME_COLUMNS:
+            copy[column] = copy[column].map(lambda x: f'r{i}.{x}' if x is not None else None)
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def benchmark(compute, inputs) -> tuple:
+    start = time.process_time()
+    result = compute(*inputs)
+    return result, time.process_time() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=2000, help='fixture repetitions without files')
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    inputs = get_inputs(read_input(args.files, args.repeat))
+    nb_rows = len(inputs[0])
+    expected, reference_time = benchmark(reference_resolves_to, inputs)
+    result, merge_time = benchmark(OpenIntelCrawler.compute_resolves_to, inputs)
+    print(f'Input: {nb_rows} records, {len(expected)} RESOLVES_TO links')
+    print(f'Per-row walk:        {reference_time:6.2f} s ({nb_rows / reference_time / 1e3:7.1f} krecords/s)')
+    print(f'compute_resolves_to: {merge_time:6.2f} s ({nb_rows / merge_time / 1e3:7.1f} krecords/s)')
+    identical = list(map(str, result.items())) == list(map(str, expected.items()))
+    print(f'Speedup: {reference_time / merge_time:.1f}x, identical output: {identical}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import logging
+import os
+import unittest
+from collections import defaultdict
+from ipaddress import IPv6Address
+
+import pandas as pd
+import pyarrow as pa
+
+from iyp.crawlers.openintel import OpenIntelCrawler
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+FIXTURE = os.path.join(FIXTURE_DIR, 'toplist_sample.parquet')
+
+
+def read_records(paths: list) -> pd.DataFrame:
+    """Read Parquet files and prepare the records like OpenIntelCrawler.run()."""
+    tables = [OpenIntelCrawler.read_parquet_file(path) for path in paths]
+    df = pa.concat_tables(tables, promote_options='default').to_pandas().drop_duplicates()
+    df.query_name = df.query_name.str[:-1]
+    df.response_name = df.response_name.str[:-1]
+    df.ns_address = df.ns_address.astype('string').map(lambda x: x[:-1] if not pd.isna(x) else None)
+    df.cname_name = df.cname_name.astype('string').map(lambda x: x[:-1] if not pd.isna(x) else None)
+    return df
+
+
+def get_inputs(df: pd.DataFrame) -> tuple:
+    """Return the arguments of compute_resolves_to, with made-up element IDs."""
+    cname_df = df[(df.query_type.isin(['A', 'AAAA'])) & (df.response_type == 'CNAME')]
+    host_names = set(df['response_name']) | set(cname_df['query_name']) | set(cname_df['cname_name'].dropna())
+    host_id = {name: f'host:{i}' for i, name in enumerate(sorted(host_names))}
+    ip4_id = {ip: f'ip4:{i}' for i, ip in enumerate(sorted(set(df['ip4_address'].dropna())))}
+    ipv6_map = OpenIntelCrawler.normalize_ipv6_addresses(df['ip6_address'].dropna().unique())
+    ip6_id = {ip: f'ip6:{i}' for i, ip in enumerate(sorted(set(ipv6_map.values())))}
+    return df, cname_df, host_id, ip4_id, ip6_id, ipv6_map
+
+
+def reference_resolves_to(df: pd.DataFrame, cname_df: pd.DataFrame, host_id: dict, ip4_id: dict, ip6_id: dict,
+                          ipv6_map: dict) -> dict:
+    """Per-row CNAME chain walk that compute_resolves_to replaced.
+
+    Only change: the walk stops at CNAME loops instead of running forever.
+    """
+    cnames = defaultdict(dict)
+    for row in cname_df.itertuples():
+        cnames[(row.query_name, row.query_type)][row.cname_name] = row.response_name
+
+    unique_res = defaultdict(lambda: {'source': list()})
+    for row in df[df.response_type.isin(['A', 'AAAA'])].itertuples():
+        if row.response_type == 'A' and row.ip4_address:
+            ip = row.ip4_address
+            ip_qid = ip4_id[ip]
+        elif row.response_type == 'AAAA' and row.ip6_address:
+            ip = row.ip6_address
+            try:
+                ip_qid = ip6_id[IPv6Address(ip).compressed]
+            except ValueError:
+                continue
+        else:
+            continue
+        host_qid = host_id[row.response_name]
+        if row.response_type not in unique_res[(host_qid, ip_qid)]['source']:
+            unique_res[(host_qid, ip_qid)]['source'].append(row.response_type)
+
+        cname = row.response_name
+        visited = {cname}
+        while cname in cnames[(row.query_name, row.query_type)]:
+            up = cnames[(row.query_name, row.query_type)][cname]
+            host_qid = host_id[up]
+            if 'CNAME' not in unique_res[(host_qid, ip_qid)]['source']:
+                unique_res[(host_qid, ip_qid)]['source'].append('CNAME')
+            cname = up
+            if up in visited:
+                break
+            visited.add(up)
+        else:
+            if cname != row.query_name:
+                logging.warning(f'Broken CNAME chain for {row.response_type} record {row.query_name} -> {ip}. '
+                                f'Last CNAME: {cname}')
+    return dict(unique_res)
+
+
+class TestComputeResolvesTo(unittest.TestCase):
+    """Golden-output tests comparing compute_resolves_to to the per-row CNAME chain
+    walk."""
+
+    def setUp(self):
+        with self.assertLogs(level=logging.WARNING):
+            # The fixture contains an invalid IPv6 address on purpose.
+            self.inputs = get_inputs(read_records([FIXTURE]))
+        _, _, self.host_id, self.ip4_id, self.ip6_id, _ = self.inputs
+        with self.assertLogs(level=logging.WARNING) as expected_logs:
+            self.expected = reference_resolves_to(*self.inputs)
+        with self.assertLogs(level=logging.WARNING) as result_logs:
+            self.result = OpenIntelCrawler.compute_resolves_to(*self.inputs)
+        self.expected_logs = expected_logs.output
+        self.result_logs = result_logs.output
+
+    def sources(self, host: str, ip_qid: str):
+        return self.result.get((self.host_id[host], ip_qid), dict()).get('source')
+
+    def test_same_output(self):
+        self.assertTrue(self.expected)
+        self.assertEqual(self.result, self.expected)
+        # Order of the source lists is part of the output.
+        self.assertEqual(list(map(str, self.result.items())), list(map(str, self.expected.items())))
+
+    def test_same_broken_chains(self):
+        broken = [line for line in self.result_logs if 'Broken CNAME chain' in line]
+        self.assertEqual(broken, self.expected_logs)
+        self.assertEqual(broken, [
+            'WARNING:root:Broken CNAME chain for A record broken.org -> 192.0.2.3. Last CNAME: y.broken.org',
+            'WARNING:root:Broken CNAME chain for AAAA record mid.org -> 2001:DB8::4. Last CNAME: m1.mid.org',
+            'WARNING:root:Broken CNAME chain for A record branch.org -> 192.0.2.6. Last CNAME: other.branch.org',
+        ])
+
+    def test_chain(self):
+        ip_qid = self.ip4_id['192.0.2.1']
+        self.assertEqual(self.sources('b.example.org', ip_qid), ['A'])
+        self.assertEqual(self.sources('a.example.org', ip_qid), ['CNAME'])
+        self.assertEqual(self.sources('example.org', ip_qid), ['CNAME'])
+        ip_qid = self.ip6_id['2001:db8::1']
+        self.assertEqual(self.sources('example.org', ip_qid), ['CNAME'])
+
+    def test_cname_loop(self):
+        self.assertIn('WARNING:root:CNAME loop for A record loop.org -> 192.0.2.5.', self.result_logs)
+        ip_qid = self.ip4_id['192.0.2.5']
+        self.assertEqual(self.sources('l2.loop.org', ip_qid), ['A', 'CNAME'])
+        self.assertEqual(self.sources('l1.loop.org', ip_qid), ['CNAME'])
+        ip_qid = self.ip6_id['2001:db8::5']
+        self.assertEqual(self.sources('self.org', ip_qid), ['AAAA', 'CNAME'])
+
+    def test_branching_chain(self):
+        # For the same query and CNAME, the last entry wins.
+        ip_qid = self.ip4_id['192.0.2.6']
+        self.assertEqual(self.sources('other.branch.org', ip_qid), ['CNAME'])
+        self.assertIsNone(self.sources('branch.org', ip_qid))
+
+    def test_invalid_ipv6(self):
+        self.assertNotIn('invalid.org', {host for host, _ in self.result})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Single-core throughput benchmark of the PCH 'show ip bgp' parsers.
+
+Usage: python -m tests.crawlers.pch.bench_show_bgp_parser [-4|-6] [FILE ...]
+
+Files can be plain or gzip-compressed PCH snapshots. Without files, the recorded
+fixture is repeated to obtain a larger input. Throughput is measured on the
+decompressed input in MB/s and the outputs of both parsers are compared.
+"""
+import argparse
+import gzip
+import logging
+import os
+import time
+
+from iyp.crawlers.pch.show_bgp_parser import BytesShowBGPParser, ShowBGPParser
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_input(af: int, files: list, repeat: int) -> bytes:
+    if not files:
+        with open(os.path.join(FIXTURE_DIR, f'show_ip_bgp_v{af}.txt'), 'rb') as f:
+            header, routes = f.read().split(b'Network', maxsplit=1)
+        # Repeat the route lines, but keep the header once.
+        header_line, routes = routes.split(b'\n', maxsplit=1)
+        routes = routes.rstrip(b'\n').split(b'\n\n')[0] + b'\n'
+        return header + b'Network' + header_line + b'\n' + routes * repeat
+    data = list()
+    for input_file in files:
+        open_file = gzip.open if input_file.endswith('.gz') else open
+        with open_file(input_file, 'rb') as f:
+            data.append(f.read())
+    return b''.join(data)
+
+
+def benchmark(parse, data) -> tuple:
+    start = time.process_time()
+    result = parse(data)
+    return result, time.process_time() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-6', dest='af', action='store_const', const=6, default=4, help='parse IPv6 input')
+    parser.add_argument('--repeat', type=int, default=5000, help='fixture repetitions without files')
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    data = read_input(args.af, args.files, args.repeat)
+    size_mb = len(data) / 1e6
+    expected, reference_time = benchmark(ShowBGPParser(args.af).parse, data.decode())
+    result, bytes_time = benchmark(BytesShowBGPParser(args.af).parse, data)
+    print(f'Input: {size_mb:.1f} MB, IPv{args.af}')
+    print(f'ShowBGPParser:      {size_mb / reference_time:6.1f} MB/s per core')
+    print(f'BytesShowBGPParser: {size_mb / bytes_time:6.1f} MB/s per core')
+    print(f'Speedup: {reference_time / bytes_time:.1f}x, identical output: {dict(result) == dict(expected)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import logging
+import os
+import unittest
+
+from iyp.crawlers.pch.show_bgp_parser import BytesShowBGPParser, ShowBGPParser
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_fixture(af: int) -> bytes:
+    with open(os.path.join(FIXTURE_DIR, f'show_ip_bgp_v{af}.txt'), 'rb') as f:
+        return f.read()
+
+
+class TestBytesShowBGPParser(unittest.TestCase):
+    """Golden-output tests comparing BytesShowBGPParser to the reference
+    ShowBGPParser."""
+
+    @classmethod
+    def setUpClass(cls):
+        # The fixtures contain invalid routes on purpose.
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def assert_same_output(self, af: int) -> dict:
+        data = read_fixture(af)
+        expected = ShowBGPParser(af).parse(data.decode())
+        result = BytesShowBGPParser(af).parse(data)
+        self.assertTrue(expected)
+        self.assertEqual(dict(result), dict(expected))
+        return result
+
+    def test_ipv4(self):
+        self.assert_same_output(4)
+
+    def test_ipv6(self):
+        self.assert_same_output(6)
+
+    def test_ipv4_edge_cases(self):
+        result = self.assert_same_output(4)
+        # Multiple routes with the same origin.
+        self.assertEqual(result['1.0.0.0/24'], {13335})
+        # Prefix length inferred from classful address.
+        self.assertEqual(result['12.0.0.0/8'], {7018})
+        # Origin wrapped in curly brackets.
+        self.assertEqual(result['5.0.0.0/8'], {65000})
+        # AS set origin, no valid status code, invalid metric, empty AS path.
+        for prefix in ('2.0.0.0/16', '3.0.0.0/8', '4.0.0.0/8', '6.0.0.0/8', '7.0.0.0/8'):
+            self.assertNotIn(prefix, result)
+
+    def test_empty_input(self):
+        self.assertEqual(dict(BytesShowBGPParser(4).parse(b'')), dict(ShowBGPParser(4).parse('')))
+
+
+if __name__ == '__main__':
+    unittest.main()